@@ -0,0 +1,144 @@
+import asyncio
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+import QueryCostGuard
+
+
+class QueryQueueFull(Exception):
+    """Too many queries are waiting for the connection string; the caller should back off"""
+
+
+class QuerySlots:
+    """Concurrency limit for one connection string, shared by every event loop and thread.
+
+    Waiting is an awaitable future rather than a blocked thread; at most max_waiting
+    queries may wait, further ones get QueryQueueFull (backpressure).
+    """
+
+    def __init__(self, limit: int, max_waiting: int):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self._lock = threading.Lock()
+        self._available = limit
+        self._waiters = deque()
+        # Threads only ever run admitted queries, so the pool never holds more than `limit` busy threads
+        self.threads = ThreadPoolExecutor(max_workers=limit, thread_name_prefix="query")
+
+    async def acquire(self, timeout: float = None):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._available > 0 and not self._waiters:
+                self._available -= 1
+                return
+            if self.max_waiting and len(self._waiters) >= self.max_waiting:
+                raise QueryQueueFull(f"{len(self._waiters)} queries already waiting for a connection slot")
+            waiter = loop.create_future()
+            self._waiters.append((loop, waiter))
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except BaseException:
+            with self._lock:
+                if (loop, waiter) in self._waiters:
+                    self._waiters.remove((loop, waiter))
+                    granted = False
+                else:
+                    granted = True
+            if granted and waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up; pass it on
+                self.release()
+            else:
+                # If release() already picked this waiter, _grant passes the slot on
+                waiter.cancel()
+            raise
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self._available += 1
+                return
+            loop, waiter = self._waiters.popleft()
+        loop.call_soon_threadsafe(self._grant, waiter)
+
+    def _grant(self, waiter: asyncio.Future):
+        if waiter.done():
+            # Cancelled between release() and now
+            self.release()
+        else:
+            waiter.set_result(None)
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {"limit": self.limit, "running": self.limit - self._available, "waiting": len(self._waiters)}
+
+
+class AsyncQueryExecutor:
+    """Awaitable execute_query / get_summary for one DatabaseConnectionManager.
+
+    Queries run on a bounded thread pool shared per connection string, so many sessions
+    can have queries in flight without a thread each. If the awaiting task is cancelled
+    (e.g. the session went away) the query is cancelled on the server through its
+    CancellationToken. Limits default to ASYNC_QUERY_CONCURRENCY (else the pool size) and
+    ASYNC_QUERY_MAX_WAITING (0 = unbounded).
+    """
+
+    _slots: Dict[str, QuerySlots] = {}
+    _slots_lock = threading.Lock()
+
+    def __init__(self, manager, max_concurrency: int = None, max_waiting: int = None,
+                 queue_timeout: float = None):
+        self.manager = manager
+        max_concurrency = max_concurrency or int(os.getenv("ASYNC_QUERY_CONCURRENCY", "0")) or manager.pool.max_size
+        max_waiting = int(os.getenv("ASYNC_QUERY_MAX_WAITING", "0")) if max_waiting is None else max_waiting
+        # Seconds a query may wait for a slot before QueryQueueFull; None waits as long as it takes
+        self.queue_timeout = queue_timeout
+        self.slots = self.slots_for(manager.connection_string, max_concurrency, max_waiting)
+
+    @classmethod
+    def slots_for(cls, connection_string: str, max_concurrency: int, max_waiting: int) -> QuerySlots:
+        """The first executor for a connection string sets its limits"""
+        with cls._slots_lock:
+            if connection_string not in cls._slots:
+                cls._slots[connection_string] = QuerySlots(max_concurrency, max_waiting)
+            return cls._slots[connection_string]
+
+    async def execute_query(self, query: str, max_rows: int = None, max_bytes: int = None,
+                            cancel_token: QueryCostGuard.CancellationToken = None, timeout_seconds: int = None):
+        return await self.run(lambda token: self.manager.execute_query(query, max_rows, max_bytes, token,
+                                                                       timeout_seconds), cancel_token)
+
+    async def get_summary(self, query: str, top_k: int = 5, cancel_token: QueryCostGuard.CancellationToken = None,
+                          timeout_seconds: int = None):
+        return await self.run(lambda token: self.manager.get_summary(query, top_k, token, timeout_seconds),
+                              cancel_token)
+
+    async def run(self, call: Callable, cancel_token: QueryCostGuard.CancellationToken = None):
+        """Run call(token) on the query threads once a slot is free; token is cancelled with the task
+        or with cancel_token (e.g. a token for the whole session)"""
+        try:
+            await self.slots.acquire(self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise QueryQueueFull(f"No connection slot within {self.queue_timeout:g}s")
+
+        token = QueryCostGuard.CancellationToken()
+        unregister: Optional[Callable] = cancel_token.register(token.cancel) if cancel_token is not None else None
+        try:
+            future = self.slots.threads.submit(call, token)
+        except BaseException:
+            self.slots.release()
+            raise
+        # The slot is held until the thread is done, even if the awaiting task is cancelled first
+        future.add_done_callback(lambda _: self.slots.release())
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            token.cancel()
+            raise
+        finally:
+            if unregister is not None:
+                unregister()
+
+    def metrics(self) -> Dict:
+        return self.slots.metrics()
@@ -0,0 +1,172 @@
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, List
+import dotenv
+import pandas as pd
+import BusinessInsightsGenerator
+import StreamingStats
+
+
+class BatchRunner:
+    """Headless runner for report packs: questions from a JSONL file, results as Parquet.
+
+    LLM stages (validation, SQL generation, narrative) and database execution are gated by
+    separate semaphores, so the LLM rate limit and the database load can be tuned independently.
+    """
+
+    STAGES = ("validation", "generation", "execution", "narrative")
+
+    def __init__(self, generator: BusinessInsightsGenerator.BusinessInsightsGenerator,
+                 llm_concurrency: int = 4, db_concurrency: int = 2):
+        self.generator = generator
+        self.llm_concurrency = llm_concurrency
+        self.db_concurrency = db_concurrency
+        self._llm_slots = threading.Semaphore(llm_concurrency)
+        self._db_slots = threading.Semaphore(db_concurrency)
+        self._timings: Dict[str, List[float]] = defaultdict(list)
+        self._timings_lock = threading.Lock()
+        self.wall_seconds = 0.0
+
+    @staticmethod
+    def read_questions(path: str) -> List[Dict]:
+        """One JSON object per line with a "question" and an optional "id" """
+        questions = []
+        with open(path, "r", encoding="utf-8") as questions_file:
+            for line_number, line in enumerate(questions_file, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                item = json.loads(line)
+                questions.append({"id": str(item.get("id", line_number)), "question": item["question"]})
+        return questions
+
+    @staticmethod
+    def result_file_names(questions: List[Dict]) -> List[str]:
+        """Row index plus a slug of the id, so ids like '../x' or 'a/b' stay inside results/.
+        Raises ValueError for duplicate ids, whose results could not be told apart."""
+        counts = defaultdict(int)
+        for item in questions:
+            counts[item["id"]] += 1
+        duplicates = sorted(question_id for question_id, count in counts.items() if count > 1)
+        if duplicates:
+            raise ValueError(f"Duplicate question ids: {', '.join(duplicates)}")
+        return [f"{index:05d}_{re.sub(r'[^A-Za-z0-9_-]+', '-', item['id']).strip('-')[:60]}.parquet"
+                for index, item in enumerate(questions, start=1)]
+
+    def run(self, questions: List[Dict], output_dir: str) -> pd.DataFrame:
+        file_names = self.result_file_names(questions)
+        results_dir = os.path.join(output_dir, "results")
+        os.makedirs(results_dir, exist_ok=True)
+        # report() describes the last run only
+        with self._timings_lock:
+            self._timings = defaultdict(list)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.llm_concurrency + self.db_concurrency,
+                                thread_name_prefix="batch") as pool:
+            records = list(pool.map(lambda item, file_name: self._run_one(item, results_dir, file_name),
+                                    questions, file_names))
+        self.wall_seconds = time.perf_counter() - started
+
+        summary = pd.DataFrame.from_records(records)
+        summary.to_parquet(os.path.join(output_dir, "questions.parquet"), index=False)
+        return summary
+
+    def report(self) -> str:
+        """Per-stage count, throughput and latency percentiles of the last run"""
+        lines = [f"{'stage':<12}{'count':>7}{'per_sec':>10}{'p50_ms':>10}{'p90_ms':>10}{'p99_ms':>10}{'max_ms':>10}"]
+        for stage in self.STAGES:
+            durations = sorted(self._timings.get(stage, []))
+            if not durations:
+                continue
+            percentile = lambda q: durations[min(len(durations) - 1, int(q * len(durations)))] * 1000
+            lines.append(f"{stage:<12}{len(durations):>7}{len(durations) / self.wall_seconds:>10.2f}"
+                         f"{percentile(0.5):>10.0f}{percentile(0.9):>10.0f}{percentile(0.99):>10.0f}"
+                         f"{durations[-1] * 1000:>10.0f}")
+        lines.append(f"wall time {self.wall_seconds:.1f}s")
+        return "\n".join(lines)
+
+    @contextmanager
+    def _stage(self, name: str, slots: threading.Semaphore):
+        with slots:
+            started = time.perf_counter()
+            try:
+                yield
+            finally:
+                with self._timings_lock:
+                    self._timings[name].append(time.perf_counter() - started)
+
+    def _run_one(self, item: Dict, results_dir: str, file_name: str) -> Dict:
+        record = {"id": item["id"], "question": item["question"], "is_related": None, "reasoning": None,
+                  "sql_query": None, "rows": None, "truncated": None, "narrative": None,
+                  "result_file": None, "status": "ok", "error": None}
+        try:
+            with self._stage("validation", self._llm_slots):
+                is_related, reasoning, _ = self.generator.validate_query_context(item["question"])
+            record.update(is_related=bool(is_related), reasoning=reasoning)
+            if not is_related:
+                record["status"] = "rejected"
+                return record
+
+            with self._stage("generation", self._llm_slots):
+                sql_query = self.generator.generate_sql_query(item["question"])
+            record["sql_query"] = sql_query
+            if sql_query is None:
+                record["status"] = "generation_failed"
+                return record
+
+            with self._stage("execution", self._db_slots):
+                df = self.generator.db_connection_manager.execute_query(sql_query)
+            if df is None:
+                record["status"] = "execution_failed"
+                return record
+            record.update(rows=len(df), truncated=df.attrs.get("truncated", False))
+            record["result_file"] = self._write_result(df, results_dir, file_name)
+
+            with self._stage("narrative", self._llm_slots):
+                record["narrative"] = self.generator._generate_narrative_insights(df, item["question"])
+        except Exception as ex:
+            record.update(status="error", error=str(ex))
+        return record
+
+    @staticmethod
+    def _write_result(df: pd.DataFrame, results_dir: str, file_name: str) -> str:
+        df = df.copy(deep=False)
+        # Parquet needs unique, non-empty string column names
+        df.columns = StreamingStats.unique_column_names(df.columns)
+        df.attrs = {}
+        path = os.path.join(results_dir, file_name)
+        try:
+            df.to_parquet(path, index=False)
+        except Exception:
+            # Mixed-type object columns cannot be typed by Arrow, keep them as text
+            df.astype(str).to_parquet(path, index=False)
+        return os.path.join("results", file_name)
+
+
+def main():
+    dotenv.load_dotenv()
+    parser = argparse.ArgumentParser(description="Run a pack of business questions without the UI")
+    parser.add_argument("questions", help="JSONL file, one {\"id\": ..., \"question\": ...} per line")
+    parser.add_argument("output_dir", help="Directory for questions.parquet and results/*.parquet")
+    parser.add_argument("--llm-concurrency", type=int, default=4)
+    parser.add_argument("--db-concurrency", type=int, default=2)
+    args = parser.parse_args()
+
+    generator = BusinessInsightsGenerator.BusinessInsightsGenerator(
+        connection_string=os.getenv("CONNECTION_STRING"), api_key=os.getenv("API_KEY"),
+        pool_size=args.db_concurrency)
+    runner = BatchRunner(generator, llm_concurrency=args.llm_concurrency, db_concurrency=args.db_concurrency)
+    summary = runner.run(runner.read_questions(args.questions), args.output_dir)
+    print(summary["status"].value_counts().to_string())
+    print(runner.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -4,88 +4,138 @@ from langchain.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.pydantic_v1 import BaseModel, Field
 import json
 import pandas as pd
-from typing import Dict, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterator, Optional, Tuple
+import os
+import queue
 import re
+import threading
+import time
+import Instrumentation
+import IntentMatcher
+import KeywordClassifier
 import PromptManager
+import QueryCostGuard
+import QuestionCache
+import ResilientLLM
+import SchemaRetriever
+import SqlValidator
 
 class BusinessInsightsGenerator:
-    def __init__(self, connection_string: str, api_key: str):
+    # Bump when SchemaRetriever, IntentMatcher, KeywordClassifier or SqlValidator change shape,
+    # so indexes pickled by an older version are rebuilt
+    INDEX_FORMAT = 1
+
+    def __init__(self, connection_string: str, api_key: str, sql_cache_path: str = None, pipeline_workers: int = 8,
+                 pool_size: int = 5, llm=None, db_connection_manager=None,
+                 instrumentation: Instrumentation.Instrumentation = None, fallback_llms: list = None):
         self.connection_string = connection_string
+        # Spans for every stage go to the sinks of this instrumentation (see Instrumentation.py)
+        self.instrumentation = instrumentation or Instrumentation.default_instrumentation
         
-        self.llm = ChatGroq(api_key=api_key, model="llama-3.1-8b-instant", temperature=0.1)
-        # self.llm = ChatGroq(api_key=api_key, model="deepseek-r1-distill-llama-70b", temperature=0.1)
-        # self.llm = ChatGroq(api_key=api_key, model="mixtral-8x7b-32768", temperature=0.1)
-        self.db_connection_manager = DatabaseConnectionManager.DatabaseConnectionManager(self.connection_string)
-        self.schema_details = self.db_connection_manager.get_schema_info()
+        # llm / db_connection_manager can be injected, e.g. the stand-ins used by the benchmarks
+        self.llm = llm or ChatGroq(api_key=api_key, model="llama-3.1-8b-instant", temperature=0.1)
+        # Retried and hedged against when the primary model fails or is slow; LLM_FALLBACK_MODELS is comma separated
+        if fallback_llms is None:
+            fallback_models = ([] if llm is not None else
+                               os.getenv("LLM_FALLBACK_MODELS", "deepseek-r1-distill-llama-70b,mixtral-8x7b-32768")
+                               .split(","))
+            fallback_llms = [ChatGroq(api_key=api_key, model=model.strip(), temperature=0.1)
+                             for model in fallback_models if model.strip()]
+        # Every LLM call goes through here: per-stage deadlines, retries with backoff, hedging
+        self.llm_caller = ResilientLLM.ResilientLLM([self.llm] + list(fallback_llms),
+                                                    instrumentation=self.instrumentation)
+        self.db_connection_manager = db_connection_manager or DatabaseConnectionManager.DatabaseConnectionManager(
+            self.connection_string, pool_size=pool_size, instrumentation=self.instrumentation)
+        # Business terms for the keyword pre-check, e.g. {"clients": "Customers"}
+        self.synonyms = KeywordClassifier.load_synonyms(os.getenv("BUSINESS_SYNONYMS_PATH"))
+        self._schema_lock = threading.Lock()
+        self._load_schema()
         self.prompt_manager = PromptManager.PromptManager()
-        self.question:str
-        # print(self.schema_details)
+        # Generated SQL per normalized question; SQL_CACHE_PATH keeps it on disk across restarts
+        self.sql_cache = QuestionCache.QuestionCache(path=sql_cache_path or os.getenv("SQL_CACHE_PATH"))
+        # run_pipeline narrates server-side statistics instead of fetched rows above these plan estimates
+        max_rows = self.db_connection_manager.max_rows
+        self.summary_min_estimated_rows = float(os.getenv("SUMMARY_MIN_ESTIMATED_ROWS", str(max_rows or 100000)))
+        self.summary_min_estimated_cost = float(os.getenv("SUMMARY_MIN_ESTIMATED_COST", "50"))
+        # Runs speculative SQL generation and background narratives for run_pipeline
+        self.executor = ThreadPoolExecutor(max_workers=pipeline_workers, thread_name_prefix="insights")
 
-    def _get_query_generation_prompt(self):
-        return PromptTemplate(
-            input_variables=["schema","question"],
-            template="""
-                Given the following MS SQL Server database schema:
-                {schema}
-
-                Generate a SQL query to answer this question:
-                "{question}"
-                
-                Important - Don't use unnecessary JOIN, if not needed
-                Important - output should only contain the SQL query, it should not contain explaination and what you think or understand part.
-         
-                Requirements:
-                0. Important - generated sql query should contain relationship column names in the "SELECT " sections of query which is provided in the database shema relationships section.
-                1. Use only the tables and columns that exist in the schema
-                2. Use appropriate JOINs based on the relationships provided
-                3. Include relevant aggregations and groupings
-                4. Apply appropriate date filters if time-based analysis is needed
-                5. Optimize the query for performance
-                6. Think to use LEFT JOINs in the SQL query where its important to include the data (not neccessarily).
-                7. Think to apply LIKE caluse where need in the result filteration (not neccessarily) Don't apply where exact keyword is provided.
-                8. provide an appropriate alias name to the column, that should be precise and should not contain any puntuation marks like ('_','-') etc., you can use Pascal case
-                9. If you are using the aggregate operation in the SQL query, it should include the Column name in output sql query.
-                10. Apply proper formating to the generated SQL Query
-                11. Instead of LIMIT use TOP in the SQL Query
-
-                Note : SQL query should only contains required columns only.
-                Important to note - Provide only SQL Query do not add any explanations 
-                Important - Generated SQL query should not contain reference column names in the "SELECT" part of the query, it should not be the part of the output of the result.
-                Important - If you are using the aggregate operation in the SQL query, it should include the Column name against which aggregate operation has been done in output sql query.
-                Important - Don't use unnecessary JOIN, if not needed
-
-                Output: Only the SQL query, without explanations or additional text.
-            """
-        )
+    def refresh_schema(self, use_snapshot: bool = True):
+        """Reload the schema, e.g. after DDL changes; safe while other sessions use this instance.
+
+        Cached SQL for the old schema is dropped automatically because the schema version changes.
+        """
+        self._load_schema(use_snapshot)
+        self.db_connection_manager.result_cache.clear()
+
+    def _load_schema(self, use_snapshot: bool = True):
+        with self._schema_lock:
+            schema_details = self.db_connection_manager.get_schema_info(use_snapshot)
+            table_count = len(schema_details["tables"]) if schema_details else 0
+            with self.instrumentation.span("schema_index", tables=table_count) as span:
+                schema_cache = self.db_connection_manager.schema_cache
+                index_key = schema_cache.key_for(self.connection_string, "insights_indexes")
+                # Same schema, synonyms and index code as the stored indexes; else they are rebuilt
+                index_version = (f"{self.INDEX_FORMAT}|{self.db_connection_manager.schema_version}|"
+                                 f"{json.dumps(self.synonyms, sort_keys=True)}")
+                indexes = (schema_cache.load_indexes(index_key, index_version)
+                           if use_snapshot and schema_details else None)
+                span.set(cache_hit=indexes is not None)
+                if indexes is None:
+                    indexes = self._build_indexes(schema_details)
+                    if schema_details:
+                        schema_cache.save_indexes(index_key, index_version, indexes)
+                schema_retriever, intent_matcher, keyword_classifier, sql_validator = indexes
+            # Swap them together so concurrent questions never see a half-built schema
+            (self.schema_details, self.schema_retriever, self.intent_matcher, self.keyword_classifier,
+             self.sql_validator) = (schema_details, schema_retriever, intent_matcher, keyword_classifier,
+                                    sql_validator)
+
+    def _build_indexes(self, schema_details: dict) -> tuple:
+        fk_graph = self.db_connection_manager.fk_graph
+        # Picks the tables relevant to each question so prompts don't grow with the catalog
+        schema_retriever = SchemaRetriever.SchemaRetriever(schema_details, fk_graph=fk_graph)
+        # Answers "how many X" / "top N X by Y" / "total Y per X" without the LLM
+        intent_matcher = IntentMatcher.IntentMatcher(schema_details, fk_graph=fk_graph)
+        # Accepts / rejects the clear-cut questions before the LLM validator
+        keyword_classifier = KeywordClassifier.KeywordClassifier(schema_details, self.synonyms)
+        # Parses generated SQL and checks every table and column before the database sees it
+        sql_validator = SqlValidator.SqlValidator(schema_details)
+        return schema_retriever, intent_matcher, keyword_classifier, sql_validator
 
     def generate_sql_query(self, question:str) -> str:
-        self.question = question
-        prompt = self._get_query_generation_prompt()
-
-        # create chain
-        query_chain = (
-            {"schema": RunnablePassthrough(), "question": RunnablePassthrough()}
-            | prompt
-            | self.llm
-            | StrOutputParser()
-        )
+        intent = self.match_intent(question)
+        if intent is not None:
+            # Template SQL is checked like generated SQL; the cost guard applies when it runs
+            try:
+                return self._validate_and_clean_query(intent.sql)
+            except SqlValidator.SqlValidationError as ex:
+                self.instrumentation.debug("Intent %s SQL rejected, asking the LLM: %s", intent.intent, ex)
+        schema_version = self.db_connection_manager.schema_version
+        cached_query = self.sql_cache.get(question, schema_version)
+        if cached_query is not None:
+            with self.instrumentation.span("sql_generation", cache_hit=True):
+                return cached_query
+
         try:
-            schema_json = json.dumps(self.schema_details, indent=2)
-            # print(schema_json)
-            sql_query = query_chain.invoke({
-                "schema": schema_json,
-                "question": question
-            })
-            validated_sql_query = self._validate_and_clean_query(sql_query)
-            # print("Generated SQL Query:")
-            # print(sql_query)
-            # print("cleanded returned SQL Query:")
-            # print(validated_sql_query)
-
-            # print("++++++++ Result +++++")
+            with self.instrumentation.span("sql_generation", cache_hit=False) as span:
+                # The schema JSON is rendered once per schema version and table set, only the question changes
+                sections = self.prompt_manager.schema_sections(self.schema_retriever.relevant_schema(question),
+                                                               schema_version)
+                prompt = self.prompt_manager.get_prompt("sql_query_generation_prompt",
+                                                        schema=sections["schema"], question=question)
+                # SQL that fails validation counts as a failed attempt and is asked for again
+                validated_sql_query = self.llm_caller.invoke(
+                    "sql_generation", lambda llm: llm | StrOutputParser(), prompt,
+                    config={"callbacks": [TokenUsageCallback(span)]}, validate=self._validate_and_clean_query)
+            self.sql_cache.put(question, schema_version, validated_sql_query)
+            self.instrumentation.debug("Generated SQL query: %s", validated_sql_query)
             return validated_sql_query
 
             # result,narrative =self.get_result(validated_sql_query)
@@ -93,134 +143,349 @@ class BusinessInsightsGenerator:
             print(f"Query generation failed: {str(ex)}")
     
     def _validate_and_clean_query(self, query: str) -> str:
-        cleanedQuery = self.remove_think_tags(query)
-        query = cleanedQuery.replace('```sql', '').replace('```', '').replace(";",'').replace("\\",'').strip()        
-        
-        referenced_tables = set()
-        for table in self.schema_details["tables"].keys():
-            if table.lower() in query.lower():
-                referenced_tables.add(table)
-        
-        if not referenced_tables:
-            raise ValueError("Generated query does not reference any valid tables")
-        
-        return query
+        """Raises SqlValidator.SqlValidationError for writes, several statements or unknown tables/columns"""
+        return self.sql_validator.validate(query).sql
     
     def remove_think_tags(self, text: str) -> str:
         # Use regular expression to remove content between <think> and </think>
         return re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
     
-    def get_result(self, query: str) -> Tuple[pd.DataFrame, str]:
+    def run_pipeline(self, question: str, summary_only: Optional[bool] = None,
+                     cancel_token: QueryCostGuard.CancellationToken = None) -> "PipelineResult":
+        """Validate, generate, execute and narrate a question with the LLM calls overlapped.
+
+        Questions the intent matcher or keyword classifier decide locally skip the LLM
+        validator; for the ambiguous rest SQL generation starts speculatively alongside
+        validation and is discarded if the question is rejected. The result is returned as soon as the query has run; the
+        narrative keeps generating in the background (see PipelineResult.narrative and
+        PipelineResult.narrative_tokens). With summary_only the statistics are computed on
+        the server and no rows are fetched; PipelineResult.result stays None. By default
+        that only happens for queries whose estimated rows or cost are above
+        SUMMARY_MIN_ESTIMATED_ROWS / SUMMARY_MIN_ESTIMATED_COST. Cancelling
+        cancel_token stops the database query, e.g. when the session that asked goes away.
+        """
+        local_validation, classification = self._validate_locally(question)
+        if local_validation is not None:
+            # Decided without the LLM, so there is nothing to overlap and nothing to speculate on
+            is_related, reasoning, reframed_question = local_validation
+            if not is_related:
+                return PipelineResult(question, False, reasoning, reframed_question)
+            sql_query = self.generate_sql_query(question)
+        else:
+            validation = self.executor.submit(self._validate_with_llm, question, classification)
+            generation = self.executor.submit(self.generate_sql_query, question)
+
+            is_related, reasoning, reframed_question = validation.result()
+            if not is_related:
+                generation.cancel()
+                return PipelineResult(question, False, reasoning, reframed_question)
+
+            sql_query = generation.result()
+        if sql_query is None:
+            return PipelineResult(question, True, reasoning, reframed_question)
+
+        df = None
+        summary = None
+        if summary_only is None:
+            summary_only = self._prefers_summary(sql_query)
+        if summary_only:
+            summary = self.db_connection_manager.get_summary(sql_query, cancel_token=cancel_token)
+        else:
+            df = self.db_connection_manager.execute_query(sql_query, cancel_token=cancel_token)
+        narrative_future = None
+        narrative_stream = None
+        if df is not None or summary is not None:
+            narrative_stream = NarrativeStream()
+            narrative_future = self.executor.submit(
+                narrative_stream.produce, self.stream_narrative_insights(df, question, summary))
+        return PipelineResult(question, True, reasoning, reframed_question, sql_query, df,
+                              narrative_future, narrative_stream)
+
+    def _prefers_summary(self, sql_query: str) -> bool:
+        """True when the query is estimated too large to fetch, False if it cannot be estimated"""
+        estimate = self.db_connection_manager.estimate_query(sql_query)
+        if estimate is None:
+            return False
+        large = bool((self.summary_min_estimated_rows and estimate.estimated_rows > self.summary_min_estimated_rows)
+                     or (self.summary_min_estimated_cost and estimate.estimated_cost > self.summary_min_estimated_cost))
+        self.instrumentation.debug("Estimated %.0f rows at cost %.2f, %s", estimate.estimated_rows,
+                                   estimate.estimated_cost, "summarizing on the server" if large else "fetching rows")
+        return large
+
+    def get_result(self, query: str, question: str, summary_only: bool = False) -> Tuple[pd.DataFrame, str]:
+        """Run the query and narrate it. With summary_only only server-side statistics are fetched
+        and the DataFrame is None; load rows later with db_connection_manager.execute_query."""
         try:             
+            if summary_only:
+                summary = self.db_connection_manager.get_summary(query)
+                return None, self._generate_narrative_insights(None, question, summary)
             df = self.db_connection_manager.execute_query(query)
-            narrative = self._generate_narrative_insights(df) 
-            print(df.to_json(orient='records'))
+            narrative = self._generate_narrative_insights(df, question) 
             # print(narrative)
             return df, narrative
         except Exception as e:
             print(f"Query execution failed: {str(e)}")
             return None, None
     
-    def _generate_narrative_insights(self, df: pd.DataFrame) -> str:
-        try:
-            # Create a prompt template for insights generation
-            insights_template = PromptTemplate(
-                input_variables=["data_description","question"],
-                template="""
-                Analyze this dataset and provide key insights in natural language:
-                {data_description} based on the asked question "{question}"
-                
-                Focus on:
-                1. Key trends and patterns
-                2. Notable changes or anomalies
-                3. Business implications
-                """
-            )
+    def _get_narrative_chain(self, llm=None):
+        # Create a prompt template for insights generation
+        insights_template = PromptTemplate(
+            input_variables=["data_description","question"],
+            template="""
+            Analyze this dataset and provide key insights in natural language:
+            {data_description} based on the asked question "{question}"
+            
+            Focus on:
+            1. Key trends and patterns
+            2. Notable changes or anomalies
+            3. Business implications
+            """
+        )
 
-            # Create the chain
-            insights_chain = (
-                {"data_description": RunnablePassthrough(), "question": RunnablePassthrough()}
-                | insights_template
-                | self.llm
-                | StrOutputParser()
-            )
+        # Create the chain
+        return (
+            {"data_description": RunnablePassthrough(), "question": RunnablePassthrough()}
+            | insights_template
+            | (llm or self.llm)
+            | StrOutputParser()
+        )
 
-            # Prepare data description
-            data_description = df.describe().to_json()
+    @staticmethod
+    def _describe_data(df: pd.DataFrame, summary: Dict = None) -> str:
+        """Compact statistics for the narrative prompt, accumulated while the rows were fetched
+        or computed on the server"""
+        if summary is None and df is not None:
+            summary = df.attrs.get("summary")
+        if summary is not None:
+            return json.dumps(summary, default=str)
+        return df.describe().to_json()
 
-            # Generate narrative 
-            narrative = insights_chain.invoke({
-                "data_description": data_description,
-                "question":self.question
-            })
+    def _generate_narrative_insights(self, df: pd.DataFrame, question: str, summary: Dict = None) -> str:
+        try:
+            with self.instrumentation.span("narrative", streamed=False) as span:
+                # Prepare data description
+                data_description = self._describe_data(df, summary)
 
-            narrative = self.remove_think_tags(narrative)
-            
-            # print(narrative)
-            
+                # Generate narrative 
+                narrative = self.llm_caller.invoke("narrative", self._get_narrative_chain, {
+                    "data_description": data_description,
+                    "question": question
+                }, config={"callbacks": [TokenUsageCallback(span)]})
+
+                narrative = self.remove_think_tags(narrative)
+            self.instrumentation.debug("Narrative: %s", narrative)
             return narrative
         except Exception as e:
             return f"Narrative generation failed: {str(e)}"
+
+    def stream_narrative_insights(self, df: pd.DataFrame, question: str,
+                                  summary: Dict = None) -> Iterator[str]:
+        """Yield the narrative as the LLM produces it, with <think> spans filtered out on the fly"""
+        think_filter = ThinkTagFilter()
+        try:
+            with self.instrumentation.span("narrative", streamed=True) as span:
+                data_description = self._describe_data(df, summary)
+                started = time.perf_counter()
+                for chunk in self.llm_caller.stream("narrative", self._get_narrative_chain, {
+                    "data_description": data_description,
+                    "question": question
+                }, config={"callbacks": [TokenUsageCallback(span)]}):
+                    text = think_filter.feed(chunk)
+                    if text:
+                        if "first_token_ms" not in span.attributes:
+                            span.set(first_token_ms=round((time.perf_counter() - started) * 1000, 3))
+                        yield text
+                text = think_filter.flush()
+                if text:
+                    yield text
+        except Exception as e:
+            yield f"Narrative generation failed: {str(e)}"
         
+    def match_intent(self, question: str) -> Optional[IntentMatcher.IntentMatch]:
+        """Local fast path for common question shapes; None means the LLM has to answer"""
+        with self.instrumentation.span("intent_match") as span:
+            intent = self.intent_matcher.match(question)
+            span.set(matched=intent.intent if intent else None)
+        return intent
+
     def validate_query_context(self, user_question: str) -> Tuple[bool, str, str]:
         """Check if the question is related to the database context"""
-        # Create a comprehensive system prompt
-        tables_info = []
-        for table_name, table_info in self.schema_details['tables'].items():
-            columns = ", ".join(f"{col} ({dtype})" for col, dtype in table_info['columns'].items())
-            tables_info.append(f"Table '{table_name}' contains: {columns}")
-        
-        relationships_info = []
-        for rel in self.schema_details['relationships']:
-            relationships_info.append(
-                f"Table '{rel['table']}' is related to '{rel['referenced_table']}' "
-                f"through {rel['column']} = {rel['referenced_column']}"
-            )
-        
-        system_prompt = self._generate_user_question_context_validator_prompt(tables_info, relationships_info)
-        print("system_prompt")
-        print(system_prompt)
+        local_validation, classification = self._validate_locally(user_question)
+        if local_validation is not None:
+            return local_validation
+        return self._validate_with_llm(user_question, classification)
+
+    def _validate_locally(self, user_question: str) -> Tuple[Optional[Tuple[bool, str, str]],
+                                                              Optional[KeywordClassifier.Classification]]:
+        """(is_related, reasoning, reframed_question) when the intent matcher or keyword classifier
+        decide the question, None when it is ambiguous; plus the classification"""
+        if self.match_intent(user_question) is not None:
+            return (True, "Question asks for business data", None), None
+        with self.instrumentation.span("keyword_classification") as span:
+            classification = self.keyword_classifier.classify(user_question)
+            span.set(decision=classification.decision)
+        if classification.decision == "reject":
+            return (False, classification.reason, None), classification
+        if classification.decision == "accept":
+            return (True, classification.reason, None), classification
+        return None, classification
+
+    def _validate_with_llm(self, user_question: str,
+                           classification: KeywordClassifier.Classification) -> Tuple[bool, str, str]:
+        # Create a comprehensive system prompt from the tables relevant to the question
+        relevant_schema = self.schema_retriever.relevant_schema(user_question)
+        sections = self.prompt_manager.schema_sections(relevant_schema, self.db_connection_manager.schema_version)
+        system_prompt = self._generate_user_question_context_validator_prompt(sections["tables_info"],
+                                                                             sections["relationship_info"])
         messages = [
             SystemMessage(content=system_prompt),
             HumanMessage(content=f"Question: {user_question}")
         ]
         try:
-            parser = JsonOutputParser(pydantic_object = UserQueryContext)
-            chain = self.llm | parser
-            response = chain.invoke(messages)
-            return response['is_related'], response['reasoning'], response['reframed_question']
+            with self.instrumentation.span("validation") as span:
+                parser = JsonOutputParser(pydantic_object = UserQueryContext)
+                is_related, reasoning, reframed_question = self.llm_caller.invoke(
+                    "validation", lambda llm: llm | parser, messages,
+                    config={"callbacks": [TokenUsageCallback(span)]},
+                    validate=lambda response: (response['is_related'], response['reasoning'],
+                                               response['reframed_question']))
+                span.set(is_related=bool(is_related))
+            return is_related, reasoning, reframed_question
         except:
-            # Fallback to a more permissive validation
-            question_lower = user_question.lower()
-            table_names = [table.lower() for table in self.schema_details['tables'].keys()]
-            
-            # Check if any table name or its singular/plural form is mentioned
-            for table in table_names:
-                if (table in question_lower or 
-                    table[:-1] in question_lower or  # singular
-                    table + 's' in question_lower):  # plural
-                    return True, f"Question mentions table - {table}"
-            
-            # Check for common analytical terms
-            analytical_terms = ['how many', 'count', 'list', 'show', 'find', 'get', 'what', 'which']
-            if any(term in question_lower for term in analytical_terms):
-                return True, "Question appears to be an analytical query"
-                
-            return False, "Question doesn't appear to be related to the database"        
+            # Fallback to a more permissive validation; no table was mentioned (the classifier saw to that)
+            if classification.analytical:
+                return True, "Question appears to be an analytical query", None
+            return False, "Question doesn't appear to be related to the database", None
         
     # Prompt methods
     def _generate_user_question_context_validator_prompt(self, table_info, relationship_info):
         try:
             prompt = self.prompt_manager.get_prompt(
                 "user_question_context_validator",
-                tables_info=chr(10).join(table_info),
-                relationship_info=chr(10).join(relationship_info)
+                tables_info=table_info,
+                relationship_info=relationship_info
             )
             return prompt
         except Exception as e:
             print(f"Error generating prompt: {str(e)}")
             raise
         
+class TokenUsageCallback(BaseCallbackHandler):
+    """Copy the prompt/completion token counts of the LLM calls in a chain onto a span"""
+
+    def __init__(self, span: Instrumentation.Span):
+        self.span = span
+
+    def on_llm_end(self, response, **kwargs):
+        usages = [getattr(getattr(generation, "message", None), "usage_metadata", None)
+                  for generations in response.generations for generation in generations]
+        usages = [usage for usage in usages if usage]
+        if usages:
+            for usage in usages:
+                self.span.add("prompt_tokens", usage.get("input_tokens", 0))
+                self.span.add("completion_tokens", usage.get("output_tokens", 0))
+            return
+        # Providers that only report usage in llm_output (OpenAI-style token_usage)
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        if token_usage:
+            self.span.add("prompt_tokens", token_usage.get("prompt_tokens", 0))
+            self.span.add("completion_tokens", token_usage.get("completion_tokens", 0))
+
+
+@dataclass
+class PipelineResult:
+    question: str
+    is_related: bool
+    reasoning: str
+    reframed_question: Optional[str] = None
+    sql_query: Optional[str] = None
+    result: Optional[pd.DataFrame] = None
+    narrative_future: Optional[Future] = None
+    narrative_stream: Optional["NarrativeStream"] = None
+
+    def narrative(self, timeout: float = None) -> Optional[str]:
+        """Wait for the background narrative, None if no query result was produced"""
+        if self.narrative_future is None:
+            return None
+        return self.narrative_future.result(timeout=timeout)
+
+    def narrative_tokens(self) -> Iterator[str]:
+        """Narrative text as it arrives from the background producer (single consumer)"""
+        if self.narrative_stream is not None:
+            yield from self.narrative_stream
+
+
+class NarrativeStream:
+    """Hands narrative tokens from the background producer to the UI thread as they arrive"""
+
+    _DONE = object()
+
+    def __init__(self):
+        self._tokens = queue.Queue()
+
+    def produce(self, tokens: Iterator[str]) -> str:
+        parts = []
+        try:
+            for token in tokens:
+                parts.append(token)
+                self._tokens.put(token)
+        finally:
+            self._tokens.put(self._DONE)
+        return "".join(parts)
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            token = self._tokens.get()
+            if token is self._DONE:
+                return
+            yield token
+
+
+class ThinkTagFilter:
+    """Incremental version of remove_think_tags for streamed text.
+
+    Tags split across chunk boundaries are held back until they can be decided;
+    an unterminated <think> span is dropped.
+    """
+
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self):
+        self._buffer = ""
+        self._inside = False
+
+    def feed(self, chunk: str) -> str:
+        self._buffer += chunk
+        output = []
+        while True:
+            tag = self.CLOSE_TAG if self._inside else self.OPEN_TAG
+            index = self._buffer.find(tag)
+            if index >= 0:
+                if not self._inside:
+                    output.append(self._buffer[:index])
+                self._buffer = self._buffer[index + len(tag):]
+                self._inside = not self._inside
+                continue
+            # Hold back a trailing fragment that could still become the tag
+            keep = self._partial_tag_length(tag)
+            if not self._inside:
+                output.append(self._buffer[:len(self._buffer) - keep])
+            self._buffer = self._buffer[len(self._buffer) - keep:]
+            return "".join(output)
+
+    def flush(self) -> str:
+        text = "" if self._inside else self._buffer
+        self._buffer = ""
+        return text
+
+    def _partial_tag_length(self, tag: str) -> int:
+        for length in range(min(len(tag) - 1, len(self._buffer)), 0, -1):
+            if self._buffer.endswith(tag[:length]):
+                return length
+        return 0
+
+
 class UserQueryContext(BaseModel):
     reasoning: str = Field(description="Provide Reasoning of the user query context")
     is_related:bool = Field(description="Based on Reasoning, provide is it realted to Business")
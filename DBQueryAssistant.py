@@ -4,18 +4,39 @@ from langchain.schema import HumanMessage, SystemMessage
 from langchain.prompts import PromptTemplate
 from langchain.output_parsers import CommaSeparatedListOutputParser
 import pyodbc
-from fuzzywuzzy import fuzz
 import pandas as pd
 from typing import List, Dict, Tuple
 import json, dotenv,os, re
+import DatabaseConnectionManager
+import DistinctValueFetcher
+import ResilientLLM
+import SchemaRetriever
+import SqlValidator
+import ValueIndex
 
 class DBQueryAssistant:
-    def __init__(self, connection_string: str, groq_api_key: str):
+    def __init__(self, connection_string: str, groq_api_key: str, llm=None, db_connection_manager=None,
+                 fallback_llms: list = None):
         self.conn_str = connection_string
-        # self.llm = ChatGroq(api_key=groq_api_key, model="llama-3.1-8b-instant")
-        self.llm = ChatGroq(api_key=groq_api_key, model="mixtral-8x7b-32768")
+        self.llm = llm or ChatGroq(api_key=groq_api_key, model="mixtral-8x7b-32768")
+        if fallback_llms is None:
+            fallback_llms = [] if llm is not None else [ChatGroq(api_key=groq_api_key, model="llama-3.1-8b-instant")]
+        # Per-stage deadlines, retries with backoff and hedging to the fallback model
+        self.llm_caller = ResilientLLM.ResilientLLM([self.llm] + list(fallback_llms))
+        self.db_connection_manager = (db_connection_manager or
+                                      DatabaseConnectionManager.DatabaseConnectionManager(self.conn_str))
         self.db_schema = self._get_db_schema()
-        self.value_cache = {}
+        self.schema_retriever = SchemaRetriever.SchemaRetriever(self.db_schema,
+                                                                fk_graph=self.db_connection_manager.fk_graph)
+        # Parses generated SQL and checks every table and column against the schema
+        self.sql_validator = SqlValidator.SqlValidator(self.db_schema)
+        # Text-only distinct values; skips high-cardinality columns. The value index holds (and bounds) them
+        self.value_fetcher = DistinctValueFetcher.DistinctValueFetcher(self.db_connection_manager, self.db_schema)
+        schema_cache = self.db_connection_manager.schema_cache
+        self.value_index = ValueIndex.ValueIndex(
+            self.value_fetcher.fetch,
+            path=os.getenv("VALUE_INDEX_PATH") or os.path.join(
+                schema_cache.cache_dir, f"values_{schema_cache.key_for(self.conn_str, 'values')}.pkl"))
         
     # def _get_db_schema(self) -> Dict:
     #     """Extract database schema and relationships"""
@@ -55,86 +76,11 @@ class DBQueryAssistant:
 
     def _get_db_schema(self) -> Dict:
         """Extract database schema and relationships"""
-        schema = {
-            "tables":{},
-            "relationships":[]
-        }
-        try:
-            with pyodbc.connect(self.conn_str) as conn:
-                cursor = conn.cursor()
-
-                # Retrieve database tables
-                tables = cursor.execute(
-                    """
-                        SELECT 
-                            t.name AS table_name,
-                            c.name AS column_name, 
-                            ty.name AS data_type
-                        FROM 
-                            sys.tables t
-                        INNER JOIN 
-                            sys.columns c 
-                            ON t.object_id = c.object_id
-                        INNER JOIN 
-                            sys.types ty 
-                            ON c.user_type_id = ty.user_type_id
-                        ORDER BY 
-                            t.name, 
-                            c.column_id
-                    """).fetchall()
-                
-                
-                for table, column, data_type in tables:
-                    if table not in schema["tables"]:
-                        schema["tables"][table]={"columns":{}}
-                    schema["tables"][table]["columns"][column] = data_type
-                
-
-                # Retrieve all the foreign key relationships
-                relationships = cursor.execute(
-                    """
-                        SELECT 
-                            OBJECT_NAME(f.parent_object_id) AS TableName,
-                            COL_NAME(fc.parent_object_id, fc.parent_column_id) AS ColumnName,
-                            OBJECT_NAME(f.referenced_object_id) AS ReferenceTableName,
-                            COL_NAME(fc.referenced_object_id, fc.referenced_column_id) AS ReferenceColumnName
-                        FROM 
-                            sys.foreign_keys AS f
-                        INNER JOIN 
-                            sys.foreign_key_columns AS fc
-                            ON f.OBJECT_ID = fc.constraint_object_id
-
-                    """).fetchall()
-                
-                for table, column, referenced_table, referenced_column in relationships:
-                    relationship = {
-                        "table": table,
-                        "column": column,
-                        "referenced_table" : referenced_table,
-                        "referenced_column" : referenced_column
-                    }
-
-                    if relationship not in schema["relationships"]:
-                        schema["relationships"].append(relationship)
-                st.text(schema)
-                return schema
-        except Exception as ex:
-            print(f"Unable to retrieve the database schema: {str(ex)}")
-            return None
+        schema = self.db_connection_manager.get_schema_info()
+        st.text(schema)
+        return schema
          
 
-    def _get_column_values(self, table: str, column: str) -> List[str]:
-        """Cache and retrieve distinct values from a column"""
-        cache_key = f"{table}.{column}"
-        if cache_key not in self.value_cache:
-            with pyodbc.connect(self.conn_str) as conn:
-                query = f"SELECT DISTINCT CAST([{column}] AS VARCHAR(MAX)) as {column} FROM {table}"
-                st.write(query)
-                df = pd.read_sql(query, conn)
-                self.value_cache[cache_key] = df[column].tolist()
-        # st.write(self.value_cache)
-        return self.value_cache[cache_key]
-
     # def validate_query_context(self, user_question: str) -> bool:
     #     """Check if the question is related to the database context"""
     #     system_prompt = f"""You are a database query validator. Given the following database schema:
@@ -181,14 +127,15 @@ class DBQueryAssistant:
 
     def validate_query_context(self, user_question: str) -> Tuple[bool, str]:
         """Check if the question is related to the database context"""
-        # Create a comprehensive system prompt
+        # Create a comprehensive system prompt from the tables relevant to the question
+        relevant_schema = self.schema_retriever.relevant_schema(user_question)
         tables_info = []
-        for table_name, table_info in self.db_schema['tables'].items():
+        for table_name, table_info in relevant_schema['tables'].items():
             columns = ", ".join(f"{col} ({dtype})" for col, dtype in table_info['columns'].items())
             tables_info.append(f"Table '{table_name}' contains: {columns}")
         
         relationships_info = []
-        for rel in self.db_schema['relationships']:
+        for rel in relevant_schema['relationships']:
             relationships_info.append(
                 f"Table '{rel['table']}' is related to '{rel['referenced_table']}' "
                 f"through {rel['column']} = {rel['referenced_column']}"
@@ -219,9 +166,7 @@ class DBQueryAssistant:
         ]
         st.text(system_prompt)
         try:
-            response = self.llm.invoke(messages)
-            result = json.loads(response.content)
-            return result['is_related'], result['reasoning']
+            return self.llm_caller.invoke("validation", lambda llm: llm, messages, validate=self._parse_context)
         except:
             # Fallback to a more permissive validation
             question_lower = user_question.lower()
@@ -242,24 +187,21 @@ class DBQueryAssistant:
             return False, "Question doesn't appear to be related to the database"
     
 
-    def find_similar_values(self, table: str, column: str, user_input: str, threshold: int = 80) -> List[str]:
-        # st.text("find_similar_values")
-        """Find similar values using fuzzy matching"""
-        st.write("Table:", table, "Column", column)
-        values = self._get_column_values(table, column)
-        similar_values = []
-        
-        for value in values:
-            similarity = fuzz.ratio(str(user_input).lower(), str(value).lower())
-            if similarity >= threshold:
-                similar_values.append((value, similarity))
-                
-        return [value for value, _ in sorted(similar_values, key=lambda x: x[1], reverse=True)]
+    @staticmethod
+    def _parse_context(response) -> Tuple[bool, str]:
+        result = json.loads(response.content)
+        return result['is_related'], result['reasoning']
+
+    def suggest_corrections(self, user_question: str, threshold: int = 80) -> Dict[str, List[str]]:
+        """Similar stored values per column for the words of the question, from the value index"""
+        # Only new or stale text columns hit the database, the rest comes from the persisted index
+        self.value_index.refresh(self.db_schema)
+        return self.value_index.lookup(user_question.split(), threshold=threshold)
 
     def generate_sql_query(self, user_question: str, corrections: Dict = None) -> str:
         """Generate SQL query using LLM"""
         system_prompt = f"""You are a SQL query generator. Given the following database schema:
-        {json.dumps(self.db_schema, indent=2)}
+        {json.dumps(self.schema_retriever.relevant_schema(user_question), indent=2)}
         
         Generate a SQL query for the user question. If corrections are provided, use those values.
         Return only the SQL query without any explanations."""
@@ -273,30 +215,27 @@ class DBQueryAssistant:
             HumanMessage(content=question)
         ]
         
-        response = self.llm.invoke(messages)
-        validated_sql = self._validate_and_clean_query(response.content.strip())
+        # SQL that fails validation counts as a failed attempt and is asked for again
+        validated_sql = self.llm_caller.invoke(
+            "sql_generation", lambda llm: llm, messages,
+            validate=lambda response: self._validate_and_clean_query(response.content.strip()))
         return validated_sql
         # return response.content.strip()
     
     def _validate_and_clean_query(self, query: str) -> str:
-        cleanedQuery = self.remove_think_tags(query)
-        query = cleanedQuery.replace('```sql', '').replace('```', '').replace(";",'').replace("\\",'').replace('`','').strip()
-        
-        
-        referenced_tables = set()
-        for table in self.db_schema["tables"].keys():
-            if table.lower() in query.lower():
-                referenced_tables.add(table)
-        
-        if not referenced_tables:
-            raise ValueError("Generated query does not reference any valid tables")
-        
-        return query
+        """Raises SqlValidator.SqlValidationError for writes, several statements or unknown tables/columns"""
+        return self.sql_validator.validate(query).sql
     
     def remove_think_tags(self, text: str) -> str:
         # Use regular expression to remove content between <think> and </think>
         return re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
 
+@st.cache_resource(show_spinner="Loading database schema...")
+def get_db_query_assistant(connection_string: str, groq_api_key: str) -> DBQueryAssistant:
+    """One assistant (LLM client, connection pool, schema, value index) per connection string and
+    API key, shared by every session and rerun of this process"""
+    return DBQueryAssistant(connection_string, groq_api_key)
+
 def main():
     dotenv.load_dotenv()    
     st.title("Intelligent Database Query Assistant")
@@ -305,7 +244,7 @@ def main():
     connection_string = os.getenv("CONNECTION_STRING")
     
     groq_api_key = os.getenv("API_KEY")
-    assistant = DBQueryAssistant(connection_string, groq_api_key)
+    assistant = get_db_query_assistant(connection_string, groq_api_key)
     
     # User input
     user_question = st.text_input("Enter your question:", "")
@@ -321,10 +260,12 @@ def main():
         st.text("Generated Query")
         st.code(sql_query,language="sql")
         
-        # Execute query and check for empty results
+        # Execute query and check for empty results; the manager applies the row, byte and cost limits
         try:
-            with pyodbc.connect(connection_string) as conn:
-                df = pd.read_sql(sql_query, conn)
+            df = assistant.db_connection_manager.execute_query(sql_query)
+            if df is None:
+                st.error("The query could not be run.")
+                return
 
             st.text((df[''] == 0).all())
             st.text(df.columns)
@@ -334,25 +275,9 @@ def main():
                 st.text("Empty column")
 
             if df.empty or (len(df.columns) == 1 and (df[''] == 0).all()):
-                # Try to identify potential mismatches
-                corrections = {}
-                st.text(assistant.db_schema.items())
-                st.text('----')
-                for table_name, table_info in assistant.db_schema['tables'].items():
-                    # st.text("table_name")
-                    # st.text(table_name)
-                    # st.text(table_info)
-                    # st.text("column")
-                    # st.text(table_info['columns'])
-                    # st.text('----')
-
-                    for column in table_info['columns']:
-                        # Look for words in the user question that might be values
-                        words = user_question.split()
-                        for word in words:
-                            similar_values = assistant.find_similar_values(table_name, column, word)
-                            if similar_values:
-                                corrections[f"{table_name}.{column}"] = similar_values
+                # Try to identify potential mismatches: every word of the question is
+                # matched against the indexed text columns in a single lookup
+                corrections = assistant.suggest_corrections(user_question)
                 
                 if corrections:
                     st.warning("No results found. Did you mean one of these?")
@@ -368,8 +293,10 @@ def main():
                     
                     if st.button("Run with corrections"):
                         corrected_query = assistant.generate_sql_query(user_question, selected_corrections)
-                        with pyodbc.connect(connection_string) as conn:
-                            df = pd.read_sql(corrected_query, conn)
+                        df = assistant.db_connection_manager.execute_query(corrected_query)
+                        if df is None:
+                            st.error("The corrected query could not be run.")
+                            return
                         st.write("Results:")
                         st.dataframe(df)
                         st.code(corrected_query, language="sql")
@@ -1,118 +1,715 @@
 import pyodbc
 import pandas as pd
 import json  # Import the json module
+import hashlib
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+import AsyncQueryExecutor
+import ForeignKeyGraph
+import Instrumentation
+import PagedResult
+import QueryCostGuard
+import ResultCache
+import SchemaSnapshotCache
+import SqlRewriter
+import SqlTypes
+import StreamingStats
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of ODBC connections for one connection string"""
+
+    def __init__(self, connection_string: str, max_size: int = 5, checkout_timeout: float = 30.0,
+                 max_idle_seconds: float = 300.0, max_lifetime_seconds: float = 1800.0,
+                 connect: Callable = pyodbc.connect):
+        self.connection_string = connection_string
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.max_idle_seconds = max_idle_seconds
+        self.max_lifetime_seconds = max_lifetime_seconds
+        self._connect = connect
+
+        # Idle entries are [connection, created_at, last_used_at], least recently used on the left
+        self._idle = deque()
+        self._open = 0
+        self._closed = False
+        self._lock = threading.Condition()
+        self._metrics = {
+            "created": 0,
+            "closed": 0,
+            "checkouts": 0,
+            "in_use": 0,
+            "waits": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "health_check_failures": 0,
+        }
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; it is returned to the pool when the block exits"""
+        entry = self._checkout()
+        try:
+            yield entry[0]
+        except BaseException:
+            self._checkin(entry, failed=True)
+            raise
+        else:
+            self._checkin(entry)
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["open"] = self._open
+            metrics["idle"] = len(self._idle)
+            metrics["max_size"] = self.max_size
+            return metrics
+
+    def close(self):
+        """Close all idle connections; connections in use are closed on return"""
+        with self._lock:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            # Waiting borrowers fail fast instead of timing out
+            self._lock.notify_all()
+        for entry in idle:
+            self._discard(entry)
+
+    def _checkout(self) -> list:
+        started = time.monotonic()
+        waited = False
+        while True:
+            entry = None
+            create = False
+            with self._lock:
+                expired = self._pop_expired()
+                while not self._closed and not self._idle and self._open >= self.max_size:
+                    waited = True
+                    remaining = self.checkout_timeout - (time.monotonic() - started)
+                    if remaining <= 0:
+                        raise TimeoutError(
+                            f"Timed out after {self.checkout_timeout}s waiting for a database connection")
+                    self._lock.wait(remaining)
+                if self._closed:
+                    raise RuntimeError("The connection pool is closed")
+                if self._idle:
+                    entry = self._idle.pop()
+                else:
+                    # Reserve the slot before connecting outside the lock
+                    self._open += 1
+                    create = True
+            for stale in expired:
+                self._discard(stale)
+
+            if create:
+                try:
+                    entry = self._create()
+                except Exception:
+                    with self._lock:
+                        self._open -= 1
+                        self._lock.notify()
+                    raise
+            elif not self._is_usable(entry):
+                self._discard(entry)
+                continue
+
+            wait_seconds = time.monotonic() - started
+            with self._lock:
+                self._metrics["checkouts"] += 1
+                self._metrics["in_use"] += 1
+                if waited:
+                    self._metrics["waits"] += 1
+                self._metrics["wait_seconds_total"] += wait_seconds
+                self._metrics["wait_seconds_max"] = max(self._metrics["wait_seconds_max"], wait_seconds)
+            return entry
+
+    def _checkin(self, entry: list, failed: bool = False):
+        now = time.monotonic()
+        if now - entry[1] > self.max_lifetime_seconds:
+            self._discard(entry, borrowed=True)
+            return
+        try:
+            # Leave no open transaction behind for the next borrower; a connection
+            # that cannot even roll back is broken and gets replaced
+            if failed:
+                entry[0].rollback()
+            else:
+                entry[0].commit()
+        except Exception:
+            self._discard(entry, borrowed=True)
+            return
+        entry[2] = now
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._metrics["in_use"] -= 1
+                self._idle.append(entry)
+                expired = self._pop_expired()
+                self._lock.notify()
+        if closed:
+            self._discard(entry, borrowed=True)
+            return
+        for stale in expired:
+            self._discard(stale)
+
+    def _pop_expired(self) -> List[list]:
+        """Take idle entries past their idle or lifetime limit off the least recently used end.
+
+        Checkout reuses the most recently used end, so without this the oldest entries would
+        never be looked at. Call with the lock held and discard the result outside of it.
+        """
+        now = time.monotonic()
+        expired = []
+        while self._idle and (now - self._idle[0][2] > self.max_idle_seconds
+                              or now - self._idle[0][1] > self.max_lifetime_seconds):
+            expired.append(self._idle.popleft())
+        return expired
+
+    def _create(self) -> list:
+        conn = self._connect(self.connection_string)
+        now = time.monotonic()
+        with self._lock:
+            self._metrics["created"] += 1
+        return [conn, now, now]
+
+    def _is_usable(self, entry: list) -> bool:
+        now = time.monotonic()
+        if now - entry[1] > self.max_lifetime_seconds or now - entry[2] > self.max_idle_seconds:
+            return False
+        try:
+            entry[0].cursor().execute("SELECT 1").fetchone()
+            return True
+        except Exception:
+            with self._lock:
+                self._metrics["health_check_failures"] += 1
+            return False
+
+    def _discard(self, entry: list, borrowed: bool = False):
+        """Close a connection and free its slot"""
+        try:
+            entry[0].close()
+        except Exception:
+            pass
+        with self._lock:
+            self._open -= 1
+            self._metrics["closed"] += 1
+            if borrowed:
+                self._metrics["in_use"] -= 1
+            self._lock.notify()
+
 
 class DatabaseConnectionManager:
-    def __init__(self, connection_string:str):
+    NUMERIC_TYPES = SqlTypes.NUMERIC_TYPES
+    UNGROUPABLE_TYPES = SqlTypes.UNGROUPABLE_TYPES
+    # Session temp table get_summary materializes the query into
+    SUMMARY_TABLE = "#insights_summary"
+
+    def __init__(self, connection_string:str, pool_size: int = 5, checkout_timeout: float = 30.0,
+                 max_idle_seconds: float = 300.0, max_lifetime_seconds: float = 1800.0,
+                 fetch_batch_size: int = 5000, max_rows: int = 100000, max_bytes: int = 256 * 1024 * 1024,
+                 schema_cache_dir: str = None, result_cache_ttl: float = 300,
+                 result_cache_bytes: int = 128 * 1024 * 1024, connect: Callable = pyodbc.connect,
+                 instrumentation: Instrumentation.Instrumentation = None,
+                 cost_guard: QueryCostGuard.QueryCostGuard = None):
         self.connection_string = connection_string
+        self.instrumentation = instrumentation or Instrumentation.default_instrumentation
+        self.schema_cache = SchemaSnapshotCache.SchemaSnapshotCache(schema_cache_dir)
+        self.schema_version = None
+        self.fk_graph = ForeignKeyGraph.ForeignKeyGraph()
+        # Set result_cache_ttl to 0 to always go to the database
+        self.result_cache = ResultCache.ResultCache(ttl_seconds=result_cache_ttl, max_bytes=result_cache_bytes)
+        # Limits applied to execute_query; pass 0 to disable a limit
+        self.fetch_batch_size = fetch_batch_size
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        # Estimated-plan limits, automatic TOP and query timeout for execute_query / get_summary
+        self.cost_guard = cost_guard or QueryCostGuard.QueryCostGuard()
+        self.pool = ConnectionPool(connection_string, max_size=pool_size, checkout_timeout=checkout_timeout,
+                                   max_idle_seconds=max_idle_seconds, max_lifetime_seconds=max_lifetime_seconds,
+                                   connect=connect)
+        # Awaitable queries on a bounded thread pool shared per connection string
+        self.async_queries = AsyncQueryExecutor.AsyncQueryExecutor(self)
+
+    def connection(self):
+        """Borrow a pooled connection: `with manager.connection() as conn:`"""
+        return self.pool.connection()
+
+    def pool_metrics(self) -> Dict:
+        return self.pool.metrics()
     
-    def get_schema_info(self) -> dict:
-        """Fetch the database schma details"""
-        schema = {
-            "tables":{},
-            "relationships":[]
-        }
+    def get_schema_info(self, use_snapshot: bool = True) -> dict:
+        """Fetch the database schma details.
 
+        A local snapshot is reused when available: one query against sys.objects finds the
+        tables whose DDL changed since the snapshot, and only those are introspected again.
+        """
         try:
-            with pyodbc.connect(self.connection_string) as conn:
+            with self.instrumentation.span("schema_load") as span, self.connection() as conn:
                 cursor = conn.cursor()
+                database, modify_dates = self._fetch_table_modify_dates(cursor)
+                snapshot_key = self.schema_cache.key_for(self.connection_string, database)
+                snapshot = self.schema_cache.load(snapshot_key) if use_snapshot else None
 
-                # Retrieve database tables
-                tables = cursor.execute(
-                    """
-                        SELECT 
-                            t.name AS table_name,
-                            c.name AS column_name, 
-                            ty.name AS data_type
-                        FROM 
-                            sys.tables t
-                        INNER JOIN 
-                            sys.columns c 
-                            ON t.object_id = c.object_id
-                        INNER JOIN 
-                            sys.types ty 
-                            ON c.user_type_id = ty.user_type_id
-                        ORDER BY 
-                            t.name, 
-                            c.column_id
-                    """).fetchall()
-                           
-                for table, column, data_type in tables:
-                    if table not in schema["tables"]:
-                        schema["tables"][table]={"columns":{}}
-                    schema["tables"][table]["columns"][column] = data_type
-                
-                # Retrieve all the foreign key relationships
-                relationships = cursor.execute(
-                    """
-                        SELECT 
-                            OBJECT_NAME(f.parent_object_id) AS TableName,
-                            COL_NAME(fc.parent_object_id, fc.parent_column_id) AS ColumnName,
-                            OBJECT_NAME(f.referenced_object_id) AS ReferenceTableName,
-                            COL_NAME(fc.referenced_object_id, fc.referenced_column_id) AS ReferenceColumnName
-                        FROM 
-                            sys.foreign_keys AS f
-                        INNER JOIN 
-                            sys.foreign_key_columns AS fc
-                            ON f.OBJECT_ID = fc.constraint_object_id
-
-                    """).fetchall()
-                
-                for table, column, referenced_table, referenced_column in relationships:
-                    relationship = {
-                        "table": table,
-                        "column": column,
-                        "referenced_table" : referenced_table,
-                        "referenced_column" : referenced_column
+                if snapshot is None:
+                    schema = {
+                        "tables": self._fetch_columns(cursor),
+                        "relationships": self._fetch_relationships(cursor)
                     }
+                    changed = True
+                else:
+                    schema, changed = self._refresh_snapshot(cursor, snapshot, modify_dates)
+                span.set(tables=len(schema["tables"]), relationships=len(schema["relationships"]),
+                         cache_hit=snapshot is not None and not changed)
 
-                    if relationship not in schema["relationships"]:
-                        schema["relationships"].append(relationship)
-                
-                return schema
+            self.fk_graph = ForeignKeyGraph.ForeignKeyGraph(schema["relationships"])
+            self.schema_version = self._schema_fingerprint(modify_dates)
+            if changed:
+                self.schema_cache.save(snapshot_key, {
+                    "database": database,
+                    "version": self.schema_version,
+                    "modify_dates": modify_dates,
+                    "schema": schema
+                })
+            return schema
 
-                # # Convert the schema dictionary to a valid JSON string
-                # schema_json = json.dumps(schema, indent=2)  # pretty-printing with 4 spaces indentation
-                # return schema_json
+            # # Convert the schema dictionary to a valid JSON string
+            # schema_json = json.dumps(schema, indent=2)  # pretty-printing with 4 spaces indentation
+            # return schema_json
         except Exception as ex:
             print(f"Unable to retrieve the database schema: {str(ex)}")
             return None
 
-    def execute_query(self, query: str) -> pd.DataFrame:
+    def invalidate_table(self, table: str) -> int:
+        """Evict cached results that read the table, e.g. after it was reloaded"""
+        return self.result_cache.invalidate_table(table)
+
+    def get_join_subgraph(self, tables: List[str]) -> Dict:
+        """Tables and relationships needed to join the given tables, from the cached FK graph"""
+        return self.fk_graph.join_subgraph(tables)
+
+    def _fetch_table_modify_dates(self, cursor) -> Tuple[str, Dict[str, str]]:
+        """Cheap catalog probe: the last DDL change of every user table"""
+        rows = cursor.execute(
+            """
+                SELECT 
+                    DB_NAME() AS database_name,
+                    o.name AS table_name,
+                    o.modify_date
+                FROM 
+                    sys.objects o
+                WHERE 
+                    o.type = 'U'
+                    AND o.is_ms_shipped = 0
+            """).fetchall()
+        database = rows[0][0] if rows else None
+        modify_dates = {table: str(modify_date) for _, table, modify_date in rows}
+        return database, modify_dates
+
+    def _refresh_snapshot(self, cursor, snapshot: Dict, modify_dates: Dict[str, str]) -> Tuple[dict, bool]:
+        """Bring a stored snapshot up to date by re-reading only the changed tables"""
+        stored_dates = snapshot.get("modify_dates", {})
+        cached_schema = snapshot["schema"]
+        changed_tables = [table for table, modify_date in modify_dates.items()
+                          if stored_dates.get(table) != modify_date]
+        dropped_tables = [table for table in stored_dates if table not in modify_dates]
+        if not changed_tables and not dropped_tables:
+            return cached_schema, False
+
+        self.instrumentation.debug("Schema snapshot refresh: %d changed, %d dropped tables",
+                                   len(changed_tables), len(dropped_tables))
+        stale = set(changed_tables) | set(dropped_tables)
+        tables = {table: info for table, info in cached_schema["tables"].items() if table not in stale}
+        tables.update(self._fetch_columns(cursor, changed_tables))
+
+        # A changed table may have gained or lost foreign keys in either direction
+        graph = ForeignKeyGraph.ForeignKeyGraph(
+            rel for rel in cached_schema["relationships"]
+            if rel["table"] not in stale and rel["referenced_table"] not in stale)
+        for relationship in self._fetch_relationships(cursor, changed_tables):
+            graph.add(relationship)
+
+        schema = {
+            "tables": {table: tables[table] for table in sorted(tables)},
+            "relationships": graph.relationships
+        }
+        return schema, True
+
+    def _fetch_columns(self, cursor, table_names: List[str] = None) -> Dict:
+        """Columns and data types per table, optionally limited to some tables"""
+        tables = {}
+        for names_filter, params in self._table_filters("t.name", table_names):
+            rows = cursor.execute(
+                f"""
+                    SELECT 
+                        t.name AS table_name,
+                        c.name AS column_name, 
+                        ty.name AS data_type
+                    FROM 
+                        sys.tables t
+                    INNER JOIN 
+                        sys.columns c 
+                        ON t.object_id = c.object_id
+                    INNER JOIN 
+                        sys.types ty 
+                        ON c.user_type_id = ty.user_type_id
+                    {names_filter}
+                    ORDER BY 
+                        t.name, 
+                        c.column_id
+                """, *params).fetchall()
+
+            for table, column, data_type in rows:
+                if table not in tables:
+                    tables[table] = {"columns": {}}
+                tables[table]["columns"][column] = data_type
+        return tables
+
+    def _fetch_relationships(self, cursor, table_names: List[str] = None) -> List[Dict]:
+        """Foreign key relationships, optionally limited to those touching some tables"""
+        graph = ForeignKeyGraph.ForeignKeyGraph()
+        for names_filter, params in self._table_filters(
+                "OBJECT_NAME(f.parent_object_id)", table_names, "OBJECT_NAME(f.referenced_object_id)"):
+            rows = cursor.execute(
+                f"""
+                    SELECT 
+                        OBJECT_NAME(f.parent_object_id) AS TableName,
+                        COL_NAME(fc.parent_object_id, fc.parent_column_id) AS ColumnName,
+                        OBJECT_NAME(f.referenced_object_id) AS ReferenceTableName,
+                        COL_NAME(fc.referenced_object_id, fc.referenced_column_id) AS ReferenceColumnName
+                    FROM 
+                        sys.foreign_keys AS f
+                    INNER JOIN 
+                        sys.foreign_key_columns AS fc
+                        ON f.OBJECT_ID = fc.constraint_object_id
+                    {names_filter}
+                """, *params).fetchall()
+
+            for table, column, referenced_table, referenced_column in rows:
+                # The graph deduplicates in O(1) per relationship
+                graph.add({
+                    "table": table,
+                    "column": column,
+                    "referenced_table" : referenced_table,
+                    "referenced_column" : referenced_column
+                })
+        return graph.relationships
+
+    @staticmethod
+    def _table_filters(expression: str, table_names: List[str] = None, or_expression: str = None,
+                       chunk_size: int = 1000):
+        """Yield (WHERE clause, params) pairs, chunked to stay under the ODBC parameter limit"""
+        if table_names is None:
+            yield "", []
+            return
+        # Each chunk is bound twice in the same statement when or_expression is given
+        step = chunk_size // 2 if or_expression else chunk_size
+        for start in range(0, len(table_names), step):
+            chunk = table_names[start:start + step]
+            placeholders = ", ".join("?" for _ in chunk)
+            clause = f"WHERE {expression} IN ({placeholders})"
+            params = list(chunk)
+            if or_expression:
+                clause += f" OR {or_expression} IN ({placeholders})"
+                params += list(chunk)
+            yield clause, params
+
+    @staticmethod
+    def _schema_fingerprint(modify_dates: Dict[str, str]) -> str:
+        """Stable version of the schema, changes whenever any table's DDL changes"""
+        digest = hashlib.sha256()
+        for table in sorted(modify_dates):
+            digest.update(f"{table}={modify_dates[table]};".encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+    def execute_query(self, query: str, max_rows: int = None, max_bytes: int = None,
+                      cancel_token: QueryCostGuard.CancellationToken = None,
+                      timeout_seconds: int = None) -> pd.DataFrame:
+        """Run a query and build the DataFrame batch by batch.
+
+        Rows beyond max_rows / max_bytes (defaults from the manager) are not fetched;
+        `df.attrs["truncated"]` tells whether the result was cut short and `df.attrs["summary"]`
+        holds statistics accumulated while the batches were fetched. Results are served
+        from the result cache while fresh; treat the returned frame as read-only.
+
+        The query's estimated plan is checked by the cost guard first, and the query runs
+        with a timeout (timeout_seconds or the guard's) and stops early once cancel_token is
+        cancelled. Rejected, timed out and cancelled queries return None like failed ones.
+        """
+        normalized_query = ResultCache.ResultCache.normalize_sql(query)
+        cache_key = f"{normalized_query}|{max_rows}|{max_bytes}"
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            with self.instrumentation.span("db_execution", cache_hit=True, rows=len(cached)):
+                return cached
+
+        try:
+            status = {}
+            columns = None
+            column_data = []
+            stats = StreamingStats.StreamingStats()
+            with self.instrumentation.span("db_execution", cache_hit=False) as span:
+                for batch_columns, batch in self._fetch_column_batches(query, self.fetch_batch_size,
+                                                                       max_rows, max_bytes, status,
+                                                                       cancel_token, timeout_seconds):
+                    if columns is None:
+                        columns = batch_columns
+                        column_data = [[] for _ in columns]
+                    for values, column_values in zip(column_data, batch):
+                        values.extend(column_values)
+                    stats.update(batch_columns, batch)
+                span.set(rows=status.get("rows", 0), bytes=status.get("bytes", 0),
+                         truncated=status.get("truncated", False))
+                if status.get("estimate") is not None:
+                    span.set(estimated_rows=status["estimate"].estimated_rows,
+                             estimated_cost=status["estimate"].estimated_cost)
+
+            if columns is None:
+                columns = status.get("columns", [])
+                column_data = [[] for _ in columns]
+
+            with self.instrumentation.span("dataframe_build", rows=status.get("rows", 0)):
+                # Build by position so duplicate or blank column names survive
+                df = pd.DataFrame({position: values for position, values in enumerate(column_data)})
+                df.columns = columns
+                df.attrs["truncated"] = status.get("truncated", False)
+                df.attrs["rows_fetched"] = status.get("rows", 0)
+                df.attrs["bytes_fetched"] = status.get("bytes", 0)
+                df.attrs["summary"] = dict(stats.summary(), truncated=df.attrs["truncated"])
+
+            self.instrumentation.debug("DataFrame created with shape: %s", df.shape)
+            if df.attrs["truncated"]:
+                self.instrumentation.debug("Result truncated after %d rows / %d bytes",
+                                           df.attrs["rows_fetched"], df.attrs["bytes_fetched"])
+            self.result_cache.put(cache_key, df, ResultCache.ResultCache.referenced_tables(normalized_query))
+            return df
+
+        except Exception as e:
+            print(f"Error Query execution failed: {str(e)}")
+            return None
+
+    async def execute_query_async(self, query: str, max_rows: int = None, max_bytes: int = None,
+                                  cancel_token: QueryCostGuard.CancellationToken = None,
+                                  timeout_seconds: int = None) -> pd.DataFrame:
+        """execute_query for asyncio callers; cancelling the awaiting task cancels the query.
+        Raises AsyncQueryExecutor.QueryQueueFull when too many queries are waiting"""
+        return await self.async_queries.execute_query(query, max_rows, max_bytes, cancel_token, timeout_seconds)
+
+    async def get_summary_async(self, query: str, top_k: int = 5,
+                                cancel_token: QueryCostGuard.CancellationToken = None,
+                                timeout_seconds: int = None) -> Dict:
+        return await self.async_queries.get_summary(query, top_k, cancel_token, timeout_seconds)
+
+    def estimate_query(self, query: str) -> QueryCostGuard.PlanEstimate:
+        """Estimated plan of the whole query (no automatic TOP), None if it cannot be estimated"""
+        try:
+            with self.connection() as conn:
+                return self.cost_guard.estimate(conn.cursor(), query)
+        except Exception as e:
+            print(f"Error Query estimation failed: {str(e)}")
+            return None
+
+    def paginate(self, query: str, page_size: int = 100) -> PagedResult.PagedResult:
+        """Browse a query result page by page without materializing it, see PagedResult"""
+        try:
+            return PagedResult.PagedResult(self, query, page_size)
+        except Exception as e:
+            print(f"Error Query pagination failed: {str(e)}")
+            return None
+
+    def get_summary(self, query: str, top_k: int = 5, cancel_token: QueryCostGuard.CancellationToken = None,
+                    timeout_seconds: int = None) -> Dict:
+        """Descriptive statistics of a query's result computed on the server.
+
+        The query runs once into a temp table that is summarized with SQL aggregates (counts,
+        min/max, avg/stdev, APPROX_COUNT_DISTINCT and the most frequent values), so only the
+        summary crosses the wire. The shape matches df.attrs["summary"] from execute_query.
+        The whole query is summarized, so it is cost-checked without an automatic TOP.
+        """
         try:
-            with pyodbc.connect(self.connection_string) as conn:
+            with self.instrumentation.span("db_summary") as span, self.connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute(query)                
-
-                # Fetch results
-                results = cursor.fetchall()
-
-                # print("Fetched Results:")
-                for row in results[:1]:  # Show the first 1 rows for debugging
-                    print(row)
-
-                # Fetch column names
-                columns = [column[0] for column in cursor.description]                
-
-                # Check if the result set is empty
-                if len(results) == 0:
-                    print("No results found.")
-                    return pd.DataFrame()  # Return an empty DataFrame if no results        
-                
-                # Check if the number of columns matches the number of columns in the first row
-                if len(columns) == len(results[0]):
-                    # Create a pandas DataFrame from the fetched data
-                    data = [list(row) for row in results]
-                    df = pd.DataFrame(data, columns=columns)
-                    print(f"DataFrame created with shape: {df.shape}")
-                    return df
-                else:
-                    print(f"Error: Column count {len(columns)} does not match row shape {len(results[0])}")
-                    return pd.DataFrame()  # Return empty DataFrame in case of mismatch
-            
+                estimate = self._check_cost(cursor, query)
+                if estimate is not None:
+                    span.set(estimated_rows=estimate.estimated_rows, estimated_cost=estimate.estimated_cost)
+                with self.cost_guard.guarded(conn, cursor, cancel_token, timeout_seconds):
+                    summary = self._summarize(cursor, query, top_k)
+                span.set(rows=summary["row_count"], columns=len(summary["columns"]))
+                return summary
         except Exception as e:
-            print(f"Error Query execution failed: {str(e)}")
+            print(f"Error Query summary failed: {str(e)}")
             return None
-        
-    
-            
+
+    def _summarize(self, cursor, query: str, top_k: int) -> Dict:
+        described = [row for row in cursor.execute(
+            "EXEC sp_describe_first_result_set @tsql = ?", SqlRewriter.clean(query)).fetchall()
+            if not row.is_hidden]
+        names = StreamingStats.unique_column_names([row.name for row in described])
+        types = [row.system_type_name.split("(")[0].lower() for row in described]
+        aliases = [f"c{position}" for position in range(len(described))]
+
+        # The query runs once into a temp table; the aggregates and every top-values branch read
+        # that instead of evaluating the query again (a CTE is inlined into each reference)
+        drop = f"IF OBJECT_ID('tempdb..{self.SUMMARY_TABLE}') IS NOT NULL DROP TABLE {self.SUMMARY_TABLE}"
+        cursor.execute(drop)
+        cursor.execute(SqlRewriter.wrap_as_cte(query, "q", aliases) + f"SELECT * INTO {self.SUMMARY_TABLE} FROM [q]")
+        try:
+            try:
+                aggregates = self._fetch_summary_aggregates(cursor, aliases, types, approximate=True)
+            except pyodbc.Error:
+                # APPROX_COUNT_DISTINCT needs SQL Server 2019+
+                aggregates = self._fetch_summary_aggregates(cursor, aliases, types, approximate=False)
+
+            top_values = {}
+            branches = [
+                f"""SELECT {position} AS column_index, value, frequency FROM (
+                    SELECT TOP ({int(top_k)}) CAST([{alias}] AS NVARCHAR(400)) AS value, COUNT_BIG(*) AS frequency
+                    FROM {self.SUMMARY_TABLE} GROUP BY [{alias}] ORDER BY COUNT_BIG(*) DESC) AS top_{position}"""
+                for position, (alias, data_type) in enumerate(zip(aliases, types))
+                if data_type not in self.NUMERIC_TYPES and data_type not in self.UNGROUPABLE_TYPES
+            ]
+            if branches:
+                for position, value, frequency in cursor.execute("\nUNION ALL\n".join(branches)).fetchall():
+                    top_values.setdefault(position, {})[value] = frequency
+        finally:
+            # Pooled connections keep their session, and with it the temp table
+            cursor.execute(drop)
+
+        row_count = aggregates.pop("row_count")
+        columns = {}
+        for position, name in enumerate(names):
+            column = {key: aggregates.get(f"{key}_{position}")
+                      for key in ("count", "min", "max", "mean", "std", "approx_distinct")
+                      if f"{key}_{position}" in aggregates}
+            column["nulls"] = row_count - column["count"]
+            if position in top_values:
+                column["top_values"] = top_values[position]
+            columns[name] = column
+        return {"row_count": row_count, "columns": columns, "truncated": False, "computed_on": "server"}
+
+    def _fetch_summary_aggregates(self, cursor, aliases: List[str], types: List[str], approximate: bool) -> Dict:
+        expressions = ["COUNT_BIG(*) AS [row_count]"]
+        for position, (alias, data_type) in enumerate(zip(aliases, types)):
+            column = f"[{alias}]"
+            expressions.append(f"COUNT_BIG({column}) AS [count_{position}]")
+            if data_type in self.UNGROUPABLE_TYPES:
+                continue
+            distinct = f"APPROX_COUNT_DISTINCT({column})" if approximate else f"COUNT_BIG(DISTINCT {column})"
+            expressions.append(f"{distinct} AS [approx_distinct_{position}]")
+            if data_type != "bit":
+                expressions.append(f"MIN({column}) AS [min_{position}]")
+                expressions.append(f"MAX({column}) AS [max_{position}]")
+            if data_type in self.NUMERIC_TYPES:
+                expressions.append(f"AVG(CAST({column} AS FLOAT)) AS [mean_{position}]")
+                expressions.append(f"STDEV(CAST({column} AS FLOAT)) AS [std_{position}]")
+        cursor.execute("SELECT\n    " + ",\n    ".join(expressions) + f"\nFROM {self.SUMMARY_TABLE}")
+        names = [column[0] for column in cursor.description]
+        return dict(zip(names, cursor.fetchone()))
+
+    def iter_query_batches(self, query: str, batch_size: int = None, max_rows: int = None,
+                           max_bytes: int = None, status: Dict = None,
+                           cancel_token: QueryCostGuard.CancellationToken = None,
+                           timeout_seconds: int = None) -> Iterator[pd.DataFrame]:
+        """Yield the result of a query as one DataFrame per fetched batch.
+
+        Pass a dict as `status` to read the rows/bytes fetched and the truncated flag
+        once the generator is exhausted.
+        """
+        for columns, batch in self._fetch_column_batches(query, batch_size or self.fetch_batch_size,
+                                                         max_rows, max_bytes, status,
+                                                         cancel_token, timeout_seconds):
+            df = pd.DataFrame({position: values for position, values in enumerate(batch)})
+            df.columns = columns
+            yield df
+
+    def _check_cost(self, cursor, query: str):
+        """Estimate the query's plan and raise QueryCostGuard.QueryRejected if it is too expensive"""
+        if not self.cost_guard.enabled:
+            return None
+        estimate = self.cost_guard.estimate(cursor, query)
+        self.cost_guard.check(estimate)
+        return estimate
+
+    def _fetch_column_batches(self, query: str, batch_size: int, max_rows: int = None,
+                              max_bytes: int = None, status: Dict = None,
+                              cancel_token: QueryCostGuard.CancellationToken = None,
+                              timeout_seconds: int = None, params: Sequence = (),
+                              check_cost: bool = True) -> Iterator[Tuple[List[str], List[tuple]]]:
+        """Fetch a query with fetchmany and yield (columns, column-major batch) pairs"""
+        max_rows = self.max_rows if max_rows is None else max_rows
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        status = {} if status is None else status
+        status.update(rows=0, bytes=0, truncated=False)
+        # One row past max_rows so truncation is still detected; gives the optimizer a row goal
+        query = self.cost_guard.limit(query, max_rows + 1 if max_rows else None)
+
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            status["estimate"] = self._check_cost(cursor, query) if check_cost else None
+            with self.cost_guard.guarded(conn, cursor, cancel_token, timeout_seconds):
+                yield from self._fetch_guarded(cursor, query, params, batch_size, max_rows, max_bytes, status,
+                                               cancel_token)
+
+    def _fetch_guarded(self, cursor, query: str, params: Sequence, batch_size: int, max_rows: int,
+                       max_bytes: int, status: Dict, cancel_token: QueryCostGuard.CancellationToken = None):
+        """Run the query on a guarded cursor and yield its batches within the row and byte budgets"""
+        cursor.execute(query, *params)
+        if cursor.description is None:
+            status["columns"] = []
+            return
+        columns = [column[0] for column in cursor.description]
+        status["columns"] = columns
+
+        try:
+            while True:
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+                size = batch_size
+                if max_rows:
+                    size = min(size, max_rows - status["rows"])
+                rows = cursor.fetchmany(size)
+                if not rows:
+                    break
+
+                batch = list(zip(*rows))
+                column_bytes = [sum(map(sys.getsizeof, values)) for values in batch]
+                if max_bytes and status["bytes"] + sum(column_bytes) > max_bytes:
+                    # Keep only the rows that still fit in the byte budget
+                    keep = self._rows_within_budget(rows, max_bytes - status["bytes"])
+                    batch = [values[:keep] for values in batch]
+                    column_bytes = [sum(map(sys.getsizeof, values)) for values in batch]
+                    status["truncated"] = True
+
+                kept = len(batch[0]) if batch else 0
+                status["rows"] += kept
+                status["bytes"] += sum(column_bytes)
+                if kept:
+                    yield columns, batch
+
+                if status["truncated"]:
+                    break
+                if max_rows and status["rows"] >= max_rows:
+                    # Only report truncation if the server actually had more rows
+                    status["truncated"] = cursor.fetchone() is not None
+                    break
+        finally:
+            if status["truncated"]:
+                # Stop the server from producing the rest of the result
+                try:
+                    cursor.cancel()
+                except Exception:
+                    pass
+            cursor.close()
+
+    @staticmethod
+    def _rows_within_budget(rows: list, budget: int) -> int:
+        used = 0
+        for count, row in enumerate(rows):
+            used += sum(map(sys.getsizeof, row))
+            if used > budget:
+                return count
+        return len(rows)
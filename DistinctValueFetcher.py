@@ -0,0 +1,98 @@
+import sys
+import threading
+from typing import Dict, Tuple
+import SqlRewriter
+import SqlTypes
+
+
+class DistinctValueFetcher:
+    """Distinct values of text columns for the value index.
+
+    Only text columns are read, and columns whose cardinality is estimated above
+    `max_distinct` (keys, free text) are skipped; the skip decision is remembered. Values
+    are not kept here: the ValueIndex is their only in-memory copy and enforces the budget.
+    """
+
+    def __init__(self, db_connection_manager, schema: dict, max_distinct: int = 10000, sample_rows: int = 50000):
+        self.db_connection_manager = db_connection_manager
+        self.schema = schema
+        self.max_distinct = max_distinct
+        self.sample_rows = sample_rows
+        self._skipped: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._stats = {"fetches": 0, "skipped_lookups": 0}
+
+    def fetch(self, table: str, column: str) -> Tuple[str, ...]:
+        """Distinct values of the column, or an empty tuple for columns not worth indexing"""
+        key = f"{table}.{column}"
+        with self._lock:
+            if key in self._skipped:
+                self._stats["skipped_lookups"] += 1
+                return ()
+
+        reason = self._skip_reason(table, column)
+        values = () if reason else self._fetch(table, column)
+        if values is None:
+            reason = f"more than {self.max_distinct} distinct values"
+        with self._lock:
+            if reason:
+                self._skipped[key] = reason
+                return ()
+            self._stats["fetches"] += 1
+            return values
+
+    def skipped_columns(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._skipped)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._stats, skipped=len(self._skipped))
+
+    def _skip_reason(self, table: str, column: str) -> str:
+        data_type = self.schema["tables"].get(table, {}).get("columns", {}).get(column)
+        if data_type is None or data_type.lower() not in SqlTypes.TEXT_TYPES:
+            return f"not a text column ({data_type})"
+        try:
+            with self.db_connection_manager.connection() as conn:
+                cursor = conn.cursor()
+                # Row count from the catalog; small tables can never be high-cardinality
+                row_count = cursor.execute(
+                    """
+                        SELECT SUM(ps.row_count)
+                        FROM sys.dm_db_partition_stats ps
+                        WHERE ps.object_id = OBJECT_ID(?) AND ps.index_id IN (0, 1)
+                    """, table).fetchone()[0] or 0
+                if row_count <= self.max_distinct:
+                    return ""
+                # Estimate the cardinality on a sample instead of scanning the table
+                distinct_in_sample = cursor.execute(
+                    f"""
+                        SELECT COUNT(DISTINCT {self._value_expression(column, data_type)})
+                        FROM (SELECT TOP (?) {SqlRewriter.quote(column)} FROM {SqlRewriter.quote(table)}) AS sample
+                    """, self.sample_rows).fetchone()[0]
+        except Exception as ex:
+            print(f"Unable to estimate the cardinality of {table}.{column}: {str(ex)}")
+            return ""
+        if distinct_in_sample > self.max_distinct:
+            return f"about {distinct_in_sample}+ distinct values"
+        return ""
+
+    def _fetch(self, table: str, column: str):
+        data_type = self.schema["tables"][table]["columns"][column]
+        query = f"""
+            SELECT DISTINCT TOP (?) {self._value_expression(column, data_type)}
+            FROM {SqlRewriter.quote(table)}
+            WHERE {SqlRewriter.quote(column)} IS NOT NULL
+        """
+        with self.db_connection_manager.connection() as conn:
+            rows = conn.cursor().execute(query, self.max_distinct + 1).fetchall()
+        if len(rows) > self.max_distinct:
+            return None
+        return tuple(sys.intern(str(row[0])) for row in rows)
+
+    def _value_expression(self, column: str, data_type: str) -> str:
+        # text / ntext cannot be compared, DISTINCT needs them cast first
+        if data_type.lower() in ("text", "ntext"):
+            return f"CAST({SqlRewriter.quote(column)} AS NVARCHAR(4000))"
+        return SqlRewriter.quote(column)
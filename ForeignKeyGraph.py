@@ -0,0 +1,113 @@
+from collections import defaultdict, deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+class ForeignKeyGraph:
+    """Adjacency-indexed foreign key graph with cached shortest join paths between tables"""
+
+    def __init__(self, relationships: Iterable[Dict] = None, max_hops: int = 4):
+        self.max_hops = max_hops
+        # Keyed by (table, column, referenced_table, referenced_column); dicts keep insertion order
+        self._relationships: Dict[Tuple[str, str, str, str], Dict] = {}
+        self._adjacency: Dict[str, Set[str]] = defaultdict(set)
+        self._edges: Dict[frozenset, List[Dict]] = defaultdict(list)
+        self._path_cache: Dict[Tuple[str, str], Optional[List[str]]] = {}
+        for relationship in relationships or ():
+            self.add(relationship)
+
+    @staticmethod
+    def _key(relationship: Dict) -> Tuple[str, str, str, str]:
+        return (relationship["table"], relationship["column"],
+                relationship["referenced_table"], relationship["referenced_column"])
+
+    def add(self, relationship: Dict) -> bool:
+        """Add a relationship, returns False if it was already known"""
+        key = self._key(relationship)
+        if key in self._relationships:
+            return False
+        self._relationships[key] = relationship
+        table, referenced_table = relationship["table"], relationship["referenced_table"]
+        self._adjacency[table].add(referenced_table)
+        self._adjacency[referenced_table].add(table)
+        self._edges[frozenset((table, referenced_table))].append(relationship)
+        self._path_cache.clear()
+        return True
+
+    def __contains__(self, relationship: Dict) -> bool:
+        return self._key(relationship) in self._relationships
+
+    def __len__(self) -> int:
+        return len(self._relationships)
+
+    @property
+    def relationships(self) -> List[Dict]:
+        return list(self._relationships.values())
+
+    def neighbours(self, table: str) -> Set[str]:
+        return self._adjacency.get(table, set())
+
+    def edges_between(self, table: str, other_table: str) -> List[Dict]:
+        return self._edges.get(frozenset((table, other_table)), [])
+
+    def join_path(self, source: str, target: str) -> Optional[List[str]]:
+        """Shortest list of tables joining source to target, or None if they don't connect"""
+        key = (source, target) if source <= target else (target, source)
+        if key not in self._path_cache:
+            self._path_cache[key] = self._shortest_path(*key)
+        path = self._path_cache[key]
+        if path is None or path[0] == source:
+            return path
+        return list(reversed(path))
+
+    def join_subgraph(self, tables: Iterable[str]) -> Dict:
+        """Approximately minimal set of tables and relationships connecting the given tables.
+
+        Tables are attached one by one to the growing tree through their shortest cached path;
+        tables that cannot be reached stay in the result on their own.
+        """
+        tables = list(dict.fromkeys(tables))
+        selected: List[str] = tables[:1]
+        included: Set[str] = set(selected)
+        for table in tables[1:]:
+            if table in included:
+                continue
+            best = None
+            for member in selected:
+                path = self.join_path(member, table)
+                if path is not None and (best is None or len(path) < len(best)):
+                    best = path
+            for node in best or [table]:
+                if node not in included:
+                    included.add(node)
+                    selected.append(node)
+
+        relationships = []
+        seen_pairs = set()
+        for table in selected:
+            for neighbour in self._adjacency.get(table, set()) & included:
+                pair = frozenset((table, neighbour))
+                if pair not in seen_pairs:
+                    seen_pairs.add(pair)
+                    relationships.extend(self._edges[pair])
+        return {"tables": selected, "relationships": relationships}
+
+    def _shortest_path(self, source: str, target: str) -> Optional[List[str]]:
+        if source == target:
+            return [source]
+        parents = {source: None}
+        queue = deque([(source, 0)])
+        while queue:
+            table, depth = queue.popleft()
+            if depth == self.max_hops:
+                continue
+            for neighbour in self._adjacency.get(table, ()):
+                if neighbour in parents:
+                    continue
+                parents[neighbour] = table
+                if neighbour == target:
+                    path = [neighbour]
+                    while parents[path[-1]] is not None:
+                        path.append(parents[path[-1]])
+                    return list(reversed(path))
+                queue.append((neighbour, depth + 1))
+        return None
@@ -0,0 +1,193 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence
+
+
+class Span:
+    """One timed stage of a request with its counters (tokens, rows, bytes, cache hits)"""
+
+    __slots__ = ("name", "started_at", "duration_seconds", "attributes", "error")
+
+    def __init__(self, name: str, attributes: Dict = None):
+        self.name = name
+        self.started_at = time.time()
+        self.duration_seconds = 0.0
+        self.attributes = dict(attributes) if attributes else {}
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, key: str, amount: float = 1):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def to_dict(self) -> Dict:
+        record = {"span": self.name, "started_at": self.started_at,
+                  "duration_ms": round(self.duration_seconds * 1000, 3)}
+        record.update(self.attributes)
+        if self.error:
+            record["error"] = self.error
+        return record
+
+
+class LogSink:
+    """Write every finished span as one JSON line to a logger"""
+
+    def __init__(self, logger: logging.Logger = None, level: int = logging.INFO):
+        self.logger = logger or logging.getLogger("insights.spans")
+        self.level = level
+
+    def emit(self, span: Span):
+        if self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, json.dumps(span.to_dict(), default=str))
+
+
+class RingBufferSink:
+    """Keep the most recent spans in memory, e.g. for a debug panel"""
+
+    def __init__(self, capacity: int = 1000):
+        self._spans = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def emit(self, span: Span):
+        with self._lock:
+            self._spans.append(span)
+
+    def spans(self, name: str = None) -> List[Span]:
+        with self._lock:
+            spans = list(self._spans)
+        return [span for span in spans if name is None or span.name == name]
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+
+class PrometheusSink:
+    """Aggregate spans into counters and duration histograms, exported in the Prometheus text format"""
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+    # Numeric span attributes exported as counters
+    COUNTERS = ("prompt_tokens", "completion_tokens", "rows", "bytes")
+
+    def __init__(self, prefix: str = "insights", buckets: Sequence[float] = BUCKETS):
+        self.prefix = prefix
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._bucket_counts: Dict[str, List[int]] = {}
+        self._duration_sums: Dict[str, float] = defaultdict(float)
+        self._span_counts: Dict[str, int] = defaultdict(int)
+        self._errors: Dict[str, int] = defaultdict(int)
+        self._counters: Dict[tuple, float] = defaultdict(float)
+        self._cache_lookups: Dict[tuple, int] = defaultdict(int)
+
+    def emit(self, span: Span):
+        with self._lock:
+            counts = self._bucket_counts.setdefault(span.name, [0] * len(self.buckets))
+            for position, bound in enumerate(self.buckets):
+                if span.duration_seconds <= bound:
+                    counts[position] += 1
+            self._duration_sums[span.name] += span.duration_seconds
+            self._span_counts[span.name] += 1
+            if span.error:
+                self._errors[span.name] += 1
+            for key in self.COUNTERS:
+                value = span.attributes.get(key)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    self._counters[(key, span.name)] += value
+            if "cache_hit" in span.attributes:
+                result = "hit" if span.attributes["cache_hit"] else "miss"
+                self._cache_lookups[(span.name, result)] += 1
+
+    def export(self) -> str:
+        prefix = self.prefix
+        lines = [f"# HELP {prefix}_span_duration_seconds Duration of instrumented stages",
+                 f"# TYPE {prefix}_span_duration_seconds histogram"]
+        with self._lock:
+            for name in sorted(self._span_counts):
+                for bound, count in zip(self.buckets, self._bucket_counts[name]):
+                    lines.append(f'{prefix}_span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {count}')
+                lines.append(f'{prefix}_span_duration_seconds_bucket{{span="{name}",le="+Inf"}} '
+                             f'{self._span_counts[name]}')
+                lines.append(f'{prefix}_span_duration_seconds_sum{{span="{name}"}} {self._duration_sums[name]}')
+                lines.append(f'{prefix}_span_duration_seconds_count{{span="{name}"}} {self._span_counts[name]}')
+
+            lines += [f"# HELP {prefix}_span_errors_total Stages that raised",
+                      f"# TYPE {prefix}_span_errors_total counter"]
+            lines += [f'{prefix}_span_errors_total{{span="{name}"}} {count}'
+                      for name, count in sorted(self._errors.items())]
+
+            for key in self.COUNTERS:
+                values = sorted((name, value) for (counter, name), value in self._counters.items()
+                                if counter == key)
+                if not values:
+                    continue
+                lines += [f"# TYPE {prefix}_{key}_total counter"]
+                lines += [f'{prefix}_{key}_total{{span="{name}"}} {value:g}' for name, value in values]
+
+            lines += [f"# HELP {prefix}_cache_lookups_total Cache lookups per stage and result",
+                      f"# TYPE {prefix}_cache_lookups_total counter"]
+            lines += [f'{prefix}_cache_lookups_total{{span="{name}",result="{result}"}} {count}'
+                      for (name, result), count in sorted(self._cache_lookups.items())]
+        return "\n".join(lines) + "\n"
+
+
+class Instrumentation:
+    """Spans around the pipeline stages, fanned out to pluggable sinks.
+
+    A sink is any object with an `emit(span)` method. Without sinks a span costs two clock
+    reads. Debug output goes through `debug()` and is only formatted when enabled
+    (INSIGHTS_DEBUG=1 or debug=True).
+    """
+
+    def __init__(self, sinks: Sequence = (), debug: bool = None):
+        self._sinks = list(sinks)
+        if debug is None:
+            debug = os.getenv("INSIGHTS_DEBUG", "").lower() in ("1", "true", "yes")
+        self.debug_enabled = debug
+
+    def add_sink(self, sink):
+        # Replace the list instead of mutating it so emitting threads never see a partial update
+        self._sinks = self._sinks + [sink]
+        return sink
+
+    def remove_sink(self, sink):
+        self._sinks = [existing for existing in self._sinks if existing is not sink]
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        span = Span(name, attributes)
+        started = time.perf_counter()
+        try:
+            yield span
+        except GeneratorExit:
+            # A streaming consumer stopped early, not a failure of the stage
+            raise
+        except BaseException as ex:
+            span.error = type(ex).__name__
+            raise
+        finally:
+            span.duration_seconds = time.perf_counter() - started
+            self._emit(span)
+
+    def _emit(self, span: Span):
+        for sink in self._sinks:
+            try:
+                sink.emit(span)
+            except Exception as ex:
+                print(f"Span sink failed: {str(ex)}")
+
+    def debug(self, message: str, *args):
+        """print() for diagnostics; the message is only %-formatted when debugging is enabled"""
+        if self.debug_enabled:
+            print(message % args if args else message)
+
+
+# Shared by the generator and the connection manager unless they are given their own
+default_instrumentation = Instrumentation(
+    [LogSink()] if os.getenv("INSIGHTS_SPAN_LOG", "").lower() in ("1", "true", "yes") else [])
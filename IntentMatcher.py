@@ -0,0 +1,217 @@
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import ForeignKeyGraph
+import SchemaRetriever
+import SqlRewriter
+import SqlTypes
+
+NUMERIC_TYPES = SqlTypes.NUMERIC_TYPES
+UNGROUPABLE_TYPES = SqlTypes.UNGROUPABLE_TYPES
+
+_COUNT = re.compile(r"^(?:how many|count(?: the| all)?|(?:what is |what's )?the (?:number|count) of|number of)\s+"
+                    r"(?P<x>.+?)(?:\s+(?:are there|are there in total|do we have|exist|in total|there are))?$")
+_TOP = re.compile(r"^(?:(?:show|list|get|find|give me|what are|which are)\s+)?(?:me\s+)?(?:the\s+)?"
+                  r"top\s+(?P<n>\d{1,5})\s+(?P<x>.+?)\s+by\s+(?P<y>.+?)$")
+_TOTAL = re.compile(r"^(?:(?:show|list|get|give me|what is|what's|what are)\s+)?(?:me\s+)?(?:the\s+)?"
+                    r"(?:total|sum of(?: the)?)\s+(?P<y>.+?)\s+(?:per|by|for each|for every|grouped by)\s+"
+                    r"(?P<x>.+?)$")
+# Words that can start a noun phrase without changing its meaning
+_LEADING_FILLERS = ("the", "all", "our", "my")
+_COUNT_MEASURE = re.compile(r"^(?:(?:the\s+)?(?:number|count) of\s+(?P<a>.+)|(?P<b>.+?)\s+count)$")
+
+
+@dataclass
+class IntentMatch:
+    intent: str
+    sql: str
+    tables: List[str]
+    reasoning: str
+
+
+class IntentMatcher:
+    """Answers the most common question shapes from the schema alone, without the LLM.
+
+    Recognized: "how many X", "top N X by Y" and "total Y per X", over one table or a table
+    and the table its single foreign key references. A match is only returned when every
+    word of the question maps to exactly one table or column; anything else (filters,
+    ambiguous names, several join paths) returns None and goes to the LLM.
+    """
+
+    def __init__(self, schema: dict, fk_graph: ForeignKeyGraph.ForeignKeyGraph = None):
+        self.schema = schema or {"tables": {}, "relationships": []}
+        self.fk_graph = fk_graph or ForeignKeyGraph.ForeignKeyGraph(self.schema["relationships"])
+        self._tables: Dict[Tuple[str, ...], List[str]] = defaultdict(list)
+        # Column phrases, both bare ("amount") and qualified by their table ("order amount")
+        self._columns: Dict[Tuple[str, ...], List[Tuple[str, str]]] = defaultdict(list)
+        for table, info in self.schema["tables"].items():
+            table_terms = tuple(SchemaRetriever.terms(table))
+            self._tables[table_terms].append(table)
+            for column in info["columns"]:
+                column_terms = tuple(SchemaRetriever.terms(column))
+                self._columns[column_terms].append((table, column))
+                if column_terms[:len(table_terms)] != table_terms:
+                    self._columns[table_terms + column_terms].append((table, column))
+
+    def match(self, question: str) -> Optional[IntentMatch]:
+        text = " ".join(re.sub(r"[?.!]+$", "", question.strip().lower()).split())
+        for pattern, handler in ((_TOP, self._match_top), (_TOTAL, self._match_total), (_COUNT, self._match_count)):
+            found = pattern.match(text)
+            if found:
+                return handler(found)
+        return None
+
+    def _match_count(self, found: re.Match) -> Optional[IntentMatch]:
+        table = self._resolve_table(found.group("x"))
+        if table is None:
+            return None
+        alias = SqlRewriter.quote(f"{table}Count")
+        return IntentMatch("count", f"SELECT COUNT(*) AS {alias} FROM {SqlRewriter.quote(table)}", [table],
+                           f"Counts the rows of {table}")
+
+    def _match_top(self, found: re.Match) -> Optional[IntentMatch]:
+        table = self._resolve_table(found.group("x"))
+        if table is None:
+            return None
+        top = int(found.group("n"))
+        if top <= 0:
+            return None
+        y = found.group("y")
+
+        # "top 5 customers by number of orders": rank by the rows of a referencing table
+        count_phrase = _COUNT_MEASURE.match(y)
+        if count_phrase:
+            child = self._resolve_table(count_phrase.group("a") or count_phrase.group("b"))
+            edge = self._single_reference(child, table) if child else None
+            if edge is None:
+                return None
+            measure = SqlRewriter.quote(f"{child}Count")
+            return self._grouped_by_table("top_n", table, child, edge, f"COUNT(*) AS {measure}", measure, top,
+                                          f"Top {top} {table} by number of {child}")
+
+        column = self._resolve_column(y, [table])
+        if column is not None:
+            data_type = self.schema["tables"][table]["columns"][column].lower()
+            if data_type in UNGROUPABLE_TYPES:
+                return None
+            sql = (f"SELECT TOP ({top}) * FROM {SqlRewriter.quote(table)}\n"
+                   f"ORDER BY {SqlRewriter.quote(column)} DESC")
+            return IntentMatch("top_n", sql, [table], f"Top {top} {table} by {column}")
+
+        # "top 5 customers by amount" where Amount lives on a table referencing Customers
+        children = [child for child in self.fk_graph.neighbours(table) if self._single_reference(child, table)]
+        measure = self._resolve_column(y, children, numeric=True)
+        if measure is None:
+            return None
+        child, column = measure
+        alias = SqlRewriter.quote(f"Total{column}")
+        return self._grouped_by_table("top_n", table, child, self._single_reference(child, table),
+                                      f"SUM(t.{SqlRewriter.quote(column)}) AS {alias}", alias, top,
+                                      f"Top {top} {table} by total {column} of {child}")
+
+    def _match_total(self, found: re.Match) -> Optional[IntentMatch]:
+        x, y = found.group("x"), found.group("y")
+        group_table = self._resolve_table(x)
+        if group_table is not None:
+            # The named table's own column wins over a same-named one on a referencing table
+            own = self._resolve_column(y, [group_table], numeric=True)
+            if own is not None:
+                return self._total_per_row(group_table, own[1])
+            # Total of a column on a table that references the grouping table
+            children = [child for child in self.fk_graph.neighbours(group_table)
+                        if self._single_reference(child, group_table)]
+            measure = self._resolve_column(y, children, numeric=True)
+            if measure is None:
+                return None
+            child, column = measure
+            alias = SqlRewriter.quote(f"Total{column}")
+            return self._grouped_by_table("total_per", group_table, child,
+                                          self._single_reference(child, group_table),
+                                          f"SUM(t.{SqlRewriter.quote(column)}) AS {alias}", alias, None,
+                                          f"Total {column} of {child} per {group_table}")
+
+        # Total of a column grouped by another column of the same table
+        measure = self._resolve_column(y, list(self.schema["tables"]), numeric=True)
+        if measure is None:
+            return None
+        table, column = measure
+        group_column = self._resolve_column(x, [table])
+        if group_column is None or group_column == column:
+            return None
+        if self.schema["tables"][table]["columns"][group_column].lower() in UNGROUPABLE_TYPES:
+            return None
+        alias = SqlRewriter.quote(f"Total{column}")
+        group = SqlRewriter.quote(group_column)
+        sql = (f"SELECT {group}, SUM({SqlRewriter.quote(column)}) AS {alias}\n"
+               f"FROM {SqlRewriter.quote(table)}\nGROUP BY {group}\nORDER BY {alias} DESC")
+        return IntentMatch("total_per", sql, [table], f"Total {column} per {group_column} of {table}")
+
+    def _total_per_row(self, table: str, column: str) -> Optional[IntentMatch]:
+        """Total of a column per row of its own table, identified by its key and label"""
+        referenced = list(dict.fromkeys(edge["referenced_column"] for child in self.fk_graph.neighbours(table)
+                                        for edge in self.fk_graph.edges_between(child, table)
+                                        if edge["referenced_table"] == table))
+        if len(referenced) != 1 or column in referenced:
+            # No single key to group on, or the measure is the key itself
+            return None
+        keys = referenced
+        label = self._label_column(table)
+        if label and label not in keys:
+            keys.append(label)
+        group = ", ".join(SqlRewriter.quote(key) for key in keys)
+        alias = SqlRewriter.quote(f"Total{column}")
+        sql = (f"SELECT {group}, SUM({SqlRewriter.quote(column)}) AS {alias}\n"
+               f"FROM {SqlRewriter.quote(table)}\nGROUP BY {group}\nORDER BY {alias} DESC")
+        return IntentMatch("total_per", sql, [table], f"Total {column} per row of {table}")
+
+    def _grouped_by_table(self, intent: str, table: str, child: str, edge: Dict, aggregate: str, order: str,
+                          top: Optional[int], reasoning: str) -> IntentMatch:
+        """Aggregate the rows of `child` per row of `table`, which child references through `edge`"""
+        keys = [f"x.{SqlRewriter.quote(edge['referenced_column'])}"]
+        label = self._label_column(table)
+        if label and label != edge["referenced_column"]:
+            keys.append(f"x.{SqlRewriter.quote(label)}")
+        top_clause = f"TOP ({top}) " if top else ""
+        sql = (f"SELECT {top_clause}{', '.join(keys)}, {aggregate}\n"
+               f"FROM {SqlRewriter.quote(table)} AS x\n"
+               f"INNER JOIN {SqlRewriter.quote(child)} AS t ON t.{SqlRewriter.quote(edge['column'])} = "
+               f"x.{SqlRewriter.quote(edge['referenced_column'])}\n"
+               f"GROUP BY {', '.join(keys)}\nORDER BY {order} DESC")
+        return IntentMatch(intent, sql, [table, child], reasoning)
+
+    def _resolve_table(self, phrase: str) -> Optional[str]:
+        tables = self._tables.get(self._phrase_terms(phrase), [])
+        return tables[0] if len(tables) == 1 else None
+
+    def _resolve_column(self, phrase: str, tables: List[str], numeric: bool = False):
+        """The one column of the given tables named by the phrase; (table, column) when numeric"""
+        allowed = set(tables)
+        candidates = [(table, column) for table, column in self._columns.get(self._phrase_terms(phrase), [])
+                      if table in allowed
+                      and (not numeric or self.schema["tables"][table]["columns"][column].lower() in NUMERIC_TYPES)]
+        candidates = list(dict.fromkeys(candidates))
+        if len(candidates) != 1:
+            return None
+        return candidates[0] if numeric else candidates[0][1]
+
+    def _single_reference(self, child: str, table: str) -> Optional[Dict]:
+        """The foreign key from child to table, if there is exactly one"""
+        edges = [edge for edge in self.fk_graph.edges_between(child, table)
+                 if edge["table"] == child and edge["referenced_table"] == table]
+        return edges[0] if len(edges) == 1 and child != table else None
+
+    def _label_column(self, table: str) -> Optional[str]:
+        """A human readable column to show next to the key, e.g. Name or Title"""
+        for column, data_type in self.schema["tables"][table]["columns"].items():
+            if (data_type.lower() in SqlTypes.TEXT_TYPES and data_type.lower() not in UNGROUPABLE_TYPES
+                    and set(SchemaRetriever.terms(column)) & {"name", "title"}):
+                return column
+        return None
+
+    @staticmethod
+    def _phrase_terms(phrase: str) -> Tuple[str, ...]:
+        words = phrase.split()
+        while words and words[0] in _LEADING_FILLERS:
+            words = words[1:]
+        return tuple(SchemaRetriever.terms(" ".join(words)))
@@ -0,0 +1,248 @@
+import json
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Tuple
+import SchemaRetriever
+
+# Imperative verbs that ask to change the database rather than read it
+ADMIN_VERBS = ("delete", "drop", "insert", "truncate", "update", "alter", "remove", "modify", "rename",
+               "grant", "revoke", "shutdown", "kill", "exec", "execute", "merge", "purge", "wipe")
+# SQL syntax that is a write or an administrative command wherever it appears
+ADMIN_PHRASES = ("delete from", "drop table", "drop database", "drop view", "drop schema", "insert into",
+                 "truncate table", "alter table", "alter database", "create table", "create view",
+                 "create index", "create login", "create user", "create database", "grant select",
+                 "grant all", "xp cmdshell", "shutdown with nowait", "exec sp", "update statistics")
+# Phrasing that only asks about the database itself rather than its data (validator prompt rules 8-9)
+METADATA_PHRASES = ("column name", "table name", "data type", "primary key", "foreign key", "list table",
+                    "list all table", "all table", "how many table", "how many column", "database schema",
+                    "table schema", "table structure", "table definition", "schema of")
+# Words that ask about structure only when they are about a table, column or database ("describe the
+# orders table"); on their own ("describe the sales trend per region") the LLM decides
+METADATA_CUES = ("describe", "structure", "definition", "column of", "what table", "which table")
+STRUCTURE_WORDS = ("table", "column", "database", "schema", "field")
+# Cues whose structure word is their own object ("which table has the most orders"): always left to the LLM
+OPEN_METADATA_CUES = ("what table", "which table")
+# "What is Product?": asks what the table is, not for its data (validator prompt rule 7)
+WHAT_IS_PREFIXES = (("what", "is"), ("what", "s"), ("what", "are"), ("who", "is"), ("define",), ("explain",))
+ARTICLES = ("the", "a", "an")
+# "drop in sales", "change of price": the verb is a noun here
+NOUN_FOLLOWERS = ("in", "of", "off", "rate", "by", "per", "since", "over", "trend", "count", "between")
+# Objects that make a leading verb an operation on data: "delete all records", "drop the table"
+DATA_WORDS = ("record", "row", "data", "table", "entry", "everything", "all", "database", "column", "view")
+ANALYTICAL_TERMS = ("how many", "count", "list", "show", "find", "get", "what", "which", "total", "sum",
+                    "average", "top", "per", "trend", "compare")
+
+
+def load_synonyms(path: str = None) -> Dict[str, str]:
+    """Business term -> "Table" or "Table.Column" from a JSON file, e.g. {"clients": "Customers"}"""
+    if not path:
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as synonyms_file:
+            return {str(term): str(target) for term, target in json.load(synonyms_file).items()}
+    except (OSError, ValueError, AttributeError) as ex:
+        print(f"Unable to load business synonyms from {path}: {str(ex)}")
+        return {}
+
+
+class AhoCorasick:
+    """Multi-pattern matcher: all patterns are found in one pass over the text"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._outputs: List[List[Tuple[int, object]]] = [[]]
+        self._built = False
+
+    def add(self, pattern: str, value):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+            state = next_state
+        self._outputs[state].append((len(pattern), value))
+        self._built = False
+
+    def build(self):
+        """Compute failure links breadth-first; outputs of suffix states are merged in"""
+        queue = deque(self._goto[0].values())
+        for state in queue:
+            self._fail[state] = 0
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._outputs[next_state] = self._outputs[next_state] + self._outputs[self._fail[next_state]]
+        self._built = True
+
+    def find(self, text: str) -> Iterator[Tuple[int, int, object]]:
+        """Yield (start, end, value) for every occurrence of every pattern"""
+        if not self._built:
+            self.build()
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for length, value in self._outputs[state]:
+                yield position + 1 - length, position + 1, value
+
+
+@dataclass
+class Classification:
+    decision: str  # "accept", "reject" or "ambiguous"
+    reason: str
+    tables: List[str] = field(default_factory=list)
+    analytical: bool = False
+
+
+class KeywordClassifier:
+    """Local pre-check of a question before the LLM validator.
+
+    One Aho-Corasick automaton holds the table names, column names and business synonyms
+    (singular/plural folded) plus administrative and metadata phrases. Only explicit
+    requests to change the database or to describe its structure are rejected; questions
+    asking for data (an analytical term plus a table, synonym or column) are accepted;
+    everything else, including questions that merely contain a metadata word, is
+    "ambiguous" and left to the LLM.
+    """
+
+    # Columns named in more tables than this (Id, Name, Status, ...) say nothing about the question
+    MAX_COLUMN_TABLES = 3
+
+    def __init__(self, schema: dict, synonyms: Dict[str, str] = None):
+        self.schema = schema or {"tables": {}, "relationships": []}
+        self._automaton = AhoCorasick()
+        for verb in ADMIN_VERBS:
+            self._automaton.add(self._pattern(verb), ("admin_verb", verb))
+        for phrase in ADMIN_PHRASES:
+            self._automaton.add(self._pattern(phrase), ("admin_phrase", phrase))
+        for phrase in METADATA_PHRASES:
+            self._automaton.add(self._pattern(phrase), ("metadata", phrase))
+        for cue in METADATA_CUES:
+            self._automaton.add(self._pattern(cue), ("metadata_cue", cue))
+        for word in STRUCTURE_WORDS:
+            self._automaton.add(self._pattern(word), ("structure_word", word))
+        for term in ANALYTICAL_TERMS:
+            self._automaton.add(self._pattern(term), ("analytical", term))
+        for word in DATA_WORDS:
+            self._automaton.add(self._pattern(word), ("data_word", word))
+
+        # Normalized table / synonym name -> table, for "what is <table>"
+        self._names: Dict[str, str] = {}
+        column_tables: Dict[str, set] = {}
+        for table, info in self.schema["tables"].items():
+            for name in self._name_forms(table):
+                self._automaton.add(name, ("table", table))
+                self._names[name.strip()] = table
+            for column in info["columns"]:
+                for name in self._name_forms(column):
+                    column_tables.setdefault(name, set()).add(table)
+        for name, tables in column_tables.items():
+            if len(tables) <= self.MAX_COLUMN_TABLES:
+                self._automaton.add(name, ("column", tuple(sorted(tables))))
+
+        for term, target in (synonyms or {}).items():
+            table = target.split(".")[0].strip("[]")
+            if table in self.schema["tables"]:
+                self._automaton.add(self._pattern(term), ("synonym", table))
+                self._names[self._pattern(term).strip()] = table
+        self._automaton.build()
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        # Padded with spaces so every pattern match falls on word boundaries
+        return " " + " ".join(SchemaRetriever.terms(text)) + " "
+
+    @classmethod
+    def _pattern(cls, phrase: str) -> str:
+        return cls._normalize(phrase)
+
+    @classmethod
+    def _name_forms(cls, name: str) -> List[str]:
+        """'OrderDetails' -> ' order detail ' and ' orderdetail ' (singular, split and joined)"""
+        words = SchemaRetriever.terms(name)
+        forms = {" " + " ".join(words) + " "}
+        if len(words) > 1:
+            forms.add(" " + SchemaRetriever.singularize("".join(SchemaRetriever.tokenize(name))) + " ")
+        return [form for form in forms if form.strip()]
+
+    def classify(self, question: str) -> Classification:
+        """Reasons are generic on purpose: they reach the user and must not expose table names"""
+        text = self._normalize(question)
+        tables: Dict[str, str] = {}
+        column_tables: List[Tuple[str, ...]] = []
+        analytical = False
+        metadata = False
+        cue_spans: List[Tuple[int, int]] = []
+        structure_cue = False
+        structure_words: List[int] = []
+        admin_phrase = False
+        # Start of each admin verb, and of each mention of data that such a verb could act on
+        admin_verbs: List[int] = []
+        data_mentions: List[int] = []
+
+        for start, end, (kind, value) in self._automaton.find(text):
+            if kind == "table" or kind == "synonym":
+                tables.setdefault(value, kind)
+                data_mentions.append(start)
+            elif kind == "column":
+                column_tables.append(value)
+                data_mentions.append(start)
+            elif kind == "data_word":
+                data_mentions.append(start)
+            elif kind == "analytical":
+                analytical = True
+            elif kind == "metadata":
+                metadata = True
+            elif kind == "metadata_cue":
+                cue_spans.append((start, end))
+                structure_cue = structure_cue or value not in OPEN_METADATA_CUES
+            elif kind == "structure_word":
+                structure_words.append(start)
+            elif kind == "admin_phrase":
+                admin_phrase = True
+            elif kind == "admin_verb":
+                following = text[end:].split()
+                if not following or following[0] not in NOUN_FOLLOWERS:
+                    admin_verbs.append(start)
+
+        # "how do I insert a new order": a write verb anywhere before the data it would change
+        if admin_phrase or any(verb < mention for verb in admin_verbs for mention in data_mentions):
+            return Classification("reject", "Question asks to modify the database, only read-only questions "
+                                            "are supported", list(tables), analytical)
+        # A cue counts only with a table/column/database word outside the cue itself ("columns of the ... table")
+        structure_object = any(not any(cue_start <= word < cue_end for cue_start, cue_end in cue_spans)
+                               for word in structure_words)
+        if metadata or (structure_cue and structure_object) or self._asks_what_table_is(text):
+            return Classification("reject", "Question asks about the database structure rather than its data",
+                                  list(tables), analytical)
+        if cue_spans:
+            return Classification("ambiguous", "Question may be about the database structure", list(tables),
+                                  analytical)
+        if tables and analytical:
+            return Classification("accept", "Question asks for business data", list(tables), analytical)
+        if column_tables and analytical:
+            names = sorted({table for group in column_tables for table in group})
+            return Classification("accept", "Question asks for business data", names, analytical)
+        return Classification("ambiguous", "No request for known business data recognized", list(tables),
+                              analytical)
+
+    def _asks_what_table_is(self, text: str) -> bool:
+        words = text.split()
+        for prefix in WHAT_IS_PREFIXES:
+            if tuple(words[:len(prefix)]) == prefix:
+                rest = words[len(prefix):]
+                while rest and rest[0] in ARTICLES:
+                    rest = rest[1:]
+                return " ".join(rest) in self._names
+        return False
@@ -0,0 +1,152 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+import pandas as pd
+import ResultCache
+import SqlRewriter
+
+
+class PagedResult:
+    """Page-by-page view of a query result; only the pages that are asked for are fetched.
+
+    Pages come from OFFSET/FETCH over the query. When the result has a unique key (every
+    key column of its source tables is selected) it is ordered by that key and the page
+    after an already fetched one is read with a keyset predicate (`WHERE key > last key`),
+    so deep pages cost the same as the first. A query's own ORDER BY is kept as is.
+    Fetched pages are shared through the manager's result cache.
+    """
+
+    def __init__(self, manager, query: str, page_size: int = 100):
+        self.manager = manager
+        self.query = SqlRewriter.clean(query)
+        self.page_size = page_size
+        self.normalized_query = ResultCache.ResultCache.normalize_sql(self.query)
+        self.tables = ResultCache.ResultCache.referenced_tables(self.normalized_query)
+        self.columns: List[str] = []
+        self.key_columns: List[str] = []
+        # False when neither the query nor a unique key fixes the row order
+        self.stable_order = True
+        self.estimated_rows: Optional[float] = None
+        self._row_count: Optional[int] = None
+        self._last_keys: Dict[int, tuple] = {}
+        self._prepare()
+
+    def _prepare(self):
+        with self.manager.connection() as conn:
+            cursor = conn.cursor()
+            described = cursor.execute(
+                "EXEC sp_describe_first_result_set @tsql = ?, @params = NULL, @browse_information_mode = 1",
+                self.query).fetchall()
+            visible = [row for row in described if not row.is_hidden]
+            self.columns = [row.name or "" for row in visible]
+            self._aliases = [f"c{position}" for position in range(len(visible))]
+
+            statement = SqlRewriter.split_cte(self.query)[1]
+            self._own_order = (SqlRewriter.order_by_clause(statement) != ""
+                               and not SqlRewriter.find_top_level(statement, r"\bTOP\b|\bOFFSET\b"))
+            keys = [row for row in described if row.is_part_of_unique_key]
+            # Usable only if no key column is hidden (missing from the select list) or unorderable
+            if (not self._own_order and keys and not any(row.is_hidden for row in keys)
+                    and not any(row.system_type_name.split("(")[0].lower()
+                                in self.manager.UNGROUPABLE_TYPES for row in keys)):
+                self._key_positions = [position for position, row in enumerate(visible)
+                                       if row.is_part_of_unique_key]
+                self.key_columns = [self.columns[position] for position in self._key_positions]
+            else:
+                self._key_positions = []
+                self.stable_order = self._own_order
+
+            # The plan estimates give the row count for free; the guard checks what a page costs
+            base_estimate = self.manager.cost_guard.estimate(cursor, self.query)
+            self.estimated_rows = base_estimate.estimated_rows if base_estimate else None
+            self.manager._check_cost(cursor, self._offset_sql(0))
+
+    def page(self, number: int) -> pd.DataFrame:
+        """Rows of page `number` (0-based); an empty frame past the end"""
+        cache_key = f"page|{self.normalized_query}|{self.page_size}|{number}"
+        df = self.manager.result_cache.get(cache_key)
+        if df is None:
+            if number > 0 and number - 1 in self._last_keys:
+                sql, params = self._keyset_sql(self._last_keys[number - 1])
+            else:
+                sql, params = self._offset_sql(number * self.page_size), ()
+            df = self._fetch(sql, params)
+            self.manager.result_cache.put(cache_key, df, self.tables)
+
+        if self._key_positions and len(df):
+            last = tuple(self._plain(df.iat[len(df) - 1, position]) for position in self._key_positions)
+            if not any(pd.isna(value) for value in last):
+                self._last_keys[number] = last
+        if len(df) < self.page_size:
+            # The last page tells the exact size without a COUNT
+            self._row_count = number * self.page_size + len(df)
+        return df
+
+    def row_count(self, exact: bool = False) -> Optional[int]:
+        """Exact row count if known (or exact=True, which runs a COUNT), else the plan estimate"""
+        if self._row_count is None and exact:
+            prefix = SqlRewriter.wrap_as_cte(self.query, "q", self._aliases)
+            with self.manager.connection() as conn:
+                cursor = conn.cursor()
+                with self.manager.cost_guard.guarded(conn, cursor):
+                    self._row_count = cursor.execute(prefix + "SELECT COUNT_BIG(*) FROM [q]").fetchone()[0]
+        if self._row_count is not None:
+            return self._row_count
+        return int(self.estimated_rows) if self.estimated_rows is not None else None
+
+    @property
+    def row_count_is_exact(self) -> bool:
+        return self._row_count is not None
+
+    @property
+    def page_count(self) -> Optional[int]:
+        rows = self.row_count()
+        return None if rows is None else max(1, -(-rows // self.page_size))
+
+    def _offset_sql(self, offset: int) -> str:
+        fetch = f"OFFSET {int(offset)} ROWS FETCH NEXT {int(self.page_size)} ROWS ONLY"
+        if self._own_order:
+            return f"{self.query}\n{fetch}"
+        return f"{self._prefix()}SELECT {self._select_list()} FROM [q]\nORDER BY {self._order()}\n{fetch}"
+
+    def _keyset_sql(self, last_key: tuple) -> Tuple[str, Sequence]:
+        # (k1 > ?) OR (k1 = ? AND k2 > ?) OR ... for a composite key
+        keys = [f"[{self._aliases[position]}]" for position in self._key_positions]
+        predicates = []
+        params = []
+        for depth, key in enumerate(keys):
+            predicates.append("(" + " AND ".join([f"{previous} = ?" for previous in keys[:depth]]
+                                                 + [f"{key} > ?"]) + ")")
+            params.extend(last_key[:depth + 1])
+        sql = (f"{self._prefix()}SELECT TOP ({int(self.page_size)}) {self._select_list()} FROM [q]\n"
+               f"WHERE {' OR '.join(predicates)}\nORDER BY {self._order()}")
+        return sql, params
+
+    def _prefix(self) -> str:
+        return SqlRewriter.wrap_as_cte(self.query, "q", self._aliases)
+
+    def _select_list(self) -> str:
+        return ", ".join(f"[{alias}]" for alias in self._aliases)
+
+    def _order(self) -> str:
+        if self._key_positions:
+            return ", ".join(f"[{self._aliases[position]}]" for position in self._key_positions)
+        return "(SELECT NULL)"
+
+    @staticmethod
+    def _plain(value):
+        """numpy / pandas scalars back to Python values that the ODBC driver can bind"""
+        if isinstance(value, pd.Timestamp):
+            return value.to_pydatetime()
+        return value.item() if hasattr(value, "item") else value
+
+    def _fetch(self, sql: str, params: Sequence) -> pd.DataFrame:
+        column_data = [[] for _ in self.columns]
+        with self.manager.instrumentation.span("page_fetch", rows=0) as span:
+            for _, batch in self.manager._fetch_column_batches(sql, self.page_size, max_rows=0, params=params,
+                                                               check_cost=False):
+                for values, column_values in zip(column_data, batch):
+                    values.extend(column_values)
+            span.set(rows=len(column_data[0]) if column_data else 0)
+        # Build by position so duplicate or blank column names survive
+        df = pd.DataFrame({position: values for position, values in enumerate(column_data)})
+        df.columns = self.columns
+        return df
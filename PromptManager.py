@@ -1,5 +1,24 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from string import Formatter
+
+
 class PromptManager:
-    def __init__(self):
+    # Rough average for English text and schema identifiers
+    CHARS_PER_TOKEN = 4
+
+    def __init__(self, max_prompt_tokens: int = None, max_cached_sections: int = 256):
+        # Prompts estimated above max_prompt_tokens (or PROMPT_MAX_TOKENS) are refused
+        self.max_prompt_tokens = max_prompt_tokens or int(os.getenv("PROMPT_MAX_TOKENS", "0"))
+        self.max_cached_sections = max_cached_sections
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._sections = OrderedDict()
+        self._sections_version = None
+        self._table_lines = {}
+
         # Define prompts
         self.prompts = {
             # 1. user_question_context_validator
@@ -61,6 +80,7 @@ class PromptManager:
                 8. provide an appropriate alias name to the column, that should be precise and should not contain any puntuation marks like ('_','-') etc., you can use Pascal case
                 9. If you are using the aggregate operation in the SQL query, it should include the Column name in output sql query.
                 10. Apply proper formating to the generated SQL Query
+                11. Instead of LIMIT use TOP in the SQL Query
 
                 Note : SQL query should only contains required columns only.
                 Important to note - Provide only SQL Query do not add any explanations 
@@ -73,25 +93,103 @@ class PromptManager:
             """
         }
 
-    
+        # Templates are parsed once; rendering is a join over the precompiled parts
+        self._compiled_prompts = {name: self._compile(template) for name, template in self.prompts.items()}
+
     def get_prompt(self, prompt_name, **kwargs):
         """
         Retrieve and format a prompt with the provided parameters
         """
 
         try:
-            print("Retrieved Parametes")
-            # print(**kwargs)
-            prompt_template = self.prompts.get(prompt_name)
-            print("Get template")
-            print(prompt_template)
-            if prompt_template:
-                formatted_prompt = prompt_template.format(**kwargs)
-                print("Formatted")
-                print(formatted_prompt)
+            compiled_prompt = self._compiled_prompts.get(prompt_name)
+            if compiled_prompt:
+                formatted_prompt = "".join(
+                    part if is_literal else str(kwargs[part]) for is_literal, part in compiled_prompt)
+                self._record_size(prompt_name, formatted_prompt)
                 return formatted_prompt
             else:
                 raise ValueError(f"Prompt '{prompt_name}' not found")
         except Exception as ex:
             print(f"Prompt execution failed: {str(ex)}")
-        
\ No newline at end of file
+            raise
+
+    def schema_sections(self, schema: dict, schema_version: str) -> dict:
+        """
+        Rendered schema parts of the prompts, memoized per schema version and table set:
+        "tables_info" and "relationship_info" for the validator, "schema" (JSON) for SQL generation
+        """
+        key = (schema_version, tuple(schema["tables"]), len(schema["relationships"]))
+        with self._lock:
+            if self._sections_version != schema_version:
+                self._sections_version = schema_version
+                self._sections.clear()
+                self._table_lines.clear()
+            sections = self._sections.get(key)
+            if sections is not None:
+                self._sections.move_to_end(key)
+                return sections
+
+        tables_info = []
+        for table_name, table_info in schema["tables"].items():
+            line = self._table_lines.get(table_name)
+            if line is None:
+                columns = ", ".join(f"{col} ({dtype})" for col, dtype in table_info["columns"].items())
+                line = self._table_lines[table_name] = f"Table '{table_name}' contains: {columns}"
+            tables_info.append(line)
+
+        relationships_info = [
+            f"Table '{rel['table']}' is related to '{rel['referenced_table']}' "
+            f"through {rel['column']} = {rel['referenced_column']}"
+            for rel in schema["relationships"]
+        ]
+        sections = {
+            "tables_info": chr(10).join(tables_info),
+            "relationship_info": chr(10).join(relationships_info),
+            "schema": json.dumps(schema, indent=2)
+        }
+        with self._lock:
+            self._sections[key] = sections
+            while len(self._sections) > self.max_cached_sections:
+                self._sections.popitem(last=False)
+        return sections
+
+    @classmethod
+    def measure(cls, prompt: str) -> dict:
+        """Prompt size in characters and a rough token estimate"""
+        return {"chars": len(prompt), "estimated_tokens": len(prompt) // cls.CHARS_PER_TOKEN + 1}
+
+    def prompt_stats(self) -> dict:
+        """Per prompt: renders, last/max/total characters and estimated tokens"""
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+    def _record_size(self, prompt_name: str, prompt: str):
+        size = self.measure(prompt)
+        with self._lock:
+            stats = self._stats.setdefault(prompt_name, {
+                "renders": 0, "last_chars": 0, "max_chars": 0, "total_chars": 0,
+                "last_estimated_tokens": 0, "max_estimated_tokens": 0
+            })
+            stats["renders"] += 1
+            stats["last_chars"] = size["chars"]
+            stats["max_chars"] = max(stats["max_chars"], size["chars"])
+            stats["total_chars"] += size["chars"]
+            stats["last_estimated_tokens"] = size["estimated_tokens"]
+            stats["max_estimated_tokens"] = max(stats["max_estimated_tokens"], size["estimated_tokens"])
+        if self.max_prompt_tokens and size["estimated_tokens"] > self.max_prompt_tokens:
+            raise ValueError(f"Prompt '{prompt_name}' is about {size['estimated_tokens']} tokens, "
+                             f"over the limit of {self.max_prompt_tokens}")
+
+    @staticmethod
+    def _compile(template: str) -> list:
+        """Split a template once into (is_literal, text_or_field_name) parts"""
+        parts = []
+        for literal, field_name, format_spec, conversion in Formatter().parse(template):
+            if literal:
+                parts.append((True, literal))
+            if field_name is not None:
+                if format_spec or conversion:
+                    raise ValueError(f"Unsupported placeholder '{field_name}' in prompt template")
+                parts.append((False, field_name))
+        return parts
@@ -0,0 +1,172 @@
+import os
+import threading
+import xml.etree.ElementTree as ElementTree
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+import SqlRewriter
+
+SHOWPLAN_NAMESPACE = "{http://schemas.microsoft.com/sqlserver/2004/07/showplan}"
+# Operators that read a whole table or index
+SCAN_OPERATORS = {"Table Scan", "Clustered Index Scan", "Index Scan", "Columnstore Index Scan"}
+
+
+class QueryRejected(Exception):
+    """The estimated plan of a query exceeds the configured limits"""
+
+
+class QueryCancelled(Exception):
+    """The query was cancelled through its CancellationToken"""
+
+
+@dataclass
+class PlanEstimate:
+    estimated_rows: float
+    estimated_cost: float
+    # (table, rows in table) for every full table or index scan in the plan
+    scans: List[Tuple[str, float]] = field(default_factory=list)
+
+
+class CancellationToken:
+    """Cooperative cancellation shared between a query and whoever may abandon it.
+
+    The running query registers a callback (cursor.cancel); `cancel()` can be called from
+    any thread, e.g. when a Streamlit session goes away or a batch run is stopped.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def register(self, callback: Callable) -> Callable:
+        """Run callback on cancel (immediately if already cancelled); returns an unregister function"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._unregister(callback)
+        callback()
+        return lambda: None
+
+    def _unregister(self, callback: Callable):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise QueryCancelled("Query cancelled")
+
+
+class QueryCostGuard:
+    """Check the estimated plan (SHOWPLAN_XML) of a query before it runs.
+
+    Queries whose estimated cost or row count exceed the limits are rejected, result
+    queries get a TOP (n) when they have no row limit of their own, and every query runs
+    with a timeout. Limits default to QUERY_MAX_ESTIMATED_COST, QUERY_MAX_ESTIMATED_ROWS and
+    QUERY_TIMEOUT_SECONDS; 0 disables a limit. If the plan cannot be estimated (e.g. no
+    SHOWPLAN permission) the query runs unchecked unless fail_open is False.
+    """
+
+    def __init__(self, max_estimated_cost: float = None, max_estimated_rows: float = None,
+                 timeout_seconds: int = None, auto_top: bool = True, fail_open: bool = True):
+        self.max_estimated_cost = (float(os.getenv("QUERY_MAX_ESTIMATED_COST", "500"))
+                                   if max_estimated_cost is None else max_estimated_cost)
+        self.max_estimated_rows = (float(os.getenv("QUERY_MAX_ESTIMATED_ROWS", "50000000"))
+                                   if max_estimated_rows is None else max_estimated_rows)
+        self.timeout_seconds = (int(os.getenv("QUERY_TIMEOUT_SECONDS", "120"))
+                                if timeout_seconds is None else timeout_seconds)
+        self.auto_top = auto_top
+        self.fail_open = fail_open
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_estimated_cost or self.max_estimated_rows)
+
+    def estimate(self, cursor, query: str) -> Optional[PlanEstimate]:
+        """Estimated plan of the query, compiled but not executed; None if unavailable"""
+        try:
+            cursor.execute("SET SHOWPLAN_XML ON")
+            try:
+                plans = [row[0] for row in cursor.execute(SqlRewriter.clean(query)).fetchall()]
+            finally:
+                cursor.execute("SET SHOWPLAN_XML OFF")
+            return self.parse_plan(plans)
+        except Exception as ex:
+            if not self.fail_open:
+                raise QueryRejected(f"Unable to estimate the query plan: {str(ex)}")
+            return None
+
+    @staticmethod
+    def parse_plan(plans: List[str]) -> PlanEstimate:
+        estimate = PlanEstimate(estimated_rows=0.0, estimated_cost=0.0)
+        for plan in plans:
+            root = ElementTree.fromstring(plan)
+            for statement in root.iter(f"{SHOWPLAN_NAMESPACE}StmtSimple"):
+                estimate.estimated_cost += float(statement.get("StatementSubTreeCost", 0))
+                estimate.estimated_rows = max(estimate.estimated_rows,
+                                              float(statement.get("StatementEstRows", 0)))
+            for operator in root.iter(f"{SHOWPLAN_NAMESPACE}RelOp"):
+                if operator.get("PhysicalOp") not in SCAN_OPERATORS:
+                    continue
+                table = operator.find(f".//{SHOWPLAN_NAMESPACE}Object")
+                name = table.get("Table", "").strip("[]") if table is not None else ""
+                estimate.scans.append((name, float(operator.get("TableCardinality", 0))))
+        return estimate
+
+    def check(self, estimate: Optional[PlanEstimate]):
+        """Raise QueryRejected if the estimate exceeds a limit"""
+        if estimate is None:
+            return
+        scanned = ", ".join(f"{table} ({rows:,.0f} rows)" for table, rows in estimate.scans)
+        detail = f"; full scans of {scanned}" if scanned else ""
+        if self.max_estimated_cost and estimate.estimated_cost > self.max_estimated_cost:
+            raise QueryRejected(f"Estimated query cost {estimate.estimated_cost:,.1f} exceeds the limit of "
+                                f"{self.max_estimated_cost:,.1f}{detail}")
+        if self.max_estimated_rows and estimate.estimated_rows > self.max_estimated_rows:
+            raise QueryRejected(f"Estimated {estimate.estimated_rows:,.0f} result rows exceed the limit of "
+                                f"{self.max_estimated_rows:,.0f}{detail}")
+
+    def limit(self, query: str, top: int) -> str:
+        """Add TOP (top) to the query unless it limits its rows itself or auto_top is off"""
+        if not self.auto_top or not top:
+            return query
+        return SqlRewriter.add_top(query, top)
+
+    @contextmanager
+    def guarded(self, conn, cursor, cancel_token: CancellationToken = None, timeout_seconds: int = None):
+        """Run statements on the cursor with the query timeout set and cancellation wired to cursor.cancel"""
+        timeout_seconds = self.timeout_seconds if timeout_seconds is None else timeout_seconds
+        previous_timeout = getattr(conn, "timeout", 0)
+        unregister = None
+        try:
+            if timeout_seconds:
+                # Applies to every statement on this connection, restored before it goes back to the pool
+                conn.timeout = int(timeout_seconds)
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+                unregister = cancel_token.register(cursor.cancel)
+            yield
+        except Exception as ex:
+            if cancel_token is not None and cancel_token.cancelled and not isinstance(ex, QueryCancelled):
+                raise QueryCancelled("Query cancelled") from ex
+            raise
+        finally:
+            if unregister is not None:
+                unregister()
+            if timeout_seconds:
+                conn.timeout = previous_timeout
@@ -0,0 +1,130 @@
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class QuestionCache:
+    """LRU + TTL cache of generated SQL keyed by normalized question and schema version.
+
+    With a `path` the entries are also kept in a SQLite file so they survive restarts.
+    Entries for any other schema version are dropped as soon as a new version is seen,
+    so a cached query never targets a table or column that no longer exists.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 24 * 3600, path: str = None,
+                 max_disk_entries: int = 100000):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        self.schema_version = None
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                """
+                    CREATE TABLE IF NOT EXISTS question_cache (
+                        cache_key TEXT PRIMARY KEY,
+                        schema_version TEXT,
+                        sql_query TEXT,
+                        expires_at REAL,
+                        last_used REAL
+                    )
+                """)
+            self._db.execute("DELETE FROM question_cache WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        """'  How many Orders?? ' and 'how many orders' share a cache entry.
+
+        Only case, whitespace and trailing punctuation are folded: operators, signs, decimal
+        points and quotes change the SQL ('total > 100' vs 'total < 100', '-1.5' vs '15').
+        """
+        question = " ".join(question.lower().split())
+        return re.sub(r"[\s?!.,;:]+$", "", question)
+
+    def get(self, question: str, schema_version: str) -> Optional[str]:
+        key = self._key(question, schema_version)
+        now = time.time()
+        with self._lock:
+            self._check_version(schema_version)
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < now:
+                del self._entries[key]
+                entry = None
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT sql_query, expires_at FROM question_cache WHERE cache_key = ? AND expires_at >= ?",
+                    (key, now)).fetchone()
+                if row is not None:
+                    entry = (row[0], row[1])
+                    self._store(key, entry)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[0]
+
+    def put(self, question: str, schema_version: str, sql_query: str):
+        key = self._key(question, schema_version)
+        now = time.time()
+        entry = (sql_query, now + self.ttl_seconds)
+        with self._lock:
+            self._check_version(schema_version)
+            self._store(key, entry)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO question_cache VALUES (?, ?, ?, ?, ?)",
+                    (key, schema_version, sql_query, entry[1], now))
+                self._db.execute(
+                    """
+                        DELETE FROM question_cache WHERE cache_key IN (
+                            SELECT cache_key FROM question_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                        )
+                    """, (self.max_disk_entries,))
+                self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM question_cache")
+                self._db.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+            return stats
+
+    def _key(self, question: str, schema_version: str) -> str:
+        return f"{schema_version}|{self.normalize(question)}"
+
+    def _store(self, key: str, entry: tuple):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _check_version(self, schema_version: str):
+        """Drop everything cached for an older schema the first time a new version shows up"""
+        if schema_version == self.schema_version:
+            return
+        if self.schema_version is not None:
+            self._stats["invalidations"] += 1
+        self.schema_version = schema_version
+        self._entries.clear()
+        if self._db is not None:
+            self._db.execute("DELETE FROM question_cache WHERE schema_version IS NOT ?", (schema_version,))
+            self._db.commit()
@@ -0,0 +1,284 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence
+import Instrumentation
+
+# Seconds a stage may take in total, retries and hedges included; LLM_DEADLINE_<STAGE>_SECONDS overrides
+DEFAULT_DEADLINES = {"validation": 20.0, "sql_generation": 30.0, "narrative": 60.0}
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    """No valid answer within the deadline of the stage"""
+
+
+class LLMBusy(RuntimeError):
+    """Too many abandoned calls are still running; retried like any failed attempt"""
+
+
+class LatencyHistogram:
+    """Latencies of one model: cumulative buckets for export, a window of recent calls for percentiles"""
+
+    BUCKETS = Instrumentation.PrometheusSink.BUCKETS
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=window)
+        self.bucket_counts = [0] * len(self.BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+
+    def observe(self, seconds: float, error: bool = False):
+        with self._lock:
+            if error:
+                self.errors += 1
+                return
+            self._recent.append(seconds)
+            self.count += 1
+            self.sum += seconds
+            for position, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    self.bucket_counts[position] += 1
+
+    def percentile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        """q in 0..1 over the recent window; None until min_samples calls were seen"""
+        with self._lock:
+            if len(self._recent) < max(1, min_samples):
+                return None
+            ordered = sorted(self._recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"count": self.count, "errors": self.errors, "sum": round(self.sum, 6),
+                "p50": self.percentile(0.5), "p95": self.percentile(0.95),
+                "buckets": dict(zip(self.BUCKETS, self.bucket_counts))}
+
+
+class ResilientLLM:
+    """Deadline-aware LLM calls with retries and optional hedging over a list of models.
+
+    The first model is the primary, the rest are fallbacks. Each stage has a deadline
+    covering every attempt. A failed or invalid answer (the chain or `validate` raised) is
+    retried after a jittered exponential backoff, moving on to the next model. With
+    hedging, a second request goes to the next model (or the same one if there is only
+    one) once the primary has taken longer than its `hedge_percentile` latency; the first
+    valid answer wins. Calls that lose or run past the deadline are abandoned, not killed;
+    while `max_abandoned` of them still occupy workers there is no hedging and new calls
+    fail with LLMBusy, so a hanging provider cannot tie up the whole executor.
+
+    Defaults come from LLM_RETRIES, LLM_BACKOFF_SECONDS, LLM_HEDGE_PERCENTILE (0, the
+    default, disables hedging) and LLM_MAX_ABANDONED (half the workers).
+    """
+
+    def __init__(self, models: Sequence, deadlines: Dict[str, float] = None, retries: int = None,
+                 backoff_seconds: float = None, hedge_percentile: float = None, hedge_min_samples: int = 20,
+                 max_workers: int = 16, max_abandoned: int = None,
+                 instrumentation: Instrumentation.Instrumentation = None):
+        self.models = [model for model in models if model is not None]
+        if not self.models:
+            raise ValueError("At least one model is required")
+        self.deadlines = dict(deadlines or {})
+        self.retries = int(os.getenv("LLM_RETRIES", "2")) if retries is None else retries
+        self.backoff_seconds = (float(os.getenv("LLM_BACKOFF_SECONDS", "0.5"))
+                                if backoff_seconds is None else backoff_seconds)
+        self.hedge_percentile = (float(os.getenv("LLM_HEDGE_PERCENTILE", "0"))
+                                 if hedge_percentile is None else hedge_percentile)
+        self.hedge_min_samples = hedge_min_samples
+        self.instrumentation = instrumentation or Instrumentation.default_instrumentation
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+        self.max_abandoned = (int(os.getenv("LLM_MAX_ABANDONED", str(max(1, max_workers // 2))))
+                              if max_abandoned is None else max_abandoned)
+        self._abandoned = 0
+        self._abandoned_lock = threading.Lock()
+        # Per (model, stage): prompts and answer lengths differ too much between stages to share one
+        self._histograms: Dict[tuple, LatencyHistogram] = {}
+        self._histograms_lock = threading.Lock()
+
+    @staticmethod
+    def model_name(model) -> str:
+        return (getattr(model, "model_name", None) or getattr(model, "model", None)
+                or getattr(model, "_llm_type", None) or type(model).__name__)
+
+    def histogram(self, model, stage: str) -> LatencyHistogram:
+        name = model if isinstance(model, str) else self.model_name(model)
+        with self._histograms_lock:
+            return self._histograms.setdefault((name, stage), LatencyHistogram())
+
+    def latency_stats(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """{model: {stage: histogram}}; streamed stages are timed to the first chunk"""
+        with self._histograms_lock:
+            histograms = dict(self._histograms)
+        stats: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for (name, stage), histogram in sorted(histograms.items()):
+            stats.setdefault(name, {})[stage] = histogram.to_dict()
+        return stats
+
+    @property
+    def abandoned(self) -> int:
+        """Abandoned calls (hedge losers, past the deadline) still running on the executor"""
+        with self._abandoned_lock:
+            return self._abandoned
+
+    def deadline(self, stage: str) -> float:
+        if stage in self.deadlines:
+            return self.deadlines[stage]
+        return float(os.getenv(f"LLM_DEADLINE_{stage.upper()}_SECONDS", DEFAULT_DEADLINES.get(stage, 60.0)))
+
+    def invoke(self, stage: str, build: Callable, chain_input, config: Dict = None,
+               validate: Callable[[Any], Any] = None):
+        """Run build(model).invoke(chain_input) and return validate(result) (or the result).
+
+        `build` makes the chain for a model, e.g. `lambda llm: llm | StrOutputParser()`.
+        Raises the last error once retries are used up, LLMDeadlineExceeded past the deadline.
+        """
+        deadline = time.monotonic() + self.deadline(stage)
+        last_error: Optional[Exception] = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._backoff(attempt, deadline)
+            if time.monotonic() >= deadline:
+                break
+            try:
+                return self._hedged(stage, attempt, build, chain_input, config, validate, deadline)
+            except LLMDeadlineExceeded:
+                raise
+            except Exception as ex:
+                last_error = ex
+                self.instrumentation.debug("LLM %s attempt %d failed: %s", stage, attempt, ex)
+        if last_error is not None:
+            raise last_error
+        raise LLMDeadlineExceeded(f"No answer for {stage} within {self.deadline(stage):g}s")
+
+    def stream(self, stage: str, build: Callable, chain_input, config: Dict = None) -> Iterator:
+        """Stream build(model).stream(chain_input); retries and fallbacks apply until the first
+        chunk arrives. Every chunk is awaited on a worker, so a stream that stalls at any point
+        is abandoned at the stage deadline"""
+        deadline = time.monotonic() + self.deadline(stage)
+        last_error: Optional[Exception] = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._backoff(attempt, deadline)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            model = self.models[attempt % len(self.models)]
+            started = time.perf_counter()
+            chunks = iter(build(model).stream(chain_input, config=config))
+            try:
+                first = self._submit_call(next, chunks, None)
+            except LLMBusy as ex:
+                last_error = ex
+                continue
+            try:
+                chunk = first.result(timeout=remaining)
+            except FutureTimeoutError:
+                self._abandon([first])
+                self.histogram(model, f"{stage}_first_token").observe(time.perf_counter() - started, error=True)
+                raise LLMDeadlineExceeded(f"No answer for {stage} within {self.deadline(stage):g}s")
+            except Exception as ex:
+                self.histogram(model, f"{stage}_first_token").observe(time.perf_counter() - started, error=True)
+                last_error = ex
+                continue
+            self.histogram(model, f"{stage}_first_token").observe(time.perf_counter() - started)
+            while chunk is not None:
+                yield chunk
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise LLMDeadlineExceeded(f"{stage} did not finish within {self.deadline(stage):g}s")
+                # Past the first chunk there is no retry: LLMBusy and errors end the stream
+                pending = self._submit_call(next, chunks, None)
+                try:
+                    chunk = pending.result(timeout=remaining)
+                except FutureTimeoutError:
+                    self._abandon([pending])
+                    raise LLMDeadlineExceeded(f"{stage} did not finish within {self.deadline(stage):g}s")
+            return
+        if last_error is not None:
+            raise last_error
+        raise LLMDeadlineExceeded(f"No answer for {stage} within {self.deadline(stage):g}s")
+
+    def _backoff(self, attempt: int, deadline: float):
+        # Full jitter: uniform in [0, base * 2^(attempt-1)], never past the deadline
+        delay = random.uniform(0, self.backoff_seconds * (2 ** (attempt - 1)))
+        time.sleep(max(0.0, min(delay, deadline - time.monotonic())))
+
+    def _hedged(self, stage: str, attempt: int, build: Callable, chain_input, config: Optional[Dict],
+                validate: Optional[Callable], deadline: float):
+        primary = self.models[attempt % len(self.models)]
+        hedge_model = self.models[(attempt + 1) % len(self.models)]
+        pending: Dict[Future, Any] = {
+            self._submit(stage, attempt, primary, build, chain_input, config, validate, False): primary}
+
+        hedge_after = None
+        if self.hedge_percentile and self.abandoned < self.max_abandoned:
+            hedge_after = self.histogram(primary, stage).percentile(self.hedge_percentile, self.hedge_min_samples)
+        last_error: Optional[Exception] = None
+        hedged = False
+        started = time.monotonic()
+        while pending:
+            timeout = deadline - time.monotonic()
+            if hedge_after is not None and not hedged:
+                timeout = min(timeout, started + hedge_after - time.monotonic())
+            done, _ = wait(list(pending), timeout=max(0.0, timeout), return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as ex:
+                    last_error = ex
+                    continue
+                self._abandon(pending)
+                return result
+            if time.monotonic() >= deadline:
+                self._abandon(pending)
+                raise LLMDeadlineExceeded(f"No answer for {stage} within {self.deadline(stage):g}s")
+            if not done and hedge_after is not None and not hedged:
+                hedged = True
+                try:
+                    pending[self._submit(stage, attempt, hedge_model, build, chain_input, config, validate,
+                                         True)] = hedge_model
+                except LLMBusy:
+                    # Keep waiting for the primary rather than adding to the backlog
+                    pass
+        raise last_error
+
+    def _submit(self, stage: str, attempt: int, model, build: Callable, chain_input, config: Optional[Dict],
+                validate: Optional[Callable], hedge: bool) -> Future:
+        def call():
+            name = self.model_name(model)
+            started = time.perf_counter()
+            try:
+                with self.instrumentation.span("llm_call", stage=stage, model=name, attempt=attempt, hedge=hedge):
+                    result = build(model).invoke(chain_input, config=config)
+                    result = validate(result) if validate is not None else result
+            except Exception:
+                self.histogram(name, stage).observe(time.perf_counter() - started, error=True)
+                raise
+            self.histogram(name, stage).observe(time.perf_counter() - started)
+            return result
+
+        return self._submit_call(call)
+
+    def _submit_call(self, function: Callable, *args) -> Future:
+        with self._abandoned_lock:
+            if self._abandoned >= self.max_abandoned:
+                raise LLMBusy(f"{self._abandoned} abandoned LLM calls are still running")
+        return self.executor.submit(function, *args)
+
+    def _abandon(self, futures):
+        """Cancel calls nobody waits for any more; the ones already running are counted until they end"""
+        for future in list(futures):
+            if future.cancel():
+                continue
+            with self._abandoned_lock:
+                self._abandoned += 1
+            future.add_done_callback(self._abandoned_done)
+
+    def _abandoned_done(self, future: Future):
+        with self._abandoned_lock:
+            self._abandoned -= 1
@@ -0,0 +1,112 @@
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, Iterable, Optional, Set
+import pandas as pd
+
+
+class ResultCache:
+    """Query results keyed by normalized SQL, bounded by TTL and a memory budget.
+
+    Every entry is tagged with the tables its query reads, so invalidating one table
+    evicts all cached results that depend on it.
+    """
+
+    _TOKENS = re.compile(r"('(?:[^']|'')*')|(--[^\n]*|/\*.*?\*/)|(\s+)|([^'\s-]+|-)", re.DOTALL)
+    _TABLE_REFERENCES = re.compile(r"\b(?:from|join)\s+((?:(?:\[[^\]]+\]|\w+)\.){0,3}(?:\[[^\]]+\]|\w+))",
+                                   re.IGNORECASE)
+
+    def __init__(self, ttl_seconds: float = 300, max_bytes: int = 128 * 1024 * 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        # key -> (DataFrame, size in bytes, expires_at, tables)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._keys_by_table: Dict[str, Set[str]] = defaultdict(set)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @classmethod
+    def normalize_sql(cls, sql: str) -> str:
+        """Drop comments, collapse whitespace and lowercase everything except string literals"""
+        parts = []
+        for literal, comment, space, token in cls._TOKENS.findall(sql):
+            if literal:
+                parts.append(literal)
+            elif space or comment:
+                if parts and parts[-1] != " ":
+                    parts.append(" ")
+            else:
+                parts.append(token.lower())
+        return "".join(parts).strip().rstrip(";").strip()
+
+    @classmethod
+    def referenced_tables(cls, sql: str) -> Set[str]:
+        """Lowercase names of the tables after FROM / JOIN, schema and brackets stripped"""
+        tables = set()
+        for reference in cls._TABLE_REFERENCES.findall(sql):
+            tables.add(reference.split(".")[-1].strip("[] ").lower())
+        return tables
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[0]
+
+    def put(self, key: str, df: pd.DataFrame, tables: Iterable[str]):
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        if self.ttl_seconds <= 0 or size > self.max_bytes:
+            return
+        tables = {table.lower() for table in tables}
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (df, size, time.monotonic() + self.ttl_seconds, tables)
+            self._bytes += size
+            for table in tables:
+                self._keys_by_table[table].add(key)
+            # Evict least recently used results until the budget fits again
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def invalidate_table(self, table: str) -> int:
+        """Evict every cached result that reads the table; returns how many were evicted"""
+        with self._lock:
+            keys = list(self._keys_by_table.get(table.lower(), ()))
+            for key in keys:
+                self._remove(key)
+            self._stats["invalidations"] += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_table.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+            return stats
+
+    def _remove(self, key: str):
+        _, size, _, tables = self._entries.pop(key)
+        self._bytes -= size
+        for table in tables:
+            keys = self._keys_by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_table[table]
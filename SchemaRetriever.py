@@ -0,0 +1,130 @@
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Set, Tuple
+import ForeignKeyGraph
+
+
+def tokenize(text: str) -> List[str]:
+    """Split identifiers and questions into lowercase words: 'OrderDetails_2024' -> order, details, 2024"""
+    words = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", text)
+    words = re.sub(r"([A-Z]+)([A-Z][a-z])", r"\1 \2", words)
+    return [word for word in re.split(r"[^a-z0-9]+", words.lower()) if word]
+
+
+def singularize(word: str) -> str:
+    """Very small English stemmer, enough to match 'categories' with 'Category'"""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("sses", "shes", "ches", "xes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def terms(text: str) -> List[str]:
+    return [singularize(word) for word in tokenize(text)]
+
+
+def trigrams(word: str) -> Set[str]:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SchemaRetriever:
+    """Offline BM25 index over the schema, used to send only the relevant tables to the LLM"""
+
+    # Table names say more about a table than any single column does
+    TABLE_NAME_WEIGHT = 3
+
+    def __init__(self, schema: dict, top_k: int = 8, fk_graph: ForeignKeyGraph.ForeignKeyGraph = None,
+                 k1: float = 1.5, b: float = 0.75, min_score: float = 0.5):
+        self.schema = schema or {"tables": {}, "relationships": []}
+        self.top_k = top_k
+        # Below this best score the question matched nothing useful and the prior tables are sent instead
+        self.min_score = min_score
+        self.fk_graph = fk_graph or ForeignKeyGraph.ForeignKeyGraph(self.schema["relationships"])
+        self.k1 = k1
+        self.b = b
+
+        self._term_frequencies: Dict[str, Counter] = {}
+        self._postings: Dict[str, Set[str]] = defaultdict(set)
+        for table, info in self.schema["tables"].items():
+            document = Counter()
+            for term in terms(table):
+                document[term] += self.TABLE_NAME_WEIGHT
+            for column, data_type in info["columns"].items():
+                document.update(terms(column))
+                document[data_type.lower()] += 1
+            for neighbour in self.fk_graph.neighbours(table):
+                document.update(terms(neighbour))
+            self._term_frequencies[table] = document
+            for term in document:
+                self._postings[term].add(table)
+
+        # Prior for questions that match no term: the most connected tables are the central ones
+        self._prior = sorted(self.schema["tables"], key=lambda table: (-len(self.fk_graph.neighbours(table)), table))
+
+        self._document_lengths = {table: sum(tf.values()) for table, tf in self._term_frequencies.items()}
+        self._average_length = (sum(self._document_lengths.values()) / len(self._document_lengths)
+                                if self._document_lengths else 0.0)
+        document_count = len(self._term_frequencies)
+        self._idf = {term: math.log(1 + (document_count - len(tables) + 0.5) / (len(tables) + 0.5))
+                     for term, tables in self._postings.items()}
+
+        # Character trigrams of the vocabulary catch misspelled or partial words in questions
+        self._trigram_postings: Dict[str, Set[str]] = defaultdict(set)
+        for term in self._postings:
+            for gram in trigrams(term):
+                self._trigram_postings[gram].add(term)
+
+    def rank_tables(self, question: str, top_k: int = None) -> List[Tuple[str, float]]:
+        """Return the best matching (table, score) pairs for a question"""
+        top_k = top_k or self.top_k
+        scores: Dict[str, float] = defaultdict(float)
+        for term, weight in self._expand_terms(terms(question)).items():
+            idf = self._idf[term]
+            for table in self._postings[term]:
+                tf = self._term_frequencies[table][term]
+                norm = self.k1 * (1 - self.b + self.b * self._document_lengths[table] / self._average_length)
+                scores[table] += weight * idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+    def relevant_schema(self, question: str, top_k: int = None) -> dict:
+        """Sub-schema with the top-k tables for the question plus the tables needed to join them"""
+        top_k = top_k or self.top_k
+        if len(self.schema["tables"]) <= top_k:
+            return self.schema
+
+        ranked = self.rank_tables(question, top_k)
+        if not ranked or ranked[0][1] < self.min_score:
+            # Nothing in the question points at a table; an empty schema would leave the LLM guessing
+            selected = self._prior[:top_k]
+        else:
+            selected = [table for table, _ in ranked]
+        subgraph = self.fk_graph.join_subgraph(selected)
+        tables = set(subgraph["tables"])
+        return {
+            "tables": {table: info for table, info in self.schema["tables"].items() if table in tables},
+            "relationships": subgraph["relationships"]
+        }
+
+    def _expand_terms(self, question_terms: List[str]) -> Dict[str, float]:
+        """Map question words to index terms: exact matches, otherwise close trigram matches"""
+        expanded: Dict[str, float] = defaultdict(float)
+        for word in question_terms:
+            if word in self._postings:
+                expanded[word] += 1.0
+                continue
+            if len(word) < 4:
+                continue
+            word_grams = trigrams(word)
+            candidates = Counter()
+            for gram in word_grams:
+                candidates.update(self._trigram_postings.get(gram, ()))
+            for term, shared in candidates.items():
+                similarity = shared / len(word_grams | trigrams(term))
+                if similarity >= 0.5:
+                    expanded[term] = max(expanded[term], similarity)
+        return expanded
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import os
+import pickle
+from typing import Any, Dict, Optional
+
+
+class SchemaSnapshotCache:
+    """Persist schema snapshots on local disk, one file per connection string and database.
+
+    Indexes derived from a schema (retrievers, matchers, validators) can be kept next to
+    it, tagged with the schema version they were built from.
+    """
+
+    def __init__(self, cache_dir: str = None):
+        self.cache_dir = cache_dir or os.getenv("SCHEMA_CACHE_DIR", ".schema_cache")
+
+    def key_for(self, connection_string: str, database: str) -> str:
+        # Hash the connection string so credentials never end up in a file name
+        return hashlib.sha256(f"{connection_string}|{database}".encode("utf-8")).hexdigest()[:32]
+
+    def load(self, key: str) -> Optional[Dict]:
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as snapshot_file:
+                return json.load(snapshot_file)
+        except Exception as ex:
+            print(f"Ignoring unreadable schema snapshot {path}: {str(ex)}")
+            return None
+
+    def save(self, key: str, snapshot: Dict):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._path(key)
+            # Write to a temporary file first so a crash never leaves half a snapshot behind
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as snapshot_file:
+                json.dump(snapshot, snapshot_file)
+            os.replace(temp_path, path)
+        except Exception as ex:
+            print(f"Unable to save the schema snapshot: {str(ex)}")
+
+    def load_indexes(self, key: str, version: str) -> Optional[Any]:
+        """Indexes saved for exactly this version, else None"""
+        path = self._index_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as index_file:
+                stored = pickle.load(index_file)
+            return stored["indexes"] if stored.get("version") == version else None
+        except Exception as ex:
+            print(f"Ignoring unreadable schema indexes {path}: {str(ex)}")
+            return None
+
+    def save_indexes(self, key: str, version: str, indexes: Any):
+        """Replace the indexes of the key; only the latest version is kept"""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._index_path(key)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, "wb") as index_file:
+                pickle.dump({"version": version, "indexes": indexes}, index_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except Exception as ex:
+            print(f"Unable to save the schema indexes: {str(ex)}")
+
+    def _index_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"indexes_{key}.pkl")
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"schema_{key}.json")
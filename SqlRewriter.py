@@ -0,0 +1,110 @@
+import re
+from typing import List, Optional, Tuple
+
+# String literals, quoted identifiers and comments: their content never counts as SQL keywords
+_OPAQUE = re.compile(r"'(?:[^']|'')*'|\[(?:[^\]]|\]\])*\]|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/", re.DOTALL)
+
+
+def top_level_mask(query: str) -> str:
+    """Same-length copy of the query where literals, comments and everything inside parentheses
+    is blanked out, so keyword searches only see the outermost statement"""
+    chars = list(query)
+    for match in _OPAQUE.finditer(query):
+        for index in range(match.start(), match.end()):
+            chars[index] = " "
+    depth = 0
+    for index, char in enumerate(chars):
+        if char == "(":
+            depth += 1
+            if depth > 1:
+                chars[index] = " "
+        elif char == ")":
+            depth -= 1
+            if depth > 0:
+                chars[index] = " "
+        elif depth > 0:
+            chars[index] = " "
+    return "".join(chars).upper()
+
+
+def clean(query: str) -> str:
+    return query.strip().rstrip(";").strip()
+
+
+def split_cte(query: str) -> Tuple[str, str]:
+    """Split 'WITH a AS (...), b AS (...) SELECT ...' into its CTE list and final statement.
+
+    Returns ("", query) for queries without a leading WITH.
+    """
+    query = clean(query)
+    mask = top_level_mask(query)
+    if not re.match(r"\s*WITH\b", mask):
+        return "", query
+    position = re.match(r"\s*WITH\b", mask).end()
+    while True:
+        close = mask.find(")", position)
+        if close < 0:
+            return "", query
+        following = re.match(r"\s*(,|AS\b)?", mask[close + 1:])
+        if following.group(1) is None:
+            ctes = query[re.match(r"\s*WITH\b", mask).end():close + 1].strip()
+            return ctes, query[close + 1:].strip()
+        position = close + 1 + following.end()
+
+
+def find_top_level(query: str, pattern: str) -> Optional[re.Match]:
+    """Search a keyword pattern in the outermost statement only"""
+    return re.search(pattern, top_level_mask(query))
+
+
+def strip_order_by(statement: str) -> str:
+    """Drop a trailing ORDER BY that would make the statement invalid inside a CTE or subquery"""
+    statement = clean(statement)
+    mask = top_level_mask(statement)
+    order_by = None
+    for order_by in re.finditer(r"\bORDER\s+BY\b", mask):
+        pass
+    if order_by is None or re.search(r"\bTOP\b|\bOFFSET\b|\bFOR\s+XML\b", mask):
+        return statement
+    return statement[:order_by.start()].rstrip()
+
+
+def order_by_clause(statement: str) -> str:
+    """The trailing top-level ORDER BY clause of a statement, or an empty string"""
+    statement = clean(statement)
+    mask = top_level_mask(statement)
+    order_by = None
+    for order_by in re.finditer(r"\bORDER\s+BY\b", mask):
+        pass
+    return statement[order_by.start():].strip() if order_by else ""
+
+
+def add_top(query: str, top: int) -> str:
+    """Add TOP (top) to the outermost SELECT unless it already limits its rows.
+
+    Set operations (UNION/EXCEPT/INTERSECT), SELECT INTO and non-SELECT statements
+    are returned unchanged.
+    """
+    ctes, statement = split_cte(query)
+    mask = top_level_mask(statement)
+    select = re.match(r"\s*SELECT\b(\s+(?:DISTINCT|ALL)\b)?", mask)
+    if (select is None or len(re.findall(r"\bSELECT\b", mask)) != 1
+            or re.search(r"\bTOP\b|\bOFFSET\b|\bINTO\b|\bUNION\b|\bEXCEPT\b|\bINTERSECT\b", mask)):
+        return clean(query)
+    statement = f"{statement[:select.end()]} TOP ({int(top)}){statement[select.end():]}"
+    return f"WITH {ctes}\n{statement}" if ctes else statement
+
+
+def wrap_as_cte(query: str, name: str = "q", column_names: List[str] = None) -> str:
+    """Turn a SELECT into a CTE prefix so callers can append their own 'SELECT ... FROM q'"""
+    ctes, statement = split_cte(query)
+    statement = strip_order_by(statement)
+    columns = ""
+    if column_names:
+        columns = " (" + ", ".join(quote(column) for column in column_names) + ")"
+    definition = f"{quote(name)}{columns} AS (\n{statement}\n)"
+    return f"WITH {ctes},\n{definition}\n" if ctes else f"WITH {definition}\n"
+
+
+def quote(name: str) -> str:
+    return "[" + name.replace("]", "]]") + "]"
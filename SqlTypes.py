@@ -0,0 +1,10 @@
+# SQL Server data type groups shared by the modules that build or check queries; no imports, so
+# lightweight modules (IntentMatcher, ValueIndex) can use them without pyodbc
+
+NUMERIC_TYPES = {"tinyint", "smallint", "int", "bigint", "decimal", "numeric", "float", "real",
+                 "money", "smallmoney"}
+# Types that cannot be grouped or compared, so no MIN/MAX/DISTINCT/top values for them
+UNGROUPABLE_TYPES = {"text", "ntext", "image", "xml", "geography", "geometry", "hierarchyid",
+                     "sql_variant", "binary", "varbinary", "timestamp", "rowversion"}
+# Types whose values are worth offering as spelling corrections
+TEXT_TYPES = {"char", "varchar", "nchar", "nvarchar", "text", "ntext", "sysname"}
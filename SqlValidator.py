@@ -0,0 +1,102 @@
+import re
+from dataclasses import dataclass, field
+from typing import List
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import OptimizeError, ParseError
+from sqlglot.optimizer.qualify import qualify
+from sqlglot.schema import MappingSchema
+from sqlglot.tokens import TokenType
+import Instrumentation
+
+# Statements (anywhere in the tree, e.g. inside a CTE) that change data, objects or session state
+WRITE_EXPRESSIONS = (exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Drop, exp.Create, exp.Alter,
+                     exp.TruncateTable, exp.Into, exp.Command, exp.Grant, exp.Use, exp.Set, exp.Transaction,
+                     exp.Execute)
+# Keywords of other dialects that the T-SQL reader accepts but SQL Server does not ("LIMIT 10")
+FOREIGN_TOKENS = {TokenType.LIMIT: "LIMIT"}
+
+
+class SqlValidationError(ValueError):
+    """Generated SQL that must not be sent to the database"""
+
+
+@dataclass
+class ValidatedQuery:
+    # The cleaned SQL as generated; this is what runs, the tree is only used for checking
+    sql: str
+    # Identifiers lowercased and formatting fixed, the same for equivalent queries (cache key)
+    canonical: str
+    ast: exp.Expression
+    tables: List[str] = field(default_factory=list)
+
+
+class SqlValidator:
+    """Parse generated T-SQL and check it against the schema before the database round trip.
+
+    Only a single read-only statement (SELECT, set operations, CTEs) in T-SQL syntax is
+    accepted (no LIMIT or backtick quoting); every table must exist in the schema and every
+    column must resolve to one of its tables.
+    """
+
+    def __init__(self, schema: dict):
+        self.schema = schema or {"tables": {}, "relationships": []}
+        self._tables = {table.lower(): table for table in self.schema["tables"]}
+        self._mapping = MappingSchema({table: dict(info["columns"]) for table, info in self.schema["tables"].items()},
+                                      dialect="tsql")
+
+    @staticmethod
+    def clean(text: str) -> str:
+        """Strip <think> blocks, code fences and escapes the LLM wraps around the SQL; backticks
+        inside the query are MySQL quoting and are left for the parser to reject"""
+        text = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
+        return text.replace('```sql', '').replace('```', '').replace("\\", '').strip().strip('`').strip()
+
+    def validate(self, text: str) -> ValidatedQuery:
+        query = self.clean(text)
+        try:
+            statements = [statement for statement in sqlglot.parse(query, read="tsql") if statement is not None]
+        except ParseError as ex:
+            raise SqlValidationError(f"Generated query is not valid T-SQL: {str(ex)}")
+        foreign = next((FOREIGN_TOKENS[token.token_type] for token in sqlglot.tokenize(query, read="tsql")
+                        if token.token_type in FOREIGN_TOKENS), None)
+        if foreign is not None:
+            raise SqlValidationError(f"Generated query uses {foreign}, which is not T-SQL")
+        if not statements:
+            raise SqlValidationError("Generated query is empty")
+        if len(statements) > 1:
+            raise SqlValidationError("Generated query contains more than one statement")
+        ast = statements[0]
+        if not isinstance(ast, exp.Query):
+            raise SqlValidationError(f"Only SELECT queries are allowed, got {ast.key.upper()}")
+        write = next(ast.find_all(*WRITE_EXPRESSIONS), None)
+        if write is not None:
+            raise SqlValidationError(f"Generated query contains {write.key.upper()}, only read-only queries are allowed")
+
+        tables = self._resolve_tables(ast)
+        self._resolve_columns(ast)
+        return ValidatedQuery(sql=query, canonical=ast.sql(dialect="tsql", normalize=True), ast=ast, tables=tables)
+
+    def _resolve_tables(self, ast: exp.Expression) -> List[str]:
+        cte_names = {cte.alias_or_name.lower() for cte in ast.find_all(exp.CTE)}
+        tables = []
+        for table in ast.find_all(exp.Table):
+            name = table.name.lower()
+            if not name or (name in cte_names and not table.db):
+                continue
+            if name not in self._tables:
+                raise SqlValidationError(f"Generated query references unknown table {table.sql(dialect='tsql')}")
+            tables.append(self._tables[name])
+        if not tables:
+            raise SqlValidationError("Generated query does not reference any valid tables")
+        return list(dict.fromkeys(tables))
+
+    def _resolve_columns(self, ast: exp.Expression):
+        try:
+            qualify(ast.copy(), schema=self._mapping, dialect="tsql", validate_qualify_columns=True,
+                    quote_identifiers=False)
+        except OptimizeError as ex:
+            raise SqlValidationError(f"Generated query references an unknown column: {str(ex)}")
+        except Exception as ex:
+            # A construct the resolver does not model; tables were checked, the database checks the rest
+            Instrumentation.default_instrumentation.debug("Column check skipped: %s", ex)
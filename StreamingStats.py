@@ -0,0 +1,157 @@
+import math
+import random
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Dict, List, Sequence
+
+
+def unique_column_names(names: Sequence) -> List[str]:
+    """Unnamed or repeated columns (e.g. COUNT(*) without alias) still get their own name"""
+    unique = []
+    seen = set()
+    for position, name in enumerate(names):
+        name = "" if name is None else str(name)
+        name = name or f"column_{position + 1}"
+        suffix = position + 1
+        while name in seen:
+            name = f"{name}_{suffix}"
+        seen.add(name)
+        unique.append(name)
+    return unique
+
+
+class ColumnStats:
+    """Single-pass statistics for one result column.
+
+    Numbers get count/mean/std (merged per batch with Chan's parallel update), min/max and
+    approximate quantiles from a fixed-size reservoir sample. Everything else gets min/max
+    where comparable and approximate top-k values from a Space-Saving counter.
+    """
+
+    def __init__(self, reservoir_size: int = 1024, top_k_capacity: int = 64, seed: int = 0):
+        self.reservoir_size = reservoir_size
+        self.top_k_capacity = top_k_capacity
+        self.rows = 0
+        self.nulls = 0
+        self.numeric_count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.reservoir: List[float] = []
+        self.top_counts: Dict[str, int] = {}
+        self.other_count = 0
+        self._random = random.Random(seed)
+
+    def update(self, values: Sequence):
+        self.rows += len(values)
+        numbers = []
+        others = []
+        for value in values:
+            if value is None:
+                self.nulls += 1
+            elif isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+                numbers.append(float(value))
+            else:
+                others.append(value)
+        if numbers:
+            self._update_numbers(numbers)
+        if others:
+            self._update_others(others)
+
+    def _update_numbers(self, numbers: List[float]):
+        count = len(numbers)
+        batch_mean = math.fsum(numbers) / count
+        batch_m2 = math.fsum((number - batch_mean) ** 2 for number in numbers)
+        total = self.numeric_count + count
+        delta = batch_mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += batch_m2 + delta * delta * self.numeric_count * count / total
+
+        batch_min, batch_max = min(numbers), max(numbers)
+        self.minimum = batch_min if self.minimum is None else min(self.minimum, batch_min)
+        self.maximum = batch_max if self.maximum is None else max(self.maximum, batch_max)
+
+        # Reservoir sampling (algorithm R) keeps a uniform sample for the quantiles
+        for offset, number in enumerate(numbers):
+            seen = self.numeric_count + offset
+            if seen < self.reservoir_size:
+                self.reservoir.append(number)
+            else:
+                slot = self._random.randint(0, seen)
+                if slot < self.reservoir_size:
+                    self.reservoir[slot] = number
+        self.numeric_count = total
+
+    def _update_others(self, values: list):
+        comparable = [value for value in values if isinstance(value, (str, date, datetime, time))]
+        if comparable:
+            try:
+                batch_min, batch_max = min(comparable), max(comparable)
+                self.minimum = batch_min if self.minimum is None else min(self.minimum, batch_min)
+                self.maximum = batch_max if self.maximum is None else max(self.maximum, batch_max)
+            except TypeError:
+                pass
+
+        # Space-Saving: bounded counters, the heavy hitters survive
+        for value in values:
+            key = str(value)
+            if key in self.top_counts:
+                self.top_counts[key] += 1
+            elif len(self.top_counts) < self.top_k_capacity:
+                self.top_counts[key] = 1
+            else:
+                smallest = min(self.top_counts, key=self.top_counts.get)
+                count = self.top_counts.pop(smallest)
+                self.top_counts[key] = count + 1
+                self.other_count += 1
+
+    def summary(self, quantiles: Sequence[float], top_k: int) -> Dict:
+        summary = {"count": self.rows - self.nulls, "nulls": self.nulls}
+        if self.minimum is not None:
+            summary["min"] = self._plain(self.minimum)
+            summary["max"] = self._plain(self.maximum)
+        if self.numeric_count:
+            summary["mean"] = self.mean
+            summary["std"] = math.sqrt(self.m2 / (self.numeric_count - 1)) if self.numeric_count > 1 else 0.0
+            ordered = sorted(self.reservoir)
+            summary["quantiles"] = {
+                f"{int(q * 100)}%": ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in quantiles
+            }
+        if self.top_counts:
+            ranked = sorted(self.top_counts.items(), key=lambda item: item[1], reverse=True)[:top_k]
+            summary["top_values"] = {value: count for value, count in ranked}
+        return summary
+
+    @staticmethod
+    def _plain(value):
+        if isinstance(value, (date, datetime, time)):
+            return value.isoformat()
+        return value
+
+
+class StreamingStats:
+    """Summary of a query result built while its batches are fetched, no full-frame pass needed"""
+
+    def __init__(self, quantiles: Sequence[float] = (0.25, 0.5, 0.75), top_k: int = 5):
+        self.quantiles = quantiles
+        self.top_k = top_k
+        self.columns: List[str] = []
+        self._stats: List[ColumnStats] = []
+        self.rows = 0
+
+    def update(self, columns: List[str], batch: Sequence[Sequence]):
+        """Add one column-major batch, as produced by DatabaseConnectionManager._fetch_column_batches"""
+        if not self._stats:
+            self.columns = list(columns)
+            self._stats = [ColumnStats() for _ in columns]
+        for stats, values in zip(self._stats, batch):
+            stats.update(values)
+        if batch:
+            self.rows += len(batch[0])
+
+    def summary(self) -> Dict:
+        columns = {}
+        for name, stats in zip(unique_column_names(self.columns), self._stats):
+            columns[name] = stats.summary(self.quantiles, self.top_k)
+        return {"row_count": self.rows, "columns": columns}
@@ -0,0 +1,202 @@
+import heapq
+import math
+import os
+import pickle
+import sys
+import time
+from array import array
+from collections import Counter, defaultdict
+from itertools import chain
+from typing import Callable, Dict, Iterable, List, Tuple
+from fuzzywuzzy import fuzz
+import SqlTypes
+
+TEXT_TYPES = SqlTypes.TEXT_TYPES
+UNREACHABLE = float("inf")
+
+
+def value_trigrams(text: str) -> set:
+    padded = f"  {text.lower()} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ValueIndex:
+    """Trigram inverted index over the distinct values of text columns.
+
+    Each column keeps its values and a trigram -> value id posting list, so one column
+    can be re-indexed without touching the others. A lookup scores every question word
+    against every column in one pass and only runs fuzz.ratio on values that share
+    enough trigrams with the word.
+
+    Memory is bounded: a column keeps at most `max_values_per_column` values and the index
+    at most `max_bytes` (VALUE_INDEX_MAX_BYTES). Columns are kept in least recently used
+    order (indexed or matched by a lookup); indexing past the budget evicts from the front.
+    Evicted columns, and columns larger than the whole budget, are retried once they are
+    `max_age_seconds` old or their table is refreshed explicitly.
+    """
+
+    def __init__(self, fetch_values: Callable[[str, str], List[str]], path: str = None,
+                 max_age_seconds: float = 24 * 3600, max_bytes: int = None, max_values_per_column: int = 10000):
+        self.fetch_values = fetch_values
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = (int(os.getenv("VALUE_INDEX_MAX_BYTES", str(64 * 1024 * 1024)))
+                          if max_bytes is None else max_bytes)
+        self.max_values_per_column = max_values_per_column
+        # "table.column" -> {"values": [...], "postings": {trigram: array of value ids}, "indexed_at": ts,
+        #                    "bytes": estimated size}, least recently used first
+        self.columns: Dict[str, Dict] = {}
+        # Columns evicted or left out for the budget -> when, so refresh can retry them later
+        self.skipped: Dict[str, float] = {}
+        if path and os.path.exists(path):
+            self.load()
+
+    @staticmethod
+    def text_columns(schema: dict) -> List[Tuple[str, str]]:
+        return [(table, column)
+                for table, info in schema["tables"].items()
+                for column, data_type in info["columns"].items()
+                if data_type.lower() in TEXT_TYPES]
+
+    def refresh(self, schema: dict, tables: Iterable[str] = None) -> int:
+        """Index new and stale text columns, drop vanished ones; returns how many were (re)indexed.
+
+        Passing `tables` forces those tables to be re-indexed regardless of age.
+        """
+        forced = set(tables or ())
+        wanted = {f"{table}.{column}": (table, column) for table, column in self.text_columns(schema)}
+        for key in [key for key in self.columns if key not in wanted]:
+            del self.columns[key]
+        for key in [key for key in self.skipped if key not in wanted]:
+            del self.skipped[key]
+
+        now = time.time()
+        indexed = 0
+        for key, (table, column) in wanted.items():
+            entry = self.columns.get(key)
+            if (entry is None and key in self.skipped and table not in forced
+                    and now - self.skipped[key] <= self.max_age_seconds):
+                continue
+            if entry is None or table in forced or now - entry["indexed_at"] > self.max_age_seconds:
+                self.index_column(table, column)
+                indexed += 1
+        if indexed and self.path:
+            self.save()
+        return indexed
+
+    @property
+    def bytes(self) -> int:
+        return sum(entry["bytes"] for entry in self.columns.values())
+
+    def index_column(self, table: str, column: str):
+        key = f"{table}.{column}"
+        try:
+            values = [str(value) for value in self.fetch_values(table, column) if value is not None]
+        except Exception as ex:
+            print(f"Unable to index {table}.{column}: {str(ex)}")
+            values = []
+        values = values[:self.max_values_per_column]
+        postings = defaultdict(lambda: array("I"))
+        for value_id, value in enumerate(values):
+            for gram in value_trigrams(value):
+                postings[gram].append(value_id)
+        entry = {"values": values, "postings": dict(postings), "indexed_at": time.time()}
+        entry["bytes"] = self._entry_bytes(entry)
+
+        previous = self.columns.pop(key, None)
+        if entry["bytes"] > self.max_bytes:
+            # Evicting everything else would not make room
+            self.skipped[key] = time.time()
+            if previous is not None:
+                self.columns[key] = previous
+            return
+        used = self.bytes
+        while self.columns and used + entry["bytes"] > self.max_bytes:
+            evicted = next(iter(self.columns))
+            used -= self.columns.pop(evicted)["bytes"]
+            self.skipped[evicted] = time.time()
+        self.skipped.pop(key, None)
+        self.columns[key] = entry
+
+    @staticmethod
+    def _entry_bytes(entry: Dict) -> int:
+        values = entry["values"]
+        postings = entry["postings"]
+        return (sys.getsizeof(values) + sum(map(sys.getsizeof, values)) + sys.getsizeof(postings)
+                + sum(sys.getsizeof(gram) + sys.getsizeof(ids) for gram, ids in postings.items()))
+
+    def lookup(self, words: List[str], threshold: int = 80, limit: int = 5,
+               max_candidates: int = 50) -> Dict[str, List[str]]:
+        """Best matching values per column for all question words at once.
+
+        Adjacent word pairs are tried as well so multi-word values like 'New York' match.
+        Only values that can still reach `threshold` by length and shared trigram count are
+        scored, at most `max_candidates` of them per phrase and column.
+        """
+        words = [word for word in words if word]
+        phrases = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+        # fuzz.ratio rounds 200 * matches / (la + lb), so anything from threshold - 0.5 passes
+        ratio = max(0.01, (threshold - 0.5) / 100)
+        phrase_filters = []
+        for phrase in phrases:
+            grams = value_trigrams(phrase)
+            phrase_filters.append((phrase.lower(), grams, self._needed_by_length(len(phrase), len(grams), ratio)))
+
+        matches = {}
+        for key, entry in list(self.columns.items()):
+            postings = entry["postings"]
+            values = entry["values"]
+            best: Dict[int, int] = {}
+            for phrase, grams, needed in phrase_filters:
+                shared = Counter(chain.from_iterable(postings.get(gram, ()) for gram in grams))
+                candidates = [(count, value_id) for value_id, count in shared.items()
+                              if count >= needed.get(len(values[value_id]), UNREACHABLE)]
+                if len(candidates) > max_candidates:
+                    candidates = heapq.nlargest(max_candidates, candidates)
+                for _, value_id in candidates:
+                    score = fuzz.ratio(phrase, values[value_id].lower())
+                    if score >= threshold and score > best.get(value_id, 0):
+                        best[value_id] = score
+            if best:
+                ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)[:limit]
+                matches[key] = [values[value_id] for value_id, _ in ranked]
+        for key in matches:
+            # Most recently used last, so eviction takes the columns lookups have not needed for longest
+            entry = self.columns.pop(key, None)
+            if entry is not None:
+                self.columns[key] = entry
+        return matches
+
+    @staticmethod
+    def _needed_by_length(phrase_length: int, phrase_grams: int, ratio: float) -> Dict[int, int]:
+        """Value length -> shared trigrams a value needs so fuzz.ratio can still reach `ratio` (0..1).
+
+        Lengths missing from the result cannot match at all: at most min(la, lb) characters match.
+        Every unmatched character (insert or delete) breaks at most 3 of the phrase's trigrams.
+        """
+        shortest = math.ceil(phrase_length * ratio / (2 - ratio))
+        longest = math.floor(phrase_length * (2 - ratio) / ratio)
+        return {length: max(1, phrase_grams - 3 * int((1 - ratio) * (phrase_length + length)))
+                for length in range(max(1, shortest), longest + 1)}
+
+    def save(self):
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, "wb") as index_file:
+                pickle.dump(self.columns, index_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.path)
+        except Exception as ex:
+            print(f"Unable to save the value index: {str(ex)}")
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as index_file:
+                self.columns = pickle.load(index_file)
+            for entry in self.columns.values():
+                entry.setdefault("bytes", self._entry_bytes(entry))
+        except Exception as ex:
+            print(f"Ignoring unreadable value index {self.path}: {str(ex)}")
+            self.columns = {}
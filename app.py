@@ -1,36 +1,146 @@
 import dotenv
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 import streamlit as st
 import pandas as pd
 import BusinessInsightsGenerator 
+import Instrumentation
+import QueryCostGuard
+
+@st.cache_resource(show_spinner="Loading database schema...")
+def get_business_insights_generator(db_connection_string: str, api_key: str) -> BusinessInsightsGenerator.BusinessInsightsGenerator:
+    """One generator (LLM client, connection pool, schema) per connection string and API key,
+    shared by every session and rerun of this process"""
+    return BusinessInsightsGenerator.BusinessInsightsGenerator(connection_string= db_connection_string,
+                                                               api_key= api_key)
+
+@st.cache_resource
+def get_recent_spans() -> Instrumentation.RingBufferSink:
+    """Recent stage timings of this process, shown in the sidebar"""
+    return Instrumentation.default_instrumentation.add_sink(Instrumentation.RingBufferSink(capacity=200))
+
+@st.cache_resource
+def get_question_executor() -> ThreadPoolExecutor:
+    """Runs each session's question off the script thread (see run_question); separate from the
+    generator's executor, which run_pipeline itself waits on"""
+    return ThreadPoolExecutor(max_workers=int(os.getenv("APP_QUESTION_WORKERS", "16")),
+                              thread_name_prefix="question")
 
 class BusinessInsightApp:
     def __init__(self, api_key:str, db_connection_string: str):
         self.api_key = api_key
         self.db_connection_string = db_connection_string
-        self.businessAssistant = BusinessInsightsGenerator.BusinessInsightsGenerator(connection_string= self.db_connection_string,
-                                                                                     api_key= self.api_key)
+        self.businessAssistant = get_business_insights_generator(self.db_connection_string, self.api_key)
     
     def GetBusinessInsights(self):
         ## Application details
         st.title("Business Insights")  # Correct way to set the title
         # st.write("Connection String:", self.db_connection_string)  # Correct way to display the connection string
+        if st.sidebar.button("Refresh schema"):
+            self.businessAssistant.refresh_schema()
+            st.sidebar.success("Schema refreshed")
+        narrative_only = st.sidebar.checkbox("Narrative only (load rows on demand)")
+        recent_spans = get_recent_spans()
         user_query = st.chat_input("Enter Your business query!")
         if user_query:
             st.text(user_query)
-            is_valid_question, reasoning, reframed_question = self.businessAssistant.validate_query_context(user_query)
-            st.write(is_valid_question, reasoning, reframed_question)
-            if is_valid_question==False and reframed_question is not None:
-                st.write(reframed_question)
-
-            if is_valid_question == True:
-                sql_query = self.businessAssistant.generate_sql_query(user_query)
-                result,narrative = self.businessAssistant.get_result(sql_query)
-                # st.write(response)
+            # Validation and SQL generation run concurrently; narrative-only questions are narrated from
+            # statistics computed on the server without fetching rows, the others from the fetched rows
+            response = self.run_question(user_query, summary_only=narrative_only)
+            if response.is_related==False:
+                # Only rejections are explained; the reasoning for accepted questions is internal
+                st.write(response.reasoning)
+                if response.reframed_question is not None:
+                    st.write(response.reframed_question)
+
+            if response.is_related == True:
                 st.subheader("Generated SQL query")
-                st.code(sql_query, language='sql')
-                st.subheader("Result")
-                st.dataframe(result) 
+                st.code(response.sql_query, language='sql')
+                st.session_state["result_sql_query"] = response.sql_query
+                # Rows run_pipeline already fetched are paged locally instead of running the query again
+                st.session_state["result_rows"] = response.result
+                st.session_state["result_pages"] = None
+                # With narrative_only rows are only fetched if the user asks for them (on a later rerun)
+                st.session_state["show_result_rows"] = not narrative_only
+                st.subheader("Insights")
+                # Render the narrative token by token while it is being generated
+                st.write_stream(response.narrative_tokens())
+
+        self.show_result_pages()
+
+        with st.sidebar.expander("Stage timings"):
+            spans = recent_spans.spans()[-20:]
+            if spans:
+                st.dataframe(pd.DataFrame([span.to_dict() for span in reversed(spans)]))
+
+    def run_question(self, user_query: str, summary_only: bool = False,
+                     poll_seconds: float = 0.25) -> BusinessInsightsGenerator.PipelineResult:
+        """run_pipeline with the session's cancellation wired in; with summary_only no rows are fetched.
+
+        The pipeline runs on a worker while the script thread keeps updating a status line.
+        Every st call lets Streamlit stop the script, so a new question, a stop or a closed
+        session interrupts it here and the token cancels the database query on the server.
+        """
+        cancel_token = QueryCostGuard.CancellationToken()
+        pending = get_question_executor().submit(self.businessAssistant.run_pipeline, user_query,
+                                                 summary_only=summary_only, cancel_token=cancel_token)
+        status = st.empty()
+        started = time.monotonic()
+        try:
+            while True:
+                try:
+                    return pending.result(timeout=poll_seconds)
+                except FutureTimeoutError:
+                    status.caption(f"Working on it... {time.monotonic() - started:.0f}s")
+        except BaseException:
+            # Streamlit's stop and rerun signals are BaseExceptions raised from the st call above
+            cancel_token.cancel()
+            raise
+        finally:
+            status.empty()
+
+    def show_result_pages(self, page_size: int = 100):
+        """Browse the last result one page at a time.
+
+        Pages within the rows run_pipeline already fetched are sliced from them; only pages
+        past a truncated result (or every page after a narrative-only run) are fetched.
+        """
+        sql_query = st.session_state.get("result_sql_query")
+        if not sql_query:
+            return
+        if not st.session_state.get("show_result_rows"):
+            if not st.button("Show result rows"):
+                return
+            st.session_state["show_result_rows"] = True
+
+        rows = st.session_state.get("result_rows")
+        complete = rows is not None and not rows.attrs.get("truncated")
+        pages = st.session_state.get("result_pages")
+        st.subheader("Result")
+        # The estimated row count may be low, so the page range is only capped once it is exact
+        if complete:
+            page_count = max(1, -(-len(rows) // page_size))
+        else:
+            page_count = pages.page_count if pages is not None and pages.row_count_is_exact else None
+        page_number = int(st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1))
+        start = (page_number - 1) * page_size
+        if rows is not None and (complete or start + page_size <= len(rows)):
+            st.dataframe(rows.iloc[start:start + page_size])
+            st.caption(f"{len(rows):,} rows" if complete else f"More than {len(rows):,} rows")
+            return
+
+        if pages is None:
+            pages = self.businessAssistant.db_connection_manager.paginate(sql_query, page_size)
+            st.session_state["result_pages"] = pages
+        if pages is None:
+            st.error("The result could not be loaded.")
+            return
+        st.dataframe(pages.page(page_number - 1))
+        row_count = pages.row_count()
+        if row_count is not None:
+            st.caption(f"{row_count:,} rows" if pages.row_count_is_exact else f"About {row_count:,} rows (estimated)")
 
 def main():
     # Fetching the environment variables
@@ -0,0 +1,84 @@
+import json
+import re
+import time
+from typing import Any, Iterator, List, Optional
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic stand-in for ChatGroq.
+
+    It recognises the three prompt kinds of this project (context validation, SQL
+    generation, narrative) and answers them from the prompt text alone. A fixed latency
+    plus a per-output-token delay simulates the remote model, so stage timings keep
+    their shape without a network.
+    """
+
+    latency_seconds: float = 0.0
+    seconds_per_token: float = 0.0
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        prompt = self._prompt_text(messages)
+        text = self._respond(prompt)
+        time.sleep(self.latency_seconds + self.seconds_per_token * len(text.split()))
+        message = AIMessage(content=text, usage_metadata=self._usage(prompt, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        prompt = self._prompt_text(messages)
+        text = self._respond(prompt)
+        time.sleep(self.latency_seconds)
+        for token in re.findall(r"\S+\s*", text):
+            time.sleep(self.seconds_per_token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(prompt, text)))
+
+    @staticmethod
+    def _prompt_text(messages: List[BaseMessage]) -> str:
+        return "\n".join(str(message.content) for message in messages)
+
+    @staticmethod
+    def _usage(prompt: str, text: str) -> dict:
+        input_tokens = len(prompt) // 4 + 1
+        output_tokens = len(text) // 4 + 1
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    def _respond(self, prompt: str) -> str:
+        self.calls += 1
+        if '"is_related"' in prompt:
+            return json.dumps({
+                "reasoning": "The question asks for data held in the database tables.",
+                "is_related": True,
+                "reframed_question": ""
+            })
+        if "SQL query" in prompt and "schema" in prompt:
+            return f"```sql\nSELECT TOP 100 * FROM [{self._best_table(prompt)}];\n```"
+        return ("<think>Looking at the summary statistics first.</think>"
+                "The result shows a steady distribution with a few dominant categories. "
+                "Amounts cluster around the median with a long upper tail, "
+                "which suggests a small group of records drives most of the value.")
+
+    @staticmethod
+    def _best_table(prompt: str) -> str:
+        """The schema table sharing most words with the question, first table on ties"""
+        tables = re.findall(r'^\s{4}"(\w+)": \{\s*$', prompt, flags=re.MULTILINE)
+        question = re.search(r'(?:question:\s*"|Question: )(.*)', prompt)
+        words = set(re.findall(r"[a-z]+", question.group(1).lower())) if question else set()
+        best, best_score = (tables[0] if tables else "UnknownTable"), 0
+        for table in tables:
+            stem = re.sub(r"\d+$", "", table).lower().rstrip("s")
+            score = sum(1 for word in words if word.rstrip("s") == stem)
+            if score > best_score:
+                best, best_score = table, score
+        return best
@@ -0,0 +1,211 @@
+import datetime
+import re
+import time
+from collections import namedtuple
+from decimal import Decimal
+from typing import Dict, List, Tuple
+
+NOUNS = ["Customers", "Orders", "Products", "Suppliers", "Employees", "Categories", "Invoices",
+         "Payments", "Shipments", "Regions"]
+CITIES = ["New York", "Boston", "Chicago", "Seattle", "Denver", "Austin", "Miami", "Portland"]
+# A row of sp_describe_first_result_set, with the attributes PagedResult reads
+DescribedColumn = namedtuple("DescribedColumn", ["name", "is_hidden", "is_part_of_unique_key", "system_type_name"])
+
+
+class StandInDatabase:
+    """Synthetic SQL Server stand-in reachable through a pyodbc-like `connect` callable.
+
+    It answers exactly the statements this project issues: the catalog probes behind
+    get_schema_info, the distinct-value and cardinality probes of DBQueryAssistant,
+    SHOWPLAN_XML estimates and simple `SELECT [TOP n] ... FROM [table]` data queries, plus the
+    result description, OFFSET/FETCH and `WHERE key > ?` pages PagedResult wraps around them.
+    Every table has the same column layout, is keyed and ordered by Id and references the table
+    at half its index, giving a tree of FKs.
+    """
+
+    COLUMNS = [("Id", "int"), ("Name", "nvarchar"), ("City", "varchar"), ("Amount", "decimal"),
+               ("Quantity", "int"), ("CreatedAt", "datetime"), ("IsActive", "bit"), ("ParentId", "int")]
+
+    def __init__(self, table_count: int, rows_per_table: int = 1000, query_latency_seconds: float = 0.0):
+        self.rows_per_table = rows_per_table
+        self.query_latency_seconds = query_latency_seconds
+        self.tables = [NOUNS[index] if index < len(NOUNS) else f"{NOUNS[index % len(NOUNS)]}{index}"
+                       for index in range(table_count)]
+        self.table_index = {table: index for index, table in enumerate(self.tables)}
+        self.modify_dates = {table: datetime.datetime(2024, 1, 1) for table in self.tables}
+        self.queries = 0
+
+    def connect(self, connection_string: str) -> "StandInConnection":
+        return StandInConnection(self)
+
+    def alter_table(self, table: str):
+        """Simulate DDL on a table, for schema snapshot refresh measurements"""
+        self.modify_dates[table] = datetime.datetime.now()
+
+    def relationships(self) -> List[Tuple[str, str, str, str]]:
+        return [(table, "ParentId", self.tables[index // 2], "Id")
+                for index, table in enumerate(self.tables) if index > 0]
+
+    def row(self, table: str, number: int) -> tuple:
+        index = self.table_index[table]
+        return (number, f"{table} item {number % 97}", CITIES[(number + index) % len(CITIES)],
+                Decimal(number * 37 % 1000) / 10, number % 25,
+                datetime.datetime(2024, 1, 1) + datetime.timedelta(hours=number),
+                number % 3 == 0, number // 2)
+
+    def run(self, sql: str, params: tuple) -> Tuple[List[str], List[tuple]]:
+        self.queries += 1
+        if self.query_latency_seconds:
+            time.sleep(self.query_latency_seconds)
+        text = " ".join(sql.split())
+        upper = text.upper()
+        if upper == "SELECT 1":
+            return ["1"], [(1,)]
+        if "SYS.OBJECTS" in upper:
+            return ["database_name", "table_name", "modify_date"], [
+                ("StandIn", table, self.modify_dates[table]) for table in self.tables]
+        if "SYS.COLUMNS" in upper:
+            tables = params or self.tables
+            return ["table_name", "column_name", "data_type"], [
+                (table, column, data_type) for table in sorted(tables) if table in self.table_index
+                for column, data_type in self.COLUMNS]
+        if "SYS.FOREIGN_KEYS" in upper:
+            wanted = set(params) if params else None
+            return ["TableName", "ColumnName", "ReferenceTableName", "ReferenceColumnName"], [
+                relationship for relationship in self.relationships()
+                if wanted is None or relationship[0] in wanted or relationship[2] in wanted]
+        if "DM_DB_PARTITION_STATS" in upper:
+            return ["row_count"], [(self.rows_per_table,)]
+        if "SP_DESCRIBE_FIRST_RESULT_SET" in upper:
+            return self.describe(params[0])
+
+        table = self._table(text)
+        if upper.startswith("SELECT COUNT(DISTINCT"):
+            return ["distinct_values"], [(min(self.rows_per_table, 97),)]
+        if upper.startswith("SELECT DISTINCT TOP"):
+            column = re.search(r"DISTINCT TOP \(\?\) \[?(\w+)\]?", text, flags=re.IGNORECASE).group(1)
+            position = [name for name, _ in self.COLUMNS].index(column)
+            values = {self.row(table, number)[position] for number in range(self.rows_per_table)}
+            return [column], [(value,) for value in sorted(values, key=str)][:params[0] if params else None]
+        if re.search(r"\bSELECT COUNT(_BIG)?\(\*\)", upper):
+            return [""], [(self.rows_per_table,)]
+
+        numbers = range(self.rows_per_table)
+        if re.search(r"\bWHERE \(\[\w+\] > \?\)", text):
+            # A keyset page: the key is Id, which is the row number
+            numbers = range(int(params[0]) + 1, self.rows_per_table)
+        page = re.search(r"\bOFFSET (\d+) ROWS FETCH NEXT (\d+) ROWS ONLY", upper)
+        if page:
+            numbers = numbers[int(page.group(1)):int(page.group(1)) + int(page.group(2))]
+        numbers = numbers[:self._limit(upper)]
+        selected = self._selected(text, table)
+        if selected is None:
+            return [name for name, _ in self.COLUMNS], [self.row(table, number) for number in numbers]
+        positions = [position for _, position in selected]
+        return [name for name, _ in selected], [tuple(self.row(table, number)[position] for position in positions)
+                                                for number in numbers]
+
+    def describe(self, sql: str) -> Tuple[List[str], List[tuple]]:
+        """sp_describe_first_result_set in browse mode: a key column that is not selected comes back hidden"""
+        text = " ".join(sql.split())
+        table = self._table(text)
+        selected = self._selected(text, table) or [(name, position) for position, (name, _) in enumerate(self.COLUMNS)]
+        types = dict(self.COLUMNS)
+        rows = [DescribedColumn(name, False, name == "Id", types[name]) for name, _ in selected]
+        if "Id" not in [name for name, _ in selected]:
+            rows.append(DescribedColumn("Id", True, True, "int"))
+        return list(DescribedColumn._fields), rows
+
+    def plan(self, sql: str) -> Tuple[List[str], List[tuple]]:
+        """Estimated plan of a data query: a clustered index scan, cost proportional to the rows read"""
+        self.queries += 1
+        text = " ".join(sql.split())
+        table = self._table(text)
+        rows = self._limit(text.upper())
+        xml = (f'<ShowPlanXML xmlns="http://schemas.microsoft.com/sqlserver/2004/07/showplan"><BatchSequence>'
+               f'<Batch><Statements><StmtSimple StatementSubTreeCost="{rows * 0.001 + 0.003}" '
+               f'StatementEstRows="{rows}"><QueryPlan><RelOp PhysicalOp="Clustered Index Scan" '
+               f'TableCardinality="{self.rows_per_table}"><IndexScan><Object Table="[{table}]"/></IndexScan>'
+               f'</RelOp></QueryPlan></StmtSimple></Statements></Batch></BatchSequence></ShowPlanXML>')
+        return ["Microsoft SQL Server 2005 XML Showplan"], [(xml,)]
+
+    def _selected(self, text: str, table: str):
+        """(column, position) for a plain column list in the select on the table; None for * or expressions,
+        which get every column"""
+        match = re.search(rf"\bSELECT (?:TOP \(?\d+\)? )?(.*?) FROM \[?{table}\]?", text, flags=re.IGNORECASE)
+        if match is None:
+            return None
+        names = [name for name, _ in self.COLUMNS]
+        selected = [item.strip().strip("[]") for item in match.group(1).split(",")]
+        if not all(name in names for name in selected):
+            return None
+        return [(name, names.index(name)) for name in selected]
+
+    def _limit(self, upper: str) -> int:
+        top = re.search(r"\bTOP \(?(\d+)\)?", upper)
+        return min(int(top.group(1)), self.rows_per_table) if top else self.rows_per_table
+
+    def _table(self, text: str) -> str:
+        match = re.search(r"\bFROM \[?(\w+)\]?", text, flags=re.IGNORECASE)
+        if not match or match.group(1) not in self.table_index:
+            raise RuntimeError(f"Stand-in database cannot answer: {text[:120]}")
+        return match.group(1)
+
+
+class StandInConnection:
+    def __init__(self, database: StandInDatabase):
+        self.database = database
+        self.timeout = 0
+        self.showplan = False
+
+    def cursor(self) -> "StandInCursor":
+        return StandInCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class StandInCursor:
+    def __init__(self, connection: StandInConnection):
+        self.connection = connection
+        self.database = connection.database
+        self.description = None
+        self._rows: List[tuple] = []
+        self._position = 0
+
+    def execute(self, sql: str, *params) -> "StandInCursor":
+        setting = re.fullmatch(r"\s*SET SHOWPLAN_XML (ON|OFF)\s*", sql, flags=re.IGNORECASE)
+        if setting:
+            self.connection.showplan = setting.group(1).upper() == "ON"
+            columns, self._rows = [], []
+        elif self.connection.showplan:
+            columns, self._rows = self.database.plan(sql)
+        else:
+            columns, self._rows = self.database.run(sql, params)
+        self.description = [(column, None, None, None, None, None, True) for column in columns] or None
+        self._position = 0
+        return self
+
+    def fetchone(self):
+        rows = self.fetchmany(1)
+        return rows[0] if rows else None
+
+    def fetchmany(self, size: int = 1) -> List[tuple]:
+        rows = self._rows[self._position:self._position + size]
+        self._position += len(rows)
+        return rows
+
+    def fetchall(self) -> List[tuple]:
+        return self.fetchmany(len(self._rows) - self._position)
+
+    def cancel(self):
+        self._position = len(self._rows)
+
+    def close(self):
+        pass
@@ -0,0 +1,183 @@
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, List
+
+# The project modules live in the repository root, one level up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import BusinessInsightsGenerator
+import DatabaseConnectionManager
+import DBQueryAssistant
+from FakeChatModel import FakeChatModel
+from StandInDatabase import StandInDatabase
+
+STAGES = ("validation", "generation", "execution", "first_token", "narrative")
+
+
+def percentile(durations: List[float], q: float) -> float:
+    ordered = sorted(durations)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000 if ordered else 0.0
+
+
+def timed(timings: Dict[str, List[float]], stage: str, started: float) -> float:
+    now = time.perf_counter()
+    timings[stage].append(now - started)
+    return now
+
+
+def run_questions(generator: BusinessInsightsGenerator.BusinessInsightsGenerator,
+                  questions: List[Dict]) -> Dict:
+    """Replay the questions stage by stage, the way app.py drives the generator"""
+    timings: Dict[str, List[float]] = defaultdict(list)
+    failures = 0
+    started_all = time.perf_counter()
+    for item in questions:
+        started = time.perf_counter()
+        is_related, _, _ = generator.validate_query_context(item["question"])
+        started = timed(timings, "validation", started)
+        if not is_related:
+            failures += 1
+            continue
+        sql_query = generator.generate_sql_query(item["question"])
+        started = timed(timings, "generation", started)
+        df = generator.db_connection_manager.execute_query(sql_query) if sql_query else None
+        started = timed(timings, "execution", started)
+        if df is None:
+            failures += 1
+            continue
+        narrative_started = started
+        first_token = True
+        for _ in generator.stream_narrative_insights(df, item["question"]):
+            if first_token:
+                timed(timings, "first_token", narrative_started)
+                first_token = False
+        timed(timings, "narrative", narrative_started)
+    wall_seconds = time.perf_counter() - started_all
+    return {
+        "questions": len(questions),
+        "failures": failures,
+        "wall_seconds": wall_seconds,
+        "questions_per_second": len(questions) / wall_seconds if wall_seconds else 0.0,
+        "stages": {stage: {"count": len(timings[stage]),
+                           "p50_ms": percentile(timings[stage], 0.5),
+                           "p90_ms": percentile(timings[stage], 0.9),
+                           "max_ms": percentile(timings[stage], 1.0)}
+                   for stage in STAGES if timings[stage]},
+    }
+
+
+def benchmark_size(table_count: int, questions: List[Dict], args) -> Dict:
+    database = StandInDatabase(table_count, rows_per_table=args.rows, query_latency_seconds=args.db_latency)
+    llm = FakeChatModel(latency_seconds=args.llm_latency, seconds_per_token=args.token_latency)
+    result = {"tables": table_count}
+    with tempfile.TemporaryDirectory(prefix="schema_cache_") as cache_dir:
+        for start in ("cold", "warm"):
+            # A fresh manager per start; "warm" reuses the schema snapshot written by "cold"
+            queries_before = database.queries
+            # A full collection over the imported libraries takes ~100ms; keep it out of either start
+            gc.collect()
+            started = time.perf_counter()
+            manager = DatabaseConnectionManager.DatabaseConnectionManager(
+                "stand-in", connect=database.connect, schema_cache_dir=cache_dir)
+            generator = BusinessInsightsGenerator.BusinessInsightsGenerator(
+                "stand-in", api_key="", llm=llm, db_connection_manager=manager)
+            result[f"{start}_startup_ms"] = (time.perf_counter() - started) * 1000
+            result[f"{start}_startup_queries"] = database.queries - queries_before
+
+        result["pipeline"] = run_questions(generator, questions)
+        result["prompts"] = generator.prompt_manager.prompt_stats()
+        result["question_cache"] = generator.sql_cache.stats()
+        result["result_cache"] = manager.result_cache.stats()
+        result["pool"] = manager.pool_metrics()
+
+        # Spelling suggestions: the first call builds the value index, the second reads it
+        assistant = DBQueryAssistant.DBQueryAssistant("stand-in", groq_api_key="", llm=llm,
+                                                      db_connection_manager=manager)
+        for start in ("cold", "warm"):
+            started = time.perf_counter()
+            for item in questions:
+                assistant.suggest_corrections(item["question"])
+            result[f"corrections_{start}_ms"] = (time.perf_counter() - started) * 1000
+        manager.pool.close()
+        generator.executor.shutdown(wait=False)
+    result["llm_calls"] = llm.calls
+    result["db_queries"] = database.queries
+    result["peak_memory_mb"] = peak_memory_mb(table_count, questions, args)
+    return result
+
+
+def peak_memory_mb(table_count: int, questions: List[Dict], args) -> float:
+    """Peak traced memory of a cold start, the questions and the corrections.
+
+    Run as a separate pass because tracemalloc slows every allocation down, which would
+    distort the timings above.
+    """
+    database = StandInDatabase(table_count, rows_per_table=args.rows)
+    llm = FakeChatModel()
+    with tempfile.TemporaryDirectory(prefix="schema_cache_") as cache_dir:
+        tracemalloc.start()
+        manager = DatabaseConnectionManager.DatabaseConnectionManager(
+            "stand-in", connect=database.connect, schema_cache_dir=cache_dir)
+        generator = BusinessInsightsGenerator.BusinessInsightsGenerator(
+            "stand-in", api_key="", llm=llm, db_connection_manager=manager)
+        run_questions(generator, questions)
+        assistant = DBQueryAssistant.DBQueryAssistant("stand-in", groq_api_key="", llm=llm,
+                                                      db_connection_manager=manager)
+        for item in questions:
+            assistant.suggest_corrections(item["question"])
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+        manager.pool.close()
+        generator.executor.shutdown(wait=False)
+    return peak
+
+
+def report(results: List[Dict]) -> str:
+    lines = []
+    for result in results:
+        pipeline = result["pipeline"]
+        lines.append(f"== {result['tables']} tables: startup cold {result['cold_startup_ms']:.0f}ms "
+                     f"({result['cold_startup_queries']} queries), warm {result['warm_startup_ms']:.0f}ms "
+                     f"({result['warm_startup_queries']} queries), peak memory {result['peak_memory_mb']:.1f}MB")
+        lines.append(f"{'stage':<12}{'count':>7}{'p50_ms':>10}{'p90_ms':>10}{'max_ms':>10}")
+        for stage, stats in pipeline["stages"].items():
+            lines.append(f"{stage:<12}{stats['count']:>7}{stats['p50_ms']:>10.1f}"
+                         f"{stats['p90_ms']:>10.1f}{stats['max_ms']:>10.1f}")
+        lines.append(f"{pipeline['questions_per_second']:.2f} questions/s, {pipeline['failures']} failed, "
+                     f"corrections cold {result['corrections_cold_ms']:.0f}ms / "
+                     f"warm {result['corrections_warm_ms']:.0f}ms")
+        lines.append(f"prompts: {json.dumps(result['prompts'], default=str)}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks against a stand-in database and chat model")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000],
+                        help="Schema sizes (table counts) to measure")
+    parser.add_argument("--questions", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                            "questions.jsonl"))
+    parser.add_argument("--rows", type=int, default=1000, help="Rows per stand-in table")
+    parser.add_argument("--db-latency", type=float, default=0.0, help="Seconds added to every database query")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds added to every LLM call")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Seconds per generated token")
+    parser.add_argument("--json", help="Also write the raw results to this file")
+    args = parser.parse_args()
+
+    with open(args.questions, "r", encoding="utf-8") as questions_file:
+        questions = [json.loads(line) for line in questions_file if line.strip()]
+    results = [benchmark_size(size, questions, args) for size in args.sizes]
+    print(report(results))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as json_file:
+            json.dump(results, json_file, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
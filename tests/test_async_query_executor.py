@@ -0,0 +1,160 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+import AsyncQueryExecutor
+import QueryCostGuard
+
+
+class BlockingCursor:
+    """Cursor stand-in whose execute blocks until the query is released or cancelled"""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.released = threading.Event()
+        self.cancelled = False
+
+    def execute(self, sql: str):
+        self.started.set()
+        self.released.wait(5)
+        if self.cancelled:
+            raise RuntimeError("Operation cancelled")
+        if sql == "fail":
+            raise RuntimeError("Invalid object name")
+        return self
+
+    def cancel(self):
+        self.cancelled = True
+        self.released.set()
+
+
+class BlockingManager:
+    """The part of DatabaseConnectionManager the executor uses, with a blocking cursor per query"""
+
+    def __init__(self, connection_string: str):
+        self.connection_string = connection_string
+        self.pool = SimpleNamespace(max_size=1)
+        self.cursors = []
+        self._cursor_added = threading.Condition()
+
+    def execute_query(self, query, max_rows=None, max_bytes=None, cancel_token=None, timeout_seconds=None):
+        cursor = BlockingCursor()
+        with self._cursor_added:
+            self.cursors.append(cursor)
+            self._cursor_added.notify_all()
+        unregister = cancel_token.register(cursor.cancel)
+        try:
+            cursor.execute(query)
+        finally:
+            unregister()
+        return query
+
+    def cursor(self, position: int) -> BlockingCursor:
+        with self._cursor_added:
+            self._cursor_added.wait_for(lambda: len(self.cursors) > position, timeout=5)
+            cursor = self.cursors[position]
+        assert cursor.started.wait(5)
+        return cursor
+
+
+@pytest.fixture
+def manager(request):
+    # Slots are shared per connection string, so every test gets its own
+    return BlockingManager(f"stand-in-{request.node.name}")
+
+
+async def started(manager: BlockingManager, position: int) -> BlockingCursor:
+    return await asyncio.get_running_loop().run_in_executor(None, manager.cursor, position)
+
+
+async def idle(executor: AsyncQueryExecutor.AsyncQueryExecutor):
+    # The slot is released by the query thread once the cursor returns
+    deadline = time.monotonic() + 5
+    while executor.metrics()["running"] and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    return executor.metrics()
+
+
+def test_cancelling_the_task_cancels_the_running_query(manager):
+    async def scenario():
+        executor = AsyncQueryExecutor.AsyncQueryExecutor(manager, max_concurrency=1, max_waiting=0)
+        task = asyncio.ensure_future(executor.execute_query("SELECT 1"))
+        cursor = await started(manager, 0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert cursor.cancelled
+        assert (await idle(executor))["running"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_callers_over_the_limit_wait_and_are_refused_past_max_waiting(manager):
+    async def scenario():
+        executor = AsyncQueryExecutor.AsyncQueryExecutor(manager, max_concurrency=1, max_waiting=1)
+        running = asyncio.ensure_future(executor.execute_query("first"))
+        first = await started(manager, 0)
+        waiting = asyncio.ensure_future(executor.execute_query("second"))
+        await asyncio.sleep(0.05)
+        assert executor.metrics() == {"limit": 1, "running": 1, "waiting": 1}
+        assert len(manager.cursors) == 1
+
+        with pytest.raises(AsyncQueryExecutor.QueryQueueFull):
+            await executor.execute_query("third")
+
+        first.released.set()
+        assert await running == "first"
+        (await started(manager, 1)).released.set()
+        assert await waiting == "second"
+        assert (await idle(executor)) == {"limit": 1, "running": 0, "waiting": 0}
+
+    asyncio.run(scenario())
+
+
+def test_waiting_past_the_queue_timeout_is_refused(manager):
+    async def scenario():
+        executor = AsyncQueryExecutor.AsyncQueryExecutor(manager, max_concurrency=1, max_waiting=0,
+                                                         queue_timeout=0.05)
+        running = asyncio.ensure_future(executor.execute_query("first"))
+        first = await started(manager, 0)
+        with pytest.raises(AsyncQueryExecutor.QueryQueueFull):
+            await executor.execute_query("second")
+        assert executor.metrics()["waiting"] == 0
+
+        first.released.set()
+        await running
+
+    asyncio.run(scenario())
+
+
+def test_the_slot_is_released_after_an_error(manager):
+    async def scenario():
+        executor = AsyncQueryExecutor.AsyncQueryExecutor(manager, max_concurrency=1, max_waiting=0)
+        failing = asyncio.ensure_future(executor.execute_query("fail"))
+        (await started(manager, 0)).released.set()
+        with pytest.raises(RuntimeError):
+            await failing
+        assert (await idle(executor))["running"] == 0
+
+        # The freed slot admits the next query
+        following = asyncio.ensure_future(executor.execute_query("SELECT 1"))
+        (await started(manager, 1)).released.set()
+        assert await following == "SELECT 1"
+
+    asyncio.run(scenario())
+
+
+def test_a_session_token_cancels_the_query_and_frees_the_slot(manager):
+    async def scenario():
+        executor = AsyncQueryExecutor.AsyncQueryExecutor(manager, max_concurrency=1, max_waiting=0)
+        session = QueryCostGuard.CancellationToken()
+        task = asyncio.ensure_future(executor.execute_query("SELECT 1", cancel_token=session))
+        cursor = await started(manager, 0)
+        session.cancel()
+        with pytest.raises(RuntimeError):
+            await task
+        assert cursor.cancelled
+        assert (await idle(executor))["running"] == 0
+
+    asyncio.run(scenario())
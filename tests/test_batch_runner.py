@@ -0,0 +1,26 @@
+import pytest
+
+pytest.importorskip("pyodbc", exc_type=ImportError)
+pytest.importorskip("langchain_groq", exc_type=ImportError)
+
+import BatchRunner
+import StreamingStats
+
+
+def test_result_files_stay_inside_the_results_directory():
+    questions = [{"id": "../../etc/passwd", "question": "q"}, {"id": "north/south", "question": "q"},
+                 {"id": "???", "question": "q"}]
+    names = BatchRunner.BatchRunner.result_file_names(questions)
+    assert names == ["00001_etc-passwd.parquet", "00002_north-south.parquet", "00003_.parquet"]
+    assert all("/" not in name and not name.startswith(".") for name in names)
+
+
+def test_duplicate_ids_are_rejected():
+    with pytest.raises(ValueError, match="q1"):
+        BatchRunner.BatchRunner.result_file_names([{"id": "q1", "question": "a"}, {"id": "q1", "question": "b"}])
+
+
+def test_unique_column_names():
+    assert StreamingStats.unique_column_names(["City", "", "City", None]) == \
+        ["City", "column_2", "City_3", "column_4"]
+    assert StreamingStats.unique_column_names(["a", "a", "a_2", 0]) == ["a", "a_2", "a_2_3", "0"]
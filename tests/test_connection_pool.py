@@ -0,0 +1,101 @@
+import pytest
+
+pytest.importorskip("pyodbc", exc_type=ImportError)
+
+import DatabaseConnectionManager
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql):
+        return self
+
+    def fetchone(self):
+        return (1,)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(DatabaseConnectionManager.time, "monotonic", clock)
+    return clock
+
+
+def make_pool(**kwargs):
+    connections = []
+
+    def connect(connection_string):
+        connections.append(FakeConnection())
+        return connections[-1]
+
+    return DatabaseConnectionManager.ConnectionPool("fake", connect=connect, **kwargs), connections
+
+
+def test_connections_in_use_are_closed_when_returned_after_close():
+    pool, connections = make_pool()
+    with pool.connection():
+        pool.close()
+        assert not connections[0].closed
+    assert connections[0].closed
+    assert pool.metrics()["open"] == 0 and pool.metrics()["in_use"] == 0
+    assert pool.metrics()["idle"] == 0
+
+
+def test_checkout_after_close_fails():
+    pool, _ = make_pool()
+    pool.close()
+    with pytest.raises(RuntimeError):
+        with pool.connection():
+            pass
+
+
+def test_expired_idle_connections_are_evicted_from_the_old_end(clock):
+    pool, connections = make_pool(max_idle_seconds=60)
+    # Two connections go idle; the first returned one is the least recently used
+    with pool.connection():
+        with pool.connection():
+            pass
+        clock.now += 50
+    assert pool.metrics()["idle"] == 2
+
+    # The most recently used one keeps getting reused, the older one still expires
+    clock.now += 20
+    with pool.connection() as conn:
+        assert conn is connections[0]
+    assert connections[1].closed and not connections[0].closed
+    assert pool.metrics()["open"] == 1 and pool.metrics()["idle"] == 1
+
+
+def test_checkin_evicts_idle_connections_past_their_lifetime(clock):
+    pool, connections = make_pool(max_idle_seconds=600, max_lifetime_seconds=100)
+    first = pool._checkout()
+    clock.now += 50
+    second = pool._checkout()
+    pool._checkin(first)
+    clock.now += 51
+    # The idle first connection is past its lifetime though not its idle limit
+    pool._checkin(second)
+    assert connections[0].closed and not connections[1].closed
+    assert pool.metrics()["open"] == 1 and pool.metrics()["idle"] == 1
@@ -0,0 +1,73 @@
+import os
+import sys
+import pytest
+
+pytest.importorskip("pyodbc", exc_type=ImportError)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import DatabaseConnectionManager
+import StandInDatabase
+
+QUERY = "SELECT Id, Name, City FROM [Customers]"
+
+
+@pytest.fixture
+def cancels(monkeypatch):
+    cancelled = []
+    cancel = StandInDatabase.StandInCursor.cancel
+
+    def counting_cancel(cursor):
+        cancelled.append(cursor)
+        cancel(cursor)
+
+    monkeypatch.setattr(StandInDatabase.StandInCursor, "cancel", counting_cancel)
+    return cancelled
+
+
+@pytest.fixture
+def manager(tmp_path):
+    database = StandInDatabase.StandInDatabase(3, rows_per_table=50)
+    # Small batches so the limits fall inside a batch; no result cache so every call fetches
+    manager = DatabaseConnectionManager.DatabaseConnectionManager(
+        "stand-in-fetch", connect=database.connect, schema_cache_dir=str(tmp_path), fetch_batch_size=7,
+        result_cache_ttl=0)
+    yield manager
+    manager.pool.close()
+
+
+@pytest.mark.parametrize("max_rows, rows, truncated", [
+    (20, 20, True),
+    (49, 49, True),
+    # Exactly as many rows as the result has: the extra row fetched to detect more is not there
+    (50, 50, False),
+    (0, 50, False),
+])
+def test_rows_past_max_rows_are_not_fetched(manager, cancels, max_rows, rows, truncated):
+    df = manager.execute_query(QUERY, max_rows=max_rows, max_bytes=0)
+    assert len(df) == rows and df.attrs["rows_fetched"] == rows
+    assert list(df["Id"]) == list(range(rows))
+    assert df.attrs["truncated"] is truncated and df.attrs["summary"]["truncated"] is truncated
+    # A truncated query is cancelled so the server stops producing the rest
+    assert bool(cancels) is truncated
+
+
+def test_rows_past_max_bytes_are_not_fetched(manager, cancels):
+    complete = manager.execute_query(QUERY, max_rows=0, max_bytes=0)
+    assert not complete.attrs["truncated"]
+    budget = complete.attrs["bytes_fetched"] // 3
+
+    df = manager.execute_query(QUERY, max_rows=0, max_bytes=budget)
+    assert df.attrs["truncated"]
+    assert 0 < len(df) < len(complete)
+    assert df.attrs["bytes_fetched"] <= budget
+    # Whole rows only, in order
+    assert list(df["Id"]) == list(range(len(df)))
+    assert cancels
+
+
+def test_batches_report_the_limits_in_the_status(manager):
+    status = {}
+    batches = list(manager._fetch_column_batches(QUERY, 7, max_rows=10, max_bytes=0, status=status))
+    assert [len(batch[0]) for _, batch in batches] == [7, 3]
+    assert batches[0][0] == ["Id", "Name", "City"]
+    assert status["rows"] == 10 and status["truncated"] is True
@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+import IntentMatcher
+import SqlValidator
+
+SCHEMA = {"tables": {"Products": {"columns": {"ProductID": "int", "ProductName": "nvarchar", "UnitPrice": "money"}},
+                     "OrderDetails": {"columns": {"OrderID": "int", "ProductID": "int", "UnitPrice": "money",
+                                                  "Quantity": "smallint"}}},
+          "relationships": [{"table": "OrderDetails", "column": "ProductID",
+                             "referenced_table": "Products", "referenced_column": "ProductID"}]}
+
+
+def test_no_database_driver_is_imported():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    loaded = subprocess.run([sys.executable, "-c", "import sys, IntentMatcher; print('pyodbc' in sys.modules)"],
+                            cwd=root, capture_output=True, text=True, check=True).stdout.strip()
+    assert loaded == "False"
+
+
+def test_the_named_tables_column_is_preferred():
+    match = IntentMatcher.IntentMatcher(SCHEMA).match("total unit price by product")
+    assert match.tables == ["Products"]
+    assert "SUM([UnitPrice])" in match.sql and "OrderDetails" not in match.sql
+    SqlValidator.SqlValidator(SCHEMA).validate(match.sql)
+
+
+def test_a_referencing_tables_column_is_used_when_the_named_table_has_none():
+    match = IntentMatcher.IntentMatcher(SCHEMA).match("total quantity by product")
+    assert match.tables == ["Products", "OrderDetails"]
+    SqlValidator.SqlValidator(SCHEMA).validate(match.sql)
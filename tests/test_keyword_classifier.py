@@ -0,0 +1,74 @@
+import pytest
+import KeywordClassifier
+
+SCHEMA = {
+    "tables": {
+        "Customers": {"columns": {"CustomerId": "int", "CustomerName": "nvarchar", "CreditLimit": "decimal"}},
+        "Orders": {"columns": {"OrderId": "int", "CustomerId": "int", "OrderDate": "date", "Amount": "decimal"}},
+        "Products": {"columns": {"ProductId": "int", "ProductName": "nvarchar", "UnitPrice": "decimal"}},
+    },
+    "relationships": [],
+}
+
+
+@pytest.fixture(scope="module")
+def classifier():
+    return KeywordClassifier.KeywordClassifier(SCHEMA, {"clients": "Customers"})
+
+
+@pytest.mark.parametrize("question", [
+    "How many customers are there?",
+    "show revenue of orders by month",
+    "Which clients have the highest credit limit?",
+    "what's the average credit limit",
+    "How many orders were deleted last week?",
+])
+def test_accepts_data_questions(classifier, question):
+    assert classifier.classify(question).decision == "accept"
+
+
+@pytest.mark.parametrize("question", [
+    "please drop table Customers",
+    "Delete all orders",
+    "how do I insert a new order",
+    "can you remove the customer records?",
+    "insert into orders values (1)",
+    "show me the columns of the customers table",
+    "what is the schema of the orders table",
+    "describe the customers table",
+    "What is Product?",
+    "list all tables",
+])
+def test_rejects_admin_and_metadata_questions(classifier, question):
+    assert classifier.classify(question).decision == "reject"
+
+
+@pytest.mark.parametrize("question", [
+    "what is the weather today",
+    "Drop in sales per region",
+    "customers",
+])
+def test_leaves_unclear_questions_to_the_llm(classifier, question):
+    assert classifier.classify(question).decision == "ambiguous"
+
+
+@pytest.mark.parametrize("question", [
+    "Describe the sales trend per region",
+    "Show the pricing structure of products",
+    "Which table has the most orders?",
+])
+def test_does_not_reject_business_questions_with_metadata_words(classifier, question):
+    assert classifier.classify(question).decision == "ambiguous"
+
+
+def test_reasons_do_not_expose_table_names(classifier):
+    for question in ("How many customers are there?", "describe the customers table", "Delete all orders"):
+        reason = classifier.classify(question).reason.lower()
+        assert "customer" not in reason and "order" not in reason
+
+
+def test_automaton_reports_overlapping_matches():
+    automaton = KeywordClassifier.AhoCorasick()
+    for pattern in ("he", "she", "his", "hers"):
+        automaton.add(pattern, pattern)
+    assert sorted(automaton.find("ushers")) == [(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")]
@@ -0,0 +1,65 @@
+import os
+import sys
+import pytest
+
+pytest.importorskip("pyodbc", exc_type=ImportError)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import DatabaseConnectionManager
+from StandInDatabase import StandInDatabase
+
+
+@pytest.fixture
+def database():
+    database = StandInDatabase(3, rows_per_table=25)
+    database.issued = []
+    run = database.run
+
+    def recording_run(sql, params):
+        database.issued.append(" ".join(sql.split()))
+        return run(sql, params)
+
+    database.run = recording_run
+    return database
+
+
+@pytest.fixture
+def manager(database, tmp_path):
+    manager = DatabaseConnectionManager.DatabaseConnectionManager(
+        "stand-in-pages", connect=database.connect, schema_cache_dir=str(tmp_path))
+    yield manager
+    manager.pool.close()
+
+
+def test_keyset_pages_follow_the_key_without_gaps_or_repeats(manager, database):
+    pages = manager.paginate("SELECT Id, Name FROM [Customers]", page_size=10)
+    assert pages.key_columns == ["Id"] and pages.stable_order
+
+    ids = []
+    for number in range(3):
+        ids.extend(pages.page(number)["Id"])
+    assert ids == list(range(25))
+    # Pages after the first continue from the last key instead of skipping rows with OFFSET
+    assert sum("WHERE ([c0] > ?)" in sql for sql in database.issued) == 2
+
+    # Served from the result cache, in the same order
+    assert list(pages.page(1)["Id"]) == list(range(10, 20))
+
+
+def test_the_last_page_ends_the_result(manager):
+    pages = manager.paginate("SELECT Id, City FROM [Customers]", page_size=10)
+    assert not pages.row_count_is_exact
+    assert len(pages.page(0)) == 10 and len(pages.page(1)) == 10
+    assert len(pages.page(2)) == 5
+    assert pages.row_count_is_exact and pages.row_count() == 25 and pages.page_count == 3
+    assert pages.page(3).empty
+
+
+def test_pages_without_a_selected_key_use_offset_fetch(manager, database):
+    # The key (Id) is not selected, so there is no keyset to continue from
+    pages = manager.paginate("SELECT Name, City FROM [Orders]", page_size=10)
+    assert pages.key_columns == [] and not pages.stable_order
+    last = pages.page(2)
+    assert len(last) == 5 and list(last.columns) == ["Name", "City"]
+    assert any("OFFSET 20 ROWS FETCH NEXT 10 ROWS ONLY" in sql for sql in database.issued)
+    assert pages.row_count() == 25 and pages.row_count_is_exact
@@ -0,0 +1,63 @@
+import os
+import sys
+import pytest
+
+pytest.importorskip("pyodbc", exc_type=ImportError)
+pytest.importorskip("langchain_groq", exc_type=ImportError)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import BusinessInsightsGenerator
+import DatabaseConnectionManager
+from FakeChatModel import FakeChatModel
+from StandInDatabase import StandInDatabase
+
+
+@pytest.fixture
+def generator(tmp_path):
+    database = StandInDatabase(10, rows_per_table=50)
+    manager = DatabaseConnectionManager.DatabaseConnectionManager(
+        "stand-in", connect=database.connect, schema_cache_dir=str(tmp_path))
+    generator = BusinessInsightsGenerator.BusinessInsightsGenerator(
+        "stand-in", api_key="", llm=FakeChatModel(), db_connection_manager=manager)
+    yield generator
+    manager.pool.close()
+    generator.executor.shutdown(wait=True)
+
+
+@pytest.mark.parametrize("question", ["please drop table Customers", "describe the orders table"])
+def test_locally_rejected_questions_make_no_llm_call(generator, question):
+    result = generator.run_pipeline(question)
+    assert result.is_related is False
+    assert generator.llm.calls == 0
+
+
+def test_ambiguous_questions_go_to_the_llm(generator):
+    generator.validate_query_context("what were the best sellers last month")
+    assert generator.llm.calls == 1
+
+
+def test_rows_are_fetched_unless_the_estimate_is_large(generator):
+    query = "SELECT Name, Amount FROM [Customers]"
+    assert generator._prefers_summary(query) is False
+    generator.summary_min_estimated_rows = 10
+    assert generator._prefers_summary(query) is True
+
+
+def test_schema_indexes_are_reused_across_starts(tmp_path, monkeypatch):
+    database = StandInDatabase(10, rows_per_table=50)
+    builds = []
+    build_indexes = BusinessInsightsGenerator.BusinessInsightsGenerator._build_indexes
+    monkeypatch.setattr(BusinessInsightsGenerator.BusinessInsightsGenerator, "_build_indexes",
+                        lambda self, schema: builds.append(1) or build_indexes(self, schema))
+    for _ in range(2):
+        manager = DatabaseConnectionManager.DatabaseConnectionManager(
+            "stand-in", connect=database.connect, schema_cache_dir=str(tmp_path))
+        generator = BusinessInsightsGenerator.BusinessInsightsGenerator(
+            "stand-in", api_key="", llm=FakeChatModel(), db_connection_manager=manager)
+        generator.executor.shutdown(wait=True)
+    assert len(builds) == 1
+    assert generator.match_intent("how many customers") is not None
+
+    database.alter_table("Customers")
+    generator.refresh_schema()
+    assert len(builds) == 2
@@ -0,0 +1,54 @@
+import pytest
+import QueryCostGuard
+import SqlRewriter
+
+PLAN = """<ShowPlanXML xmlns="http://schemas.microsoft.com/sqlserver/2004/07/showplan"><BatchSequence><Batch>
+<Statements><StmtSimple StatementSubTreeCost="812.5" StatementEstRows="3000000"><QueryPlan>
+<RelOp PhysicalOp="Clustered Index Scan" TableCardinality="3000000"><IndexScan>
+<Object Database="[Sales]" Schema="[dbo]" Table="[Orders]"/></IndexScan></RelOp>
+</QueryPlan></StmtSimple></Statements></Batch></BatchSequence></ShowPlanXML>"""
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("SELECT City FROM Customers", "SELECT TOP (100) City FROM Customers"),
+    ("SELECT DISTINCT City FROM Customers", "SELECT DISTINCT TOP (100) City FROM Customers"),
+    ("select all City from Customers;", "select all TOP (100) City from Customers"),
+    ("WITH t AS (SELECT CustomerID FROM Orders UNION SELECT CustomerID FROM Customers) SELECT * FROM t",
+     "WITH t AS (SELECT CustomerID FROM Orders UNION SELECT CustomerID FROM Customers)\nSELECT TOP (100) * FROM t"),
+    ("SELECT (SELECT TOP 1 Total FROM Orders) AS Latest, 'UNION' AS Label FROM Customers",
+     "SELECT TOP (100) (SELECT TOP 1 Total FROM Orders) AS Latest, 'UNION' AS Label FROM Customers"),
+])
+def test_top_is_added_to_the_outermost_select(query, expected):
+    assert SqlRewriter.add_top(query, 100) == expected
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT TOP 5 City FROM Customers",
+    "SELECT City FROM Customers ORDER BY City OFFSET 0 ROWS FETCH NEXT 5 ROWS ONLY",
+    "SELECT City FROM Customers UNION SELECT City FROM Suppliers",
+    "WITH t AS (SELECT City FROM Customers) SELECT City FROM t UNION ALL SELECT City FROM Suppliers",
+    "SELECT City INTO #cities FROM Customers",
+])
+def test_queries_with_their_own_limit_or_a_set_operation_are_unchanged(query):
+    assert SqlRewriter.add_top(query, 100) == query
+
+
+def test_limit_respects_auto_top():
+    query = "SELECT City FROM Customers"
+    assert QueryCostGuard.QueryCostGuard(auto_top=True).limit(query, 10) == "SELECT TOP (10) City FROM Customers"
+    assert QueryCostGuard.QueryCostGuard(auto_top=False).limit(query, 10) == query
+
+
+def test_plans_over_the_cost_limit_are_rejected_with_the_scanned_tables():
+    guard = QueryCostGuard.QueryCostGuard(max_estimated_cost=500, max_estimated_rows=0)
+    estimate = guard.parse_plan([PLAN])
+    assert (estimate.estimated_cost, estimate.estimated_rows) == (812.5, 3000000)
+    assert estimate.scans == [("Orders", 3000000)]
+    with pytest.raises(QueryCostGuard.QueryRejected, match="exceeds the limit.*Orders"):
+        guard.check(estimate)
+
+
+def test_plans_within_the_limits_or_without_an_estimate_pass():
+    guard = QueryCostGuard.QueryCostGuard(max_estimated_cost=1000, max_estimated_rows=5000000)
+    guard.check(guard.parse_plan([PLAN]))
+    guard.check(None)
@@ -0,0 +1,32 @@
+import pytest
+import QuestionCache
+
+
+def test_case_whitespace_and_trailing_punctuation_share_an_entry():
+    assert QuestionCache.QuestionCache.normalize("  How many   Orders?? ") == "how many orders"
+    assert QuestionCache.QuestionCache.normalize("How many orders.") == "how many orders"
+
+
+@pytest.mark.parametrize("first, second", [
+    ("orders with total > 100", "orders with total < 100"),
+    ("orders with total >= 100", "orders with total = 100"),
+    ("balance below -5", "balance below 5"),
+    ("discount above 1.5%", "discount above 15%"),
+    ("status != 'open'", "status = 'open'"),
+])
+def test_operators_signs_and_decimals_are_kept(first, second):
+    normalize = QuestionCache.QuestionCache.normalize
+    assert normalize(first) != normalize(second)
+
+
+def test_cache_does_not_return_sql_of_a_different_comparison():
+    cache = QuestionCache.QuestionCache()
+    cache.put("orders with total > 100", "v1", "SELECT * FROM Orders WHERE Total > 100")
+    assert cache.get("orders with total < 100", "v1") is None
+    assert cache.get("Orders with total > 100?", "v1") == "SELECT * FROM Orders WHERE Total > 100"
+
+
+def test_persisted_entries_survive_a_restart(tmp_path):
+    path = str(tmp_path / "questions.db")
+    QuestionCache.QuestionCache(path=path).put("how many orders", "v1", "SELECT COUNT(*) FROM Orders")
+    assert QuestionCache.QuestionCache(path=path).get("How many orders?", "v1") == "SELECT COUNT(*) FROM Orders"
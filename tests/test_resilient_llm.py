@@ -0,0 +1,65 @@
+import threading
+import pytest
+import ResilientLLM
+
+
+class BlockingModel:
+    """Chain stand-in whose invoke waits until released"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = 0
+
+    def invoke(self, chain_input, config=None):
+        self.calls += 1
+        self.release.wait(5)
+        return "answer"
+
+
+class StallingStreamModel:
+    """Chain stand-in whose stream yields one chunk and then waits until released"""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def stream(self, chain_input, config=None):
+        yield "first"
+        self.release.wait(5)
+        yield "second"
+
+
+def test_hedging_is_off_by_default(monkeypatch):
+    monkeypatch.delenv("LLM_HEDGE_PERCENTILE", raising=False)
+    assert ResilientLLM.ResilientLLM([object()]).hedge_percentile == 0
+
+
+def test_abandoned_calls_are_bounded():
+    model = BlockingModel()
+    caller = ResilientLLM.ResilientLLM([model], deadlines={"validation": 0.05}, retries=0, max_abandoned=1)
+    with pytest.raises(ResilientLLM.LLMDeadlineExceeded):
+        caller.invoke("validation", lambda llm: llm, "question")
+    assert caller.abandoned == 1
+
+    # The hung call still holds a worker, so new calls are refused instead of queueing behind it
+    with pytest.raises(ResilientLLM.LLMBusy):
+        caller.invoke("validation", lambda llm: llm, "question")
+    assert model.calls == 1
+
+    model.release.set()
+    caller.executor.shutdown(wait=True)
+    assert caller.abandoned == 0
+
+
+def test_a_stream_that_stalls_after_its_first_chunk_ends_at_the_deadline():
+    model = StallingStreamModel()
+    caller = ResilientLLM.ResilientLLM([model], deadlines={"narrative": 0.1}, retries=0)
+    chunks = []
+    with pytest.raises(ResilientLLM.LLMDeadlineExceeded):
+        for chunk in caller.stream("narrative", lambda llm: llm, "question"):
+            chunks.append(chunk)
+    assert chunks == ["first"]
+    assert caller.abandoned == 1
+
+    model.release.set()
+    caller.executor.shutdown(wait=True)
+    assert caller.abandoned == 0
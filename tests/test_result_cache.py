@@ -0,0 +1,50 @@
+import pandas as pd
+import ResultCache
+
+
+def frame(rows: int = 100) -> pd.DataFrame:
+    return pd.DataFrame({"Id": range(rows), "Total": [1.5] * rows})
+
+
+def cache_query(cache: ResultCache.ResultCache, sql: str) -> str:
+    key = ResultCache.ResultCache.normalize_sql(sql)
+    cache.put(key, frame(), ResultCache.ResultCache.referenced_tables(key))
+    return key
+
+
+def test_invalidating_a_table_evicts_every_result_that_reads_it():
+    cache = ResultCache.ResultCache()
+    orders = cache_query(cache, "SELECT * FROM [dbo].[Orders]")
+    joined = cache_query(cache, "SELECT c.City, SUM(o.Total) FROM Customers c\n"
+                                "JOIN sales.Orders o ON o.CustomerId = c.Id GROUP BY c.City")
+    customers = cache_query(cache, "select City from customers -- only customers")
+
+    assert cache.invalidate_table("ORDERS") == 2
+    assert cache.get(orders) is None and cache.get(joined) is None
+    assert cache.get(customers) is not None
+    assert cache.stats()["invalidations"] == 2
+    # Nothing left that reads Orders
+    assert cache.invalidate_table("Orders") == 0
+
+
+def test_the_byte_budget_evicts_the_least_recently_used_results():
+    size = int(frame().memory_usage(index=True, deep=True).sum())
+    cache = ResultCache.ResultCache(max_bytes=size * 2 + size // 2)
+    cache.put("first", frame(), ["Orders"])
+    cache.put("second", frame(), ["Orders"])
+    # Reading "first" makes "second" the oldest
+    assert cache.get("first") is not None
+    cache.put("third", frame(), ["Customers"])
+
+    assert cache.get("second") is None
+    assert cache.get("first") is not None and cache.get("third") is not None
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["entries"] == 2 and stats["bytes"] <= cache.max_bytes
+    # The evicted entry no longer counts as depending on its table
+    assert cache.invalidate_table("Orders") == 1
+
+
+def test_results_larger_than_the_budget_are_not_cached():
+    cache = ResultCache.ResultCache(max_bytes=10)
+    cache.put("large", frame(), ["Orders"])
+    assert cache.get("large") is None and cache.stats()["entries"] == 0
@@ -0,0 +1,28 @@
+import SchemaRetriever
+
+
+def make_schema(table_count: int = 20) -> dict:
+    tables = {"Customers": {"columns": {"CustomerId": "int", "CustomerName": "nvarchar"}},
+              "Orders": {"columns": {"OrderId": "int", "CustomerId": "int", "Amount": "decimal"}}}
+    for number in range(table_count - 2):
+        tables[f"Table{number:03d}"] = {"columns": {f"Field{number:03d}": "int"}}
+    relationships = [{"table": "Orders", "column": "CustomerId",
+                      "referenced_table": "Customers", "referenced_column": "CustomerId"}]
+    return {"tables": tables, "relationships": relationships}
+
+
+def test_matching_question_selects_ranked_tables():
+    retriever = SchemaRetriever.SchemaRetriever(make_schema(), top_k=3)
+    schema = retriever.relevant_schema("total amount of orders per customer")
+    assert "Orders" in schema["tables"]
+    assert "Customers" in schema["tables"]
+
+
+def test_question_without_matching_term_falls_back_to_prior_tables():
+    retriever = SchemaRetriever.SchemaRetriever(make_schema(), top_k=3)
+    assert retriever.rank_tables("what were the best sellers last month") == []
+    schema = retriever.relevant_schema("what were the best sellers last month")
+    assert len(schema["tables"]) == 3
+    # The connected tables come first in the prior
+    assert {"Customers", "Orders"} <= set(schema["tables"])
+    assert schema["relationships"]
@@ -0,0 +1,41 @@
+import pytest
+import SqlValidator
+
+SCHEMA = {"tables": {"Customers": {"columns": {"CustomerID": "int", "City": "nvarchar"}},
+                     "Orders": {"columns": {"OrderID": "int", "CustomerID": "int", "Total": "money"}}},
+          "relationships": [{"table": "Orders", "column": "CustomerID",
+                             "referenced_table": "Customers", "referenced_column": "CustomerID"}]}
+
+
+@pytest.fixture
+def validator():
+    return SqlValidator.SqlValidator(SCHEMA)
+
+
+def test_the_generated_sql_runs_as_written(validator):
+    query = ("SELECT TOP 5 c.[City], SUM(o.Total) AS Revenue\n"
+             "FROM Customers c JOIN Orders o ON o.CustomerID = c.CustomerID\n"
+             "GROUP BY c.[City] ORDER BY Revenue DESC")
+    validated = validator.validate(f"```sql\n{query}\n```")
+    assert validated.sql == query
+    assert validated.tables == ["Customers", "Orders"]
+
+
+def test_equivalent_queries_share_a_canonical_form(validator):
+    first = validator.validate("SELECT TOP 5 City FROM Customers")
+    second = validator.validate("select  top 5 city\nfrom customers;")
+    assert first.canonical == second.canonical
+
+
+@pytest.mark.parametrize("query", [
+    "DELETE FROM Orders",
+    "SELECT * FROM Orders; DROP TABLE Orders",
+    "WITH x AS (SELECT * FROM Orders) SELECT * INTO Copy FROM x",
+    "SELECT * FROM Invoices",
+    "SELECT Region FROM Customers",
+    "SELECT OrderID FROM Orders LIMIT 10",
+    "SELECT `OrderID` FROM `Orders`",
+])
+def test_unsafe_or_unknown_sql_is_rejected(validator, query):
+    with pytest.raises(SqlValidator.SqlValidationError):
+        validator.validate(query)
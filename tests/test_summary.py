@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip("pyodbc", exc_type=ImportError)
+
+import DatabaseConnectionManager
+
+QUERY = "SELECT City, Amount FROM [Customers] WHERE Amount > 10"
+
+
+class SummaryCursor:
+    """Answers the statements of DatabaseConnectionManager._summarize and records them"""
+
+    def __init__(self):
+        self.statements = []
+        self.description = None
+        self._rows = []
+
+    def execute(self, sql, *params):
+        self.statements.append(sql)
+        self.description = None
+        self._rows = []
+        if sql.startswith("EXEC sp_describe_first_result_set"):
+            self._rows = [SimpleNamespace(name="City", is_hidden=False, system_type_name="varchar(50)"),
+                          SimpleNamespace(name="Amount", is_hidden=False, system_type_name="decimal(10,2)")]
+        elif sql.startswith("SELECT\n    COUNT_BIG(*) AS [row_count]"):
+            names = ["row_count", "count_0", "approx_distinct_0", "min_0", "max_0",
+                     "count_1", "approx_distinct_1", "min_1", "max_1", "mean_1", "std_1"]
+            self.description = [(name,) for name in names]
+            self._rows = [(3, 3, 2, "Boston", "Denver", 2, 2, 11, 30, 20.5, 13.4)]
+        elif "UNION ALL" in sql or "AS top_0" in sql:
+            self._rows = [(0, "Boston", 2), (0, "Denver", 1)]
+        return self
+
+    def fetchall(self):
+        return self._rows
+
+    def fetchone(self):
+        return self._rows[0]
+
+
+def test_summary_evaluates_the_query_once():
+    manager = DatabaseConnectionManager.DatabaseConnectionManager("fake", connect=lambda _: None)
+    cursor = SummaryCursor()
+    summary = manager._summarize(cursor, QUERY, top_k=5)
+
+    assert summary["row_count"] == 3
+    assert summary["columns"]["City"]["top_values"] == {"Boston": 2, "Denver": 1}
+    assert summary["columns"]["Amount"]["nulls"] == 1
+    evaluations = [sql for sql in cursor.statements if "FROM [Customers]" in sql and "sp_describe" not in sql]
+    assert len(evaluations) == 1 and "INTO #insights_summary" in evaluations[0]
+    assert cursor.statements[-1].endswith("DROP TABLE #insights_summary")
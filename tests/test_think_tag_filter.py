@@ -0,0 +1,48 @@
+import re
+import pytest
+
+pytest.importorskip("pyodbc", exc_type=ImportError)
+pytest.importorskip("langchain_groq", exc_type=ImportError)
+
+import BusinessInsightsGenerator
+
+
+def filtered(chunks):
+    think_filter = BusinessInsightsGenerator.ThinkTagFilter()
+    return "".join(think_filter.feed(chunk) for chunk in chunks) + think_filter.flush()
+
+
+@pytest.mark.parametrize("chunks, expected", [
+    (["<think>plan</think>Sales grew."], "Sales grew."),
+    (["<thi", "nk>plan</think>Sales grew."], "Sales grew."),
+    (["<think>plan</thi", "nk>Sales ", "grew."], "Sales grew."),
+    (["<", "t", "h", "i", "n", "k", ">", "plan", "<", "/", "think", ">", "Sales grew."], "Sales grew."),
+    (["Revenue <think>a</think>rose", " <think>b</think>by 5%"], "Revenue rose by 5%"),
+    # Fragments that turn out not to be a tag are released, not swallowed
+    (["Orders < 5", " and <th", "ree items"], "Orders < 5 and <three items"),
+    (["Totals</think> are fine"], "Totals</think> are fine"),
+    # An unterminated span is dropped
+    (["Sales grew.<think>never clo", "sed"], "Sales grew."),
+    (["Sales grew. <thi"], "Sales grew. <thi"),
+])
+def test_tags_split_across_chunks_are_removed(chunks, expected):
+    assert filtered(chunks) == expected
+
+
+def test_text_is_released_as_soon_as_it_cannot_be_a_tag():
+    think_filter = BusinessInsightsGenerator.ThinkTagFilter()
+    assert think_filter.feed("Sales <t") == "Sales "
+    assert think_filter.feed("op") == "<top"
+    assert think_filter.feed("<think>hidden") == ""
+    assert think_filter.feed("</think>!") == "!"
+
+
+@pytest.mark.parametrize("text", [
+    "<think>step one</think>Revenue rose by 5% in <b>March</b>.",
+    "Before<think>x</think> middle <think>y</think>after",
+])
+def test_every_split_point_matches_the_unstreamed_filter(text):
+    expected = re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL)
+    for first in range(len(text) + 1):
+        for second in range(first, len(text) + 1, 3):
+            assert filtered([text[:first], text[first:second], text[second:]]) == expected
@@ -0,0 +1,87 @@
+import random
+from fuzzywuzzy import fuzz
+import ValueIndex
+
+SCHEMA = {"tables": {"Customers": {"columns": {"City": "varchar", "Name": "nvarchar", "Id": "int"}},
+                     "Products": {"columns": {"Name": "nvarchar"}}},
+          "relationships": []}
+
+
+def fetch(table, column):
+    return [f"{table} {column} {number}" for number in range(200)]
+
+
+def test_values_per_column_are_capped():
+    index = ValueIndex.ValueIndex(fetch, max_values_per_column=50)
+    index.refresh(SCHEMA)
+    assert set(index.columns) == {"Customers.City", "Customers.Name", "Products.Name"}
+    assert all(len(entry["values"]) == 50 for entry in index.columns.values())
+
+
+def budget_for(columns, fetch_values):
+    one_column = ValueIndex.ValueIndex(fetch_values)
+    one_column.index_column("Customers", "City")
+    return one_column.bytes * columns + one_column.bytes // 2
+
+
+def test_indexing_past_the_byte_budget_evicts_the_least_recently_used_column():
+    def fetch_by_name(table, column):
+        # Every column here has a four letter name, so they all take the same size
+        return [f"{column} {number}" for number in range(200)]
+
+    index = ValueIndex.ValueIndex(fetch_by_name, max_bytes=budget_for(2, fetch_by_name))
+    index.index_column("Customers", "City")
+    index.index_column("Customers", "Name")
+    # A lookup that matches City makes Name the least recently used column
+    assert "Customers.City" in index.lookup(["city", "7"])
+    index.index_column("Products", "Name")
+    assert list(index.columns) == ["Customers.City", "Products.Name"]
+    assert list(index.skipped) == ["Customers.Name"]
+    assert index.bytes <= index.max_bytes
+
+
+def test_evicted_columns_are_retried_only_when_stale_or_forced():
+    fetched = []
+
+    def counting_fetch(table, column):
+        fetched.append((table, column))
+        return [f"value {number}" for number in range(200)]
+
+    index = ValueIndex.ValueIndex(counting_fetch, max_bytes=budget_for(1, counting_fetch))
+    fetched.clear()
+    index.refresh(SCHEMA)
+    assert len(index.columns) == 1 and len(index.skipped) == 2
+
+    fetched.clear()
+    index.refresh(SCHEMA)
+    assert fetched == []
+    index.refresh(SCHEMA, tables=["Products"])
+    assert fetched == [("Products", "Name")]
+
+
+def test_lookup_finds_misspelled_values():
+    index = ValueIndex.ValueIndex(lambda table, column: ["New York", "Boston", "Chicago"])
+    index.refresh({"tables": {"Customers": {"columns": {"City": "varchar"}}}, "relationships": []})
+    assert index.lookup(["customers", "in", "Bostn"]) == {"Customers.City": ["Boston"]}
+    assert index.lookup(["customers", "in", "new", "yrok"]) == {"Customers.City": ["New York"]}
+
+
+def test_candidate_filter_never_drops_a_value_fuzz_ratio_accepts():
+    generator = random.Random(7)
+    words = ["boston", "new york", "chicago", "seattle", "item 42", "acme corp", "north"]
+    for _ in range(2000):
+        phrase = generator.choice(words)
+        value = list(generator.choice(words))
+        for _ in range(generator.randint(0, 3)):
+            position = generator.randrange(len(value) + 1)
+            if generator.random() < 0.5 and position < len(value):
+                del value[position]
+            else:
+                value.insert(position, generator.choice("abcdefghijklmnopqrstuvwxyz "))
+        value = "".join(value)
+        if fuzz.ratio(phrase, value) < 80:
+            continue
+        grams = ValueIndex.value_trigrams(phrase)
+        shared = len(grams & ValueIndex.value_trigrams(value))
+        needed = ValueIndex.ValueIndex._needed_by_length(len(phrase), len(grams), 0.795)
+        assert shared >= needed.get(len(value), ValueIndex.UNREACHABLE), (phrase, value)